@@ -1,8 +1,9 @@
 from autostub.plugin import autostub
-from autostub._cache import CachingLevel
+from autostub._cache import CachingLevel, CacheLimits, CacheStats
+from autostub._profile import Profiler, Stage
 
 __version__ = "0.0.1"
 __title__ = "autostub"
 __description__ = "Automatic OpenAPI-based mock generation"
 
-__all__ = ["autostub", "CachingLevel"]
+__all__ = ["autostub", "CachingLevel", "CacheLimits", "CacheStats", "Profiler", "Stage"]
@@ -0,0 +1,100 @@
+import argparse
+import typing as tp
+
+from autostub._cache import CacheLimits, CachingLevel
+from autostub._codec import CODECS
+from autostub._server import serve
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m autostub",
+        description="Automatic web-service stubs based on their OpenAPI-specification",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run a stub HTTP server")
+    serve_parser.add_argument("specs", nargs="+", help="OpenAPI specification files")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument(
+        "--workers", type=int, default=1, help="Number of worker processes"
+    )
+    serve_parser.add_argument(
+        "--caching-level",
+        choices=[level.name.lower() for level in CachingLevel],
+        default=CachingLevel.ADVANCED.name.lower(),
+        help="advanced caches by request specs without component schemas",
+    )
+    serve_parser.add_argument(
+        "--max-entries",
+        type=int,
+        default=None,
+        help="Maximum number of cached objects per model, "
+        "or of cached responses at the basic level",
+    )
+    serve_parser.add_argument(
+        "--ttl", type=float, default=None, help="Seconds to keep cached objects"
+    )
+    serve_parser.add_argument(
+        "--codec",
+        choices=list(CODECS),
+        default=None,
+        help="JSON library for response bodies, the fastest installed one by default",
+    )
+    serve_parser.add_argument(
+        "--spec-cache-dir", default=None, help="Directory to keep parsed specs"
+    )
+    serve_parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Build paths and schemas of specs on first use, specs are not validated",
+    )
+    serve_parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Answer the same requests with the same responses, even without caching",
+    )
+    serve_parser.add_argument(
+        "--shared-cache",
+        default=None,
+        help="SQLite file keeping generated models for all workers, "
+        "a temporary one is used with several workers by default",
+    )
+    serve_parser.add_argument(
+        "--reuse-port",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Give every worker its own SO_REUSEPORT socket, on by default where supported",
+    )
+
+    return parser
+
+
+def main(argv: tp.Sequence[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "serve":
+        limits = None
+        if args.max_entries is not None or args.ttl is not None:
+            limits = CacheLimits(max_entries_per_model=args.max_entries, ttl=args.ttl)
+
+        serve(
+            args.specs,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            caching_level=CachingLevel[args.caching_level.upper()],
+            cache_limits=limits,
+            codec=args.codec,
+            spec_cache_dir=args.spec_cache_dir,
+            shared_cache=args.shared_cache,
+            reuse_port=args.reuse_port,
+            seed=args.seed,
+            lazy=args.lazy,
+        )
+
+
+if __name__ == "__main__":
+    main()
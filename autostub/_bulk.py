@@ -0,0 +1,128 @@
+import random
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Whole arrays of primitives generated in one go.
+# NumPy is used when installed, otherwise values are cut out of rng.getrandbits blocks.
+# rng is a random.Random, or the random module itself
+
+_INT64_MIN = -(2**63)
+_INT64_MAX = 2**63 - 1
+
+# (bits, memoryview format) of unsigned machine words
+_WORDS = ((8, "B"), (16, "H"), (32, "I"), (64, "Q"))
+
+
+def _random_words(bits: int, count: int, rng: Any = random) -> memoryview:
+    for width, fmt in _WORDS:
+        if bits <= width:
+            break
+    else:
+        raise ValueError(f"Can not generate {bits}-bit words")
+
+    raw = rng.getrandbits(width * count).to_bytes(width // 8 * count, "little")
+    return memoryview(raw).cast(fmt)
+
+
+def integers(lower: int, upper: int, count: int, rng: Any = random) -> list[int]:
+    if count <= 0:
+        return []
+
+    if np is not None and _INT64_MIN <= lower <= upper <= _INT64_MAX:
+        return (
+            np.random.default_rng(rng.getrandbits(64))
+            .integers(lower, upper, size=count, dtype=np.int64, endpoint=True)
+            .tolist()
+        )
+
+    span = upper - lower + 1
+    bits = (span - 1).bit_length()
+    if bits > 64:
+        return [rng.randint(lower, upper) for _ in range(count)]
+
+    # Rejection sampling: at least half of the words are accepted
+    mask = (1 << bits) - 1
+    result: list[int] = []
+    while len(result) < count:
+        values = [w & mask for w in _random_words(bits, 2 * (count - len(result)), rng)]
+        result.extend([lower + v for v in values if v < span])
+
+    return result[:count]
+
+
+def numbers(lower: float, upper: float, count: int, rng: Any = random) -> list[float]:
+    if count <= 0:
+        return []
+
+    if np is not None:
+        return (
+            np.random.default_rng(rng.getrandbits(64))
+            .uniform(lower, upper, size=count)
+            .tolist()
+        )
+
+    # 53 random bits per value, the same way random.random() does it
+    scale = (upper - lower) * 2.0**-53
+    return [lower + (w >> 11) * scale for w in _random_words(64, count, rng)]
+
+
+def booleans(count: int, rng: Any = random) -> list[bool]:
+    if count <= 0:
+        return []
+
+    if np is not None:
+        return (
+            np.random.default_rng(rng.getrandbits(64))
+            .integers(0, 2, size=count, dtype=np.bool_)
+            .tolist()
+        )
+
+    return [c == "1" for c in format(rng.getrandbits(count), f"0{count}b")]
+
+
+def _characters(alphabet: str, count: int, rng: Any = random) -> str:
+    if np is not None:
+        letters = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)
+        indices = np.random.default_rng(rng.getrandbits(64)).integers(
+            0, len(letters), size=count
+        )
+        return letters[indices].tobytes().decode("ascii")
+
+    # Random bytes are mapped onto the alphabet, bytes making the mapping uneven are dropped
+    usable = 256 - 256 % len(alphabet)
+    table = bytes(ord(alphabet[b % len(alphabet)]) for b in range(usable)) + bytes(
+        256 - usable
+    )
+    dropped = bytes(range(usable, 256))
+
+    chunks = []
+    left = count
+    while left > 0:
+        chunk = rng.getrandbits(16 * left).to_bytes(2 * left, "little")
+        chunk = chunk.translate(table, dropped)[:left]
+        chunks.append(chunk)
+        left -= len(chunk)
+
+    return b"".join(chunks).decode("ascii")
+
+
+def strings(
+    lower: int, upper: int, alphabet: str, count: int, rng: Any = random
+) -> list[str]:
+    if count <= 0:
+        return []
+
+    lengths = integers(lower, upper, count, rng)
+    chars = _characters(alphabet, sum(lengths), rng)
+
+    result = []
+    pos = 0
+    for length in lengths:
+        result.append(chars[pos : pos + length])
+        pos += length
+
+    return result
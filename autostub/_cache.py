@@ -1,10 +1,16 @@
+import collections
 import enum
+import itertools
+import os
 import random
+import sys
+import time
 import typing as tp
+import dataclasses
 from dataclasses import dataclass, field
 
 from frozendict import frozendict
-from autostub._request import Request
+from autostub._request import GenerationContext, Request
 
 from openapi_parser import specification
 
@@ -15,19 +21,79 @@ class CachingLevel(enum.Enum):
     ADVANCED = enum.auto()
 
 
+@dataclass(frozen=True)
+class CacheLimits:
+    # Entries stored for a single model (CachingLevel.ADVANCED only)
+    max_entries_per_model: int | None = None
+    # Entries stored in the whole cache
+    max_entries: int | None = None
+    # Approximate size of stored values, see _approx_size
+    max_bytes: int | None = None
+    # Seconds an entry lives after it was put
+    ttl: float | None = None
+
+    @property
+    def bounded(self) -> bool:
+        return any(
+            i is not None
+            for i in (
+                self.max_entries_per_model,
+                self.max_entries,
+                self.max_bytes,
+                self.ttl,
+            )
+        )
+
+
 class CacheFactory:
     @staticmethod
     def get_cache(
-        cache_level: CachingLevel, models: dict[str, specification.Schema] | None = None
+        cache_level: CachingLevel,
+        models: tp.Mapping[str, specification.Schema] | None = None,
+        limits: CacheLimits | None = None,
+        shared_path: str | os.PathLike | None = None,
+        namespace: str = "",
     ):
+        """
+        With shared_path the cache is kept in that SQLite file and shared by all
+        processes using it. namespace keeps caches of different specs in one file apart
+        """
+        limits = limits or CacheLimits()
+        if shared_path is not None and cache_level != CachingLevel.NONE:
+            return CacheFactory._get_shared_cache(
+                cache_level, models, limits, shared_path, namespace
+            )
+
         match cache_level:
             case CachingLevel.NONE:
                 return DummyCache()
             case CachingLevel.BASIC:
-                return RequestCache()
+                return RequestCache(
+                    max_entries=limits.max_entries,
+                    max_bytes=limits.max_bytes,
+                    ttl=limits.ttl,
+                )
+            case CachingLevel.ADVANCED:
+                assert models, "Models are required to be set in OAPI spec"
+                return CompositeCache(models, limits)
+
+    @staticmethod
+    def _get_shared_cache(
+        cache_level: CachingLevel,
+        models: tp.Mapping[str, specification.Schema] | None,
+        limits: CacheLimits,
+        shared_path: str | os.PathLike,
+        namespace: str,
+    ):
+        # Imported here, shared caches are built on top of the ones in this module
+        from autostub._shared_cache import SharedCompositeCache, SharedRequestCache
+
+        match cache_level:
+            case CachingLevel.BASIC:
+                return SharedRequestCache(shared_path, limits, namespace)
             case CachingLevel.ADVANCED:
                 assert models, "Models are required to be set in OAPI spec"
-                return CompositeCache(models)
+                return SharedCompositeCache(models, shared_path, limits, namespace)
 
 
 @dataclass
@@ -37,7 +103,7 @@ class CacheKey:
 
 @dataclass
 class RequestCacheKey(CacheKey):
-    key: Request
+    key: Request | GenerationContext
 
 
 @dataclass
@@ -53,9 +119,63 @@ class CompositeCacheKey(ModelCacheKey):
 type AcceptableKeys = CacheKey | RequestCacheKey | ModelCacheKey | CompositeCacheKey
 
 
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    puts: int = 0
+    # Both evicted by limits and expired entries
+    evictions: int = 0
+    # Seconds spent in has/get
+    lookup_time: float = 0.0
+    entries: int = 0
+    entries_by_model: dict[str, int] = field(default_factory=dict)
+
+    def __add__(self, other: "CacheStats") -> "CacheStats":
+        entries_by_model = dict(self.entries_by_model)
+        for name, count in other.entries_by_model.items():
+            entries_by_model[name] = entries_by_model.get(name, 0) + count
+
+        return CacheStats(
+            hits=self.hits + other.hits,
+            misses=self.misses + other.misses,
+            puts=self.puts + other.puts,
+            evictions=self.evictions + other.evictions,
+            lookup_time=self.lookup_time + other.lookup_time,
+            entries=self.entries + other.entries,
+            entries_by_model=entries_by_model,
+        )
+
+
 class BaseCache:
     def __init__(self) -> None:
         self._storage = {}
+        self._stats = CacheStats()
+
+    def encoded(
+        self,
+        value: tp.Any,
+        encode: tp.Callable[[tp.Any], bytes],
+        encoder_key: tp.Hashable = None,
+    ) -> bytes:
+        """
+        Return encode(value). For values stored in this cache the result is kept
+        with the entry, so it is reused while the value is returned from the cache again
+        """
+        res = self._stored_encoded(value, encode, encoder_key)
+        return encode(value) if res is None else res
+
+    def _stored_encoded(
+        self,
+        value: tp.Any,
+        encode: tp.Callable[[tp.Any], bytes],
+        encoder_key: tp.Hashable,
+    ) -> bytes | None:
+        # None if the value is not stored here
+        return None
+
+    def stats(self) -> CacheStats:
+        return dataclasses.replace(self._stats, entries=len(self._storage))
 
     def has(self, key: AcceptableKeys) -> bool:
         raise NotImplementedError
@@ -66,9 +186,27 @@ class BaseCache:
     def get(self, key: AcceptableKeys) -> tp.Any:
         raise NotImplementedError
 
+    def put_first(self, key: AcceptableKeys, value: tp.Any) -> tp.Any:
+        """
+        Put the value after a missed lookup and return what should be used for the key:
+        the value itself, or the one another process stored in a shared cache meanwhile
+        """
+        self.put(key, value)
+        return value
+
     def all(self) -> dict:
         return self._storage
 
+    def delete(self, key: AcceptableKeys, remember: bool = True) -> int:
+        """
+        Remove entries matching the key. With remember the key stays deleted until
+        something is put for it again. Return the number of removed entries
+        """
+        return 0
+
+    def is_deleted(self, key: AcceptableKeys) -> bool:
+        return False
+
     def get_all_by_model(self, key: CompositeCacheKey) -> dict:
         return self.all()
 
@@ -84,26 +222,202 @@ class DummyCache(BaseCache):
         return False
 
     def put(self, key: AcceptableKeys, value: tp.Any) -> None:
-        return
+        self._stats.puts += 1
 
     def get(self, key: AcceptableKeys) -> tp.Any:
+        self._stats.misses += 1
         return None
 
 
+def _approx_size(value: tp.Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_approx_size(i) for i in value)
+    return size
+
+
+@dataclass
+class CacheUsage:
+    # Shared by caches enforcing a common limit (i.e. models of a CompositeCache)
+    track_size: bool = False
+    entries: int = 0
+    bytes: int = 0
+    clock: tp.Iterator[int] = field(default_factory=itertools.count)
+
+
+@dataclass(slots=True)
+class _EntryMeta:
+    used: int
+    expires: float | None
+    size: int
+
+
 class SimpleCache(BaseCache):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+        usage: CacheUsage | None = None,
+    ) -> None:
         super().__init__()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._usage = usage or CacheUsage(track_size=max_bytes is not None)
+        # Unbounded caches skip all bookkeeping below
+        self._bounded = usage is not None or any(
+            i is not None for i in (max_entries, max_bytes, ttl)
+        )
+        # Storage key -> metadata, ordered from least to most recently used
+        self._meta: dict[tp.Hashable, _EntryMeta] = {}
+        self._expiry: collections.deque[tuple[float, tp.Hashable]] = collections.deque()
+        self._bytes = 0
+        # id(value) -> storage key of stored values, ids are not reused while stored
+        self._keys_by_id: dict[int, tp.Hashable] = {}
+        # Storage key -> (encoder key, encoded value), see BaseCache.encoded
+        self._encoded: dict[tp.Hashable, tuple[tp.Hashable, bytes]] = {}
+
+    def _store(self, storage_key: tp.Hashable, value: tp.Any) -> None:
+        if storage_key in self._storage:
+            self._unlink(storage_key)
+        self._storage[storage_key] = value
+        self._keys_by_id[id(value)] = storage_key
+
+        if not self._bounded:
+            return
+
+        self._expire()
+
+        old = self._meta.pop(storage_key, None)
+        if old is not None:
+            self._forget(old)
+
+        size = _approx_size(value) if self._usage.track_size else 0
+        expires = None
+        if self._ttl is not None:
+            expires = time.monotonic() + self._ttl
+            self._expiry.append((expires, storage_key))
+
+        self._meta[storage_key] = _EntryMeta(next(self._usage.clock), expires, size)
+        self._bytes += size
+        self._usage.entries += 1
+        self._usage.bytes += size
+
+        while self._over_limit():
+            self.evict_oldest()
+
+    def _forget(self, meta: _EntryMeta) -> None:
+        self._bytes -= meta.size
+        self._usage.entries -= 1
+        self._usage.bytes -= meta.size
+
+    def _over_limit(self) -> bool:
+        if self._max_entries is not None and len(self._meta) > self._max_entries:
+            return True
+        # The newest entry is kept even if it is bigger than the limit alone
+        return (
+            self._max_bytes is not None
+            and self._bytes > self._max_bytes
+            and len(self._meta) > 1
+        )
+
+    def _touch(self, storage_key: tp.Hashable) -> None:
+        if self._bounded:
+            meta = self._meta.pop(storage_key)
+            meta.used = next(self._usage.clock)
+            self._meta[storage_key] = meta
+
+    def _expire(self) -> None:
+        if self._ttl is None:
+            return
+
+        now = time.monotonic()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, storage_key = self._expiry.popleft()
+            meta = self._meta.get(storage_key)
+            # Entry could have been put again or evicted after this record was made
+            if meta is not None and meta.expires == expires:
+                self._remove(storage_key)
+                self._stats.evictions += 1
+
+    def _unlink(self, storage_key: tp.Hashable) -> None:
+        # Forget what is kept along the stored value
+        value_id = id(self._storage[storage_key])
+        if self._keys_by_id.get(value_id) == storage_key:
+            del self._keys_by_id[value_id]
+        self._encoded.pop(storage_key, None)
+
+    def _remove(self, storage_key: tp.Hashable) -> None:
+        self._unlink(storage_key)
+        del self._storage[storage_key]
+        if self._bounded:
+            self._forget(self._meta.pop(storage_key))
+
+    def _stored_encoded(
+        self,
+        value: tp.Any,
+        encode: tp.Callable[[tp.Any], bytes],
+        encoder_key: tp.Hashable,
+    ) -> bytes | None:
+        storage_key = self._keys_by_id.get(id(value))
+        if storage_key is None:
+            return None
+
+        memo = self._encoded.get(storage_key)
+        if memo is not None and memo[0] == encoder_key:
+            return memo[1]
+
+        res = encode(value)
+        self._encoded[storage_key] = (encoder_key, res)
+        if self._bounded and self._usage.track_size:
+            # Encoded values count towards max_bytes as a part of the entry
+            added = len(res) - (len(memo[1]) if memo is not None else 0)
+            self._meta[storage_key].size += added
+            self._bytes += added
+            self._usage.bytes += added
+            while self._over_limit():
+                self.evict_oldest()
+        return res
+
+    def oldest_use(self) -> int | None:
+        for meta in self._meta.values():
+            return meta.used
+        return None
+
+    def evict_oldest(self) -> None:
+        self._remove(next(iter(self._meta)))
+        self._stats.evictions += 1
+
+    def all(self) -> dict:
+        self._expire()
+        return self._storage
 
     def has(self, key: AcceptableKeys) -> bool:
-        return key.key in self._storage
+        start = time.perf_counter()
+        self._expire()
+        res = key.key in self._storage
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
 
     def put(self, key: AcceptableKeys, value: tp.Any) -> None:
-        self._storage[key.key] = value
+        self._stats.puts += 1
+        self._store(key.key, value)
 
     def get(self, key: AcceptableKeys) -> tp.Any:
-        if self.has(key):
-            return self._storage[key.key]
-        return None
+        start = time.perf_counter()
+        self._expire()
+        res = None
+        if key.key in self._storage:
+            self._stats.hits += 1
+            self._touch(key.key)
+            res = self._storage[key.key]
+        else:
+            self._stats.misses += 1
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
 
 
 class RequestCache(SimpleCache):
@@ -156,52 +470,162 @@ class ModelCache(SimpleCache):
         # 4. Return empty key if nothing above is true
         return frozendict(result)
 
-    def _search_by_part(self, key: frozendict) -> tp.Any | None:
-        if not key:
-            return None
-
-        candidates = []
+    def _find_by_part(self, key: frozendict) -> list[frozendict]:
+        """
+        Return storage keys containing every (field, value) of the key
+        """
+        self._expire()
 
-        for storage_key, value in self._storage.items():
-            if set(key.items()) & set(storage_key.items()) == set(key.items()):
-                candidates.append(value)
+        if not key:
+            return []
+
+        buckets = []
+        for field, value in key.items():
+            bucket = self._index.get(field, {}).get(value)
+            if not bucket:
+                return []
+            buckets.append(bucket)
+
+        buckets.sort(key=len)
+        return [
+            storage_key
+            for storage_key in buckets[0]
+            if all(storage_key in bucket for bucket in buckets[1:])
+        ]
+
+    def _search_by_part(
+        self, key: frozendict, rng: tp.Any = random
+    ) -> frozendict | None:
+        """
+        Return a random storage key containing every (field, value) of the key.
+        rng is the random source of the request, so seeded requests pick the same entry
+        """
+        candidates = self._find_by_part(key)
 
         if not candidates:
             return None
 
-        return random.choice(candidates)
+        return rng.choice(candidates)
 
-    def __init__(self, model_description: specification.Object | None) -> None:
-        super().__init__()
+    def __init__(
+        self,
+        model_description: specification.Object | None,
+        max_entries: int | None = None,
+        ttl: float | None = None,
+        usage: CacheUsage | None = None,
+    ) -> None:
+        super().__init__(max_entries=max_entries, ttl=ttl, usage=usage)
         self._model_description = model_description
         self._required_fields: list[str] = []
         self._all_fields: list[str] = []
+        # field -> value -> storage keys having it, dict is used as an ordered set
+        self._index: dict[str, dict[tp.Hashable, dict[frozendict, None]]] = {}
+        # Resolved keys of deleted objects
+        self._deleted: set[frozendict] = set()
         if model_description:
             self._required_fields = model_description.required
             self._all_fields = [i.name for i in model_description.properties]
 
     def has(self, key: ModelCacheKey):
-        return self._search_by_part(self._resolve_key(key)) is not None
+        start = time.perf_counter()
+        res = bool(self._find_by_part(self._resolve_key(key)))
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
 
     def put(self, key: ModelCacheKey, value: tp.Any):
-        super().put(CacheKey(key=self._resolve_key(key)), value)
+        storage_key = self._resolve_key(key)
+        if self._deleted:
+            self._undelete(storage_key)
+
+        # Indexed first, so that eviction while storing cleans the index up
+        for field, field_value in storage_key.items():
+            self._index.setdefault(field, {}).setdefault(field_value, {})[
+                storage_key
+            ] = None
+
+        super().put(CacheKey(key=storage_key), value)
 
     def get(self, key: ModelCacheKey):
-        return self._search_by_part(self._resolve_key(key))
+        start = time.perf_counter()
+        storage_key = self._search_by_part(self._resolve_key(key), key.key.rng)
+        res = None
+        if storage_key is None:
+            self._stats.misses += 1
+        else:
+            self._stats.hits += 1
+            self._touch(storage_key)
+            res = self._storage[storage_key]
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
+
+    def _remove(self, storage_key: frozendict) -> None:
+        super()._remove(storage_key)
+
+        for field, field_value in storage_key.items():
+            values = self._index[field]
+            del values[field_value][storage_key]
+            if not values[field_value]:
+                del values[field_value]
+
+    def _undelete(self, storage_key: frozendict) -> None:
+        # Objects are deleted by one field (i.e. id) usually, so only such keys are checked
+        self._deleted.discard(storage_key)
+        for field, field_value in storage_key.items():
+            self._deleted.discard(frozendict({field: field_value}))
+
+    def delete(self, key: ModelCacheKey, remember: bool = True) -> int:
+        resolved = self._resolve_key(key)
+        if not resolved:
+            return 0
+
+        removed = self._find_by_part(resolved)
+        for storage_key in removed:
+            self._remove(storage_key)
+        if remember:
+            self._deleted.add(resolved)
+        return len(removed)
+
+    def is_deleted(self, key: ModelCacheKey) -> bool:
+        if not self._deleted:
+            return False
+        return self._resolve_key(key) in self._deleted
 
 
 class CompositeCache(BaseCache):
-    def __init__(self, models: dict[str, specification.Schema]) -> None:
+    def __init__(
+        self,
+        models: tp.Mapping[str, specification.Schema],
+        limits: CacheLimits | None = None,
+    ) -> None:
+        super().__init__()
         self._storage: dict[str, ModelCache] = dict()
-        self._models: dict[str, specification.Schema] = models
+        self._models: tp.Mapping[str, specification.Schema] = models
+        self._limits = limits or CacheLimits()
+        # Counts entries of all models when a limit is set
+        self._usage = None
+        if self._limits.bounded:
+            self._usage = CacheUsage(track_size=self._limits.max_bytes is not None)
+        # id(schema) -> model name, for mappings not naming their schemas.
+        # Specs loaded by SpecCache name every schema copied from a component
+        # (see _named_spec.NamedSchemas and _lazy_spec.LazySchemas)
+        self._model_names: dict[int, str] | None = None
+        if not hasattr(models, "name_of"):
+            self._model_names = {id(spec): m_name for m_name, spec in models.items()}
 
     def _resolve_model_name(self, model: specification.Schema | None) -> str:
-        if not model:
+        if model is None:
             return ""
-        for m_name, spec in self._models.items():
-            if spec == model:
-                return m_name
-        return ""
+        if self._model_names is None:
+            return self._models.name_of(model)
+        return self._model_names.get(id(model), "")
+
+    def _new_model_cache(self, model_name: str) -> ModelCache:
+        return ModelCache(
+            self._models[model_name],
+            max_entries=self._limits.max_entries_per_model,
+            ttl=self._limits.ttl,
+            usage=self._usage,
+        )
 
     def has(self, key: CompositeCacheKey) -> bool:
         model_name = self._resolve_model_name(key.model)
@@ -213,21 +637,101 @@ class CompositeCache(BaseCache):
         return model in self._storage
 
     def put(self, key: CompositeCacheKey, value: tp.Any) -> None:
+        self._put(key, value, first=False)
+
+    def put_first(self, key: CompositeCacheKey, value: tp.Any) -> tp.Any:
+        return self._put(key, value, first=True)
+
+    def _put(self, key: CompositeCacheKey, value: tp.Any, first: bool) -> tp.Any:
         model_name = self._resolve_model_name(key.model)
         if not model_name:
-            return
+            return value
 
         if not self.has_model(model_name):
-            self._storage[model_name] = ModelCache(self._models[model_name])
+            self._storage[model_name] = self._new_model_cache(model_name)
+
+        model_cache = self._storage[model_name]
+        if first:
+            res = model_cache.put_first(key, value)
+        else:
+            model_cache.put(key, value)
+            res = value
+
+        while self._over_limit():
+            self._evict_oldest()
+
+        return res
+
+    def _over_limit(self) -> bool:
+        if self._usage is None:
+            return False
+        if self._limits.max_entries is not None:
+            if self._usage.entries > self._limits.max_entries:
+                return True
+        if self._limits.max_bytes is not None:
+            return (
+                self._usage.bytes > self._limits.max_bytes and self._usage.entries > 1
+            )
+        return False
+
+    def _stored_encoded(
+        self,
+        value: tp.Any,
+        encode: tp.Callable[[tp.Any], bytes],
+        encoder_key: tp.Hashable,
+    ) -> bytes | None:
+        for model_cache in self._storage.values():
+            res = model_cache._stored_encoded(value, encode, encoder_key)
+            if res is not None:
+                # Sizes of encoded values are counted by the model caches
+                while self._over_limit():
+                    self._evict_oldest()
+                return res
+        return None
 
-        self._storage[model_name].put(key, value)
+    def _evict_oldest(self) -> None:
+        # Least recently used entry across all models
+        oldest = None
+        oldest_use = None
+        for model_cache in self._storage.values():
+            use = model_cache.oldest_use()
+            if use is not None and (oldest_use is None or use < oldest_use):
+                oldest, oldest_use = model_cache, use
+        oldest.evict_oldest()
 
     def get(self, key: CompositeCacheKey) -> tp.Any:
-        if self.has(key):
-            model_name = self._resolve_model_name(key.model)
+        model_name = self._resolve_model_name(key.model)
+        if self.has_model(model_name):
             return self._storage[model_name].get(key)
+        self._stats.misses += 1
         return None
 
+    def delete(self, key: CompositeCacheKey, remember: bool = True) -> int:
+        model_name = self._resolve_model_name(key.model)
+        if not model_name:
+            return 0
+
+        # Objects which were never generated can be deleted too
+        if not self.has_model(model_name):
+            self._storage[model_name] = self._new_model_cache(model_name)
+
+        return self._storage[model_name].delete(key, remember)
+
+    def is_deleted(self, key: CompositeCacheKey) -> bool:
+        model_name = self._resolve_model_name(key.model)
+        if self.has_model(model_name):
+            return self._storage[model_name].is_deleted(key)
+        return False
+
+    def stats(self) -> CacheStats:
+        # Own counters only hold misses of models not stored yet
+        res = dataclasses.replace(self._stats)
+        for model_name, model_cache in self._storage.items():
+            model_stats = model_cache.stats()
+            model_stats.entries_by_model = {model_name: model_stats.entries}
+            res += model_stats
+        return res
+
     def get_all_by_model(self, key: CompositeCacheKey) -> dict:
         model_name = self._resolve_model_name(key.model)
         if self.has_model(model_name):
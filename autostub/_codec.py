@@ -0,0 +1,75 @@
+import json
+import typing as tp
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonCodec:
+    name = "json"
+
+    def dumps(self, value: tp.Any) -> bytes:
+        return json.dumps(value).encode("utf-8")
+
+    def loads(self, data: str | bytes) -> tp.Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def dumps(self, value: tp.Any) -> bytes:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # i.e integers wider than 64 bits
+            return super().dumps(value)
+
+    def loads(self, data: str | bytes) -> tp.Any:
+        return orjson.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def dumps(self, value: tp.Any) -> bytes:
+        return ujson.dumps(value).encode("utf-8")
+
+    def loads(self, data: str | bytes) -> tp.Any:
+        return ujson.loads(data)
+
+
+# Preferred first, stdlib json is always available
+CODECS: dict[str, tuple[type[JsonCodec], tp.Any]] = {
+    "orjson": (OrjsonCodec, orjson),
+    "ujson": (UjsonCodec, ujson),
+    "json": (JsonCodec, json),
+}
+
+
+def get_codec(name: str | None = None) -> JsonCodec:
+    """
+    Return codec by name, or the fastest installed one if name is not set
+    """
+    if name is None:
+        for codec, module in CODECS.values():
+            if module is not None:
+                return codec()
+
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec {name}, expected one of {list(CODECS)}")
+
+    codec, module = CODECS[name]
+    if module is None:
+        raise ImportError(f"JSON codec {name} is not installed")
+    return codec()
+
+
+DEFAULT_CODEC = get_codec()
@@ -0,0 +1,72 @@
+import collections
+import typing as tp
+
+# A stubbed call is tried only against specs having a server on the host of its url
+
+
+def _host_key(url: str) -> str | None:
+    scheme, sep, rest = url.partition("://")
+    if not sep:
+        return None
+    host = rest.partition("/")[0].partition("?")[0]
+    return f"{scheme}://{host}".lower()
+
+
+class ServerMap(collections.UserDict):
+    """
+    Stubbed specs by name, indexed by scheme and host of their server urls.
+    The index is rebuilt on the first lookup after specs are stubbed or unstubbed
+    """
+
+    def __init__(self, *args: tp.Any, **kwargs: tp.Any) -> None:
+        self._index: dict[str, list[tp.Any]] | None = None
+        self._fallback: list[tp.Any] = []
+        super().__init__(*args, **kwargs)
+
+    def __setitem__(self, key: str, value: tp.Any) -> None:
+        self._index = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self._index = None
+        super().__delitem__(key)
+
+    def _build_index(self) -> dict[str, list[tp.Any]]:
+        by_host: dict[str, list[tuple[int, tp.Any]]] = {}
+        # Relative or templated server urls can not be indexed, such specs are always tried
+        fallback: list[tuple[int, tp.Any]] = []
+
+        for position, server in enumerate(self.data.values()):
+            keys = {_host_key(url) for url in server.servers}
+            if None in keys:
+                fallback.append((position, server))
+                continue
+            for key in keys:
+                by_host.setdefault(key, []).append((position, server))
+
+        # Specs are tried in the order they were stubbed, as without the index
+        self._fallback = [server for _, server in fallback]
+        self._index = {
+            key: [
+                server
+                for _, server in sorted(entries + fallback, key=lambda item: item[0])
+            ]
+            for key, entries in by_host.items()
+        }
+        return self._index
+
+    def candidates(self, url: str) -> list[tp.Any]:
+        """
+        Specs which may answer the url, in the order they were stubbed
+        """
+        index = self._index
+        if index is None:
+            index = self._build_index()
+        return index.get(_host_key(url) or "", self._fallback)
+
+
+def candidates(servers: tp.Mapping[str, tp.Any], url: str) -> list[tp.Any]:
+    # Plain mappings are not indexed, all their specs are tried in turn
+    if isinstance(servers, ServerMap):
+        return servers.candidates(url)
+    return list(servers.values())
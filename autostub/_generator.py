@@ -1,23 +1,44 @@
 from typing import Any, Optional
+import asyncio
+import collections.abc
+import copy
+import hashlib
+import json
 import random
+import threading
 import urllib.parse
 
 import http
 import openapi_parser.specification as specification
 import frozendict
 
-from autostub._cache import BaseCache, NO_CACHE
-from autostub._schemas import SCHEMA_MAP
+from autostub._cache import BaseCache, CompositeCacheKey, NO_CACHE
+from autostub._schemas import INVALID, SCHEMA_MAP, Object
 from autostub._response import JsonHTTPResponse, _BaseHTTPResponse
-from autostub._request import Request
+from autostub._request import GenerationContext, Request
+from autostub._router import PathRouter
+from autostub._codec import DEFAULT_CODEC, JsonCodec
+from autostub._profile import (
+    ProfiledCache,
+    Profiler,
+    Stage,
+    is_profiled,
+    profiled_call,
+    set_operation,
+    stage,
+)
+from autostub._validator import compile_body, compile_parameters
+
+_EMPTY = frozendict.frozendict()
 
 
 class _BaseEntity:
-    def __init__(self, spec: Any, cache: BaseCache) -> None:
+    def __init__(self, spec: Any) -> None:
         self._spec = spec
-        self._cache = cache
 
-    def __call__(self, request: Request) -> Optional[_BaseHTTPResponse]:
+    def __call__(
+        self, request: Request, cache: BaseCache
+    ) -> Optional[_BaseHTTPResponse]:
         raise NotImplementedError
 
     def _validate_call(self, request: Request) -> bool:
@@ -27,36 +48,85 @@ class _BaseEntity:
 class OAPISpec(_BaseEntity):
     # Check if suitable server exists in spec.
     # Route to path if any is available
-    def __init__(self, spec: specification.Specification, cache: BaseCache) -> None:
-        super().__init__(spec, cache)
+    def __init__(
+        self,
+        spec: specification.Specification,
+        cache: BaseCache,
+        codec: JsonCodec | None = None,
+        seed: int | None = None,
+    ) -> None:
+        super().__init__(spec)
         self._cache = cache
-        self._paths = {i.url: Path(i, cache) for i in spec.paths}
+        self._codec = codec or DEFAULT_CODEC
+        # Same requests get the same responses if set
+        self._seed = seed
+        self._paths = {i.url: Path(i) for i in spec.paths}
+        self._router = PathRouter(self._paths)
 
         self._servers = [i.url for i in spec.servers]
         self._models = spec.schemas
+        # Serializes generation between threads, caches are not thread-safe
+        self._lock = threading.Lock()
+        self._profiler: Profiler | None = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        # Statistics of a session are not kept with the spec
+        state["_profiler"] = None
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self) -> BaseCache:
+        return self._cache
+
+    @property
+    def servers(self) -> list[str]:
+        return self._servers
+
+    @property
+    def profiler(self) -> Profiler | None:
+        """
+        Profiler recording stages of calls, None if they are not profiled
+        """
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler: Profiler | None) -> None:
+        self._profiler = profiler
+
+    def with_cache(
+        self,
+        cache: BaseCache,
+        codec: JsonCodec | None = None,
+        seed: int | None = None,
+    ) -> "OAPISpec":
+        """
+        Return a copy of the spec sharing the entity tree, but using another cache, codec and seed
+        """
+        result = copy.copy(self)
+        result._cache = cache
+        result._codec = codec or DEFAULT_CODEC
+        result._seed = seed
+        return result
 
-    def _compare_and_parse_paths(
-        self, p_requested: str, p_internal: str
-    ) -> Optional[frozendict.frozendict[str, str]]:
-        split_requested_path = p_requested.split("/")
-        split_internal_path = p_internal.split("/")
-
-        result = {}
-
-        if len(split_internal_path) != len(split_requested_path):
-            return None
-
-        for i in range(len(split_requested_path)):
-            if split_requested_path[i] != split_internal_path[i]:
-                if split_internal_path[i].startswith("{") and split_internal_path[
-                    i
-                ].endswith("}"):
-                    param_name = split_internal_path[i][1:-1]
-                    result[param_name] = split_requested_path[i]
-                    continue
-
-                return None
-        return frozendict.frozendict(result)
+    def _request_rng(self, request: Request) -> random.Random:
+        # Random stream derived from the seed and the normalized request.
+        # Headers are left out, clients add their own ones
+        url, _, query = request.url.partition("?")
+        params = dict(urllib.parse.parse_qsl(query))
+        params.update(request.parameters or {})
+        material = json.dumps(
+            [self._seed, request.method, url, sorted(params.items()), request.data],
+            sort_keys=True,
+            default=repr,
+        )
+        digest = hashlib.sha256(material.encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:16], "little"))
 
     def _get_path_candidates(self, url: str) -> list[str]:
         res = []
@@ -65,72 +135,185 @@ class OAPISpec(_BaseEntity):
                 res.append(url[len(serv_url) :])
         return res
 
-    def _get_valid_paths(self, url: str) -> list[str]:
-        candidates = self._get_path_candidates(url)
+    def _get_valid_paths(
+        self, url: str
+    ) -> list[tuple[str, frozendict.frozendict[str, str]]]:
         result = []
 
-        for path in candidates:
+        for path in self._get_path_candidates(url):
             path = urllib.parse.urlparse(path).path
-
-            for internal_path in self._paths:
-                if self._compare_and_parse_paths(path, internal_path) is not None:
-                    result.append((path, internal_path))
+            result.extend(self._router.match(path))
 
         return result
 
     def _validate_call(self, request: Request) -> bool:
-        if not any([request.url.startswith(i) for i in self._servers]):
-            return False
-
-        if not self._get_valid_paths(request.url):
-            return False
-
-        return True
+        return bool(self._get_valid_paths(request.url))
 
     def __call__(self, request: Request) -> _BaseHTTPResponse | None:
-        if not self._validate_call(request):
-            return None
+        with profiled_call(self._profiler), self._lock:
+            return self._call(request)
+
+    def _call(self, request: Request) -> _BaseHTTPResponse | None:
+        if self._seed is not None:
+            request.rng = self._request_rng(request)
 
+        cache = ProfiledCache(self._cache) if is_profiled() else self._cache
         responses = []
 
-        for path, ipath in self._get_valid_paths(request.url):
-            # TODO use candidates function
-            request.path_params = self._compare_and_parse_paths(path, ipath)
-            response = self._paths[ipath](request)
+        with stage(Stage.ROUTING):
+            paths = self._get_valid_paths(request.url)
+
+        for ipath, path_params in paths:
+            request.path_params = path_params
+            with stage(Stage.GENERATION):
+                response = self._paths[ipath](request, cache)
             if response is not None:
+                set_operation(f"{request.method.upper()} {ipath}")
                 responses.append(response)
 
         if responses:
-            return random.choice(responses)
+            response = request.rng.choice(responses)
+            # Cached content is encoded only once
+            with stage(Stage.SERIALIZATION):
+                response.encode(self._cache, self._codec)
+            return response
         else:
             # Send default 404 answer
             return None
 
+    async def acall(self, request: Request) -> _BaseHTTPResponse | None:
+        """
+        Awaitable version of __call__. Generation runs in a worker thread,
+        so large payloads do not stall the event loop
+        """
+        # Unknown urls are answered without a thread hop
+        if not self._validate_call(request):
+            return None
+
+        return await asyncio.to_thread(self, request)
+
+    def prefill(self, count: int, stop: threading.Event | None = None) -> int:
+        """
+        Generate count objects of every model into the cache ahead of requests,
+        until stop is set. Return the number of generated objects
+        """
+        if not self._cache.has_by_model():
+            # Only model caches can serve objects made without a request
+            return 0
+
+        generators = [
+            (name, SCHEMA_MAP[type(schema)](schema).generate)
+            for name, schema in self._models.items()
+            if isinstance(schema, specification.Object)
+        ]
+
+        done = 0
+        # Models are filled in turns, so all of them get some objects early
+        for i in range(count):
+            for name, generate in generators:
+                if stop is not None and stop.is_set():
+                    return done
+
+                request = Request(
+                    url=f"autostub:prefill/{name}/{i}",
+                    method="get",
+                    data=_EMPTY,
+                    parameters=_EMPTY,
+                    headers=_EMPTY,
+                )
+                if self._seed is not None:
+                    request.rng = self._request_rng(request)
+                # Taken per object, so requests are not kept waiting for the whole batch
+                with self._lock:
+                    generate(request, self._cache, read_from_cache=False)
+                done += 1
+
+        return done
+
+
+def _json_object(
+    contents: list[specification.Content] | None,
+) -> specification.Object | None:
+    for content in contents or []:
+        if content.type == specification.ContentType.JSON and isinstance(
+            content.schema, specification.Object
+        ):
+            return content.schema
+    return None
+
+
+def _operation_model(spec: specification.Operation) -> specification.Object | None:
+    # Model an operation returns or writes. Successful responses go first,
+    # bodies of creation can be a model without the server-assigned fields
+    for resp in spec.responses:
+        if resp.code is not None and 200 <= resp.code < 300:
+            model = _json_object(resp.content)
+            if model is not None:
+                return model
+
+    if spec.request_body is not None:
+        return _json_object(spec.request_body.content)
+    return None
+
 
 class Path(_BaseEntity):
     # Check if specific method of this path exists.
-    def __init__(self, spec: specification.Path, cache: BaseCache) -> None:
-        super().__init__(spec, cache)
+    def __init__(self, spec: specification.Path) -> None:
+        super().__init__(spec)
+
+        # Read on the first request routed to the path, specs loaded lazily build it then
+        self._operation_specs: dict[str, specification.Operation] | None = None
+        # Built on the first request routed to them, most operations of a large spec are never called
+        self._ops: dict[str, Operation] = {}
+
+    @property
+    def _operations(self) -> dict[str, specification.Operation]:
+        if self._operation_specs is None:
+            self._operation_specs = {
+                item.method.value: item
+                for item in self._spec.operations
+                if item.method.value in OPERATION_MAP
+            }
+        return self._operation_specs
+
+    def _find_model(self, method: str) -> specification.Object | None:
+        # Objects of /pets/{id} are described by any of its operations, DELETE usually has none
+        operations = [self._operations[method]] + [
+            item for name, item in self._operations.items() if name != method
+        ]
+        for item in operations:
+            model = _operation_model(item)
+            if model is not None:
+                return model
+        return None
 
-        self._ops = {}
-        for item in spec.operations:
-            if item.method == specification.OperationMethod.GET:
-                self._ops["get"] = Get(item, cache)
+    def _get_op(self, method: str) -> "Operation":
+        op = self._ops.get(method)
+        if op is None:
+            op = self._ops[method] = OPERATION_MAP[method](
+                self._operations[method], self._find_model(method)
+            )
+        return op
 
     def _validate_call(self, request: Request) -> bool:
-        return request.method in self._ops
+        return request.method in self._operations
 
-    def __call__(self, request: Request) -> _BaseHTTPResponse | None:
+    def __call__(self, request: Request, cache: BaseCache) -> _BaseHTTPResponse | None:
         if self._validate_call(request):
-            return self._ops[request.method](request)
+            return self._get_op(request.method)(request, cache)
 
         return None
 
 
-class Get(_BaseEntity):
-    # Check parameters in query (i.e ?param1=foo&param2=bar)
-    def __init__(self, spec: specification.Operation, cache: BaseCache) -> None:
-        super().__init__(spec, cache)
+class Operation(_BaseEntity):
+    # Parameters and responses common for all methods
+    def __init__(
+        self,
+        spec: specification.Operation,
+        model: specification.Object | None = None,
+    ) -> None:
+        super().__init__(spec)
+        self._model = model
         self._responses = []
         self._default_response = None
         self._parameters = {}
@@ -147,12 +330,7 @@ class Get(_BaseEntity):
                     self._required.add(param.name)
 
         for resp in spec.responses:
-            if not (isinstance(resp.content, list) and len(resp.content) == 1):
-                continue
-
-            obj = None
-            if resp.content[0].type == specification.ContentType.JSON:
-                obj = JSONResponse(resp, cache)
+            obj = self._make_response(resp)
 
             if obj is None:
                 continue
@@ -162,76 +340,330 @@ class Get(_BaseEntity):
             else:
                 self._responses.append(obj)
 
-    def _get_query_params(self, request: Request) -> frozendict.frozendict[str, str]:
-        parsed_url = urllib.parse.urlparse(request.url)
+        self._compile()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Compiled validators are not picklable, they are rebuilt on unpickling
+        state = self.__dict__.copy()
+        for name in self._COMPILED:
+            del state[name]
+        return state
 
-        query_params = dict(urllib.parse.parse_qsl(parsed_url.query))
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._compile()
+
+    _COMPILED: tuple[str, ...] = ("_validate_parameters",)
+
+    def _compile(self) -> None:
+        self._validate_parameters = compile_parameters(self._parameters, self._required)
+
+    def _make_response(self, resp: specification.Response) -> "_BaseEntity | None":
+        if not (isinstance(resp.content, list) and len(resp.content) == 1):
+            return None
+
+        if resp.content[0].type == specification.ContentType.JSON:
+            return JSONResponse(resp)
+
+        return None
+
+    def _get_query_params(self, request: Request) -> dict[str, Any]:
+        query = request.url.partition("?")[2].partition("#")[0]
+
+        query_params = dict(urllib.parse.parse_qsl(query)) if query else {}
 
         query_params.update(request.path_params or {})
         query_params.update(request.parameters or {})
 
-        return frozendict.frozendict(query_params)
+        return query_params
 
-    def _transform_parameters(
-        self, q_params: frozendict.frozendict[str, str]
-    ) -> frozendict.frozendict[str, Any]:
-        result = {}
-        for name, val in q_params.items():
-            if name in self._parameters:
-                result[name] = self._parameters[name].from_val(val)
-            else:
-                result[name] = val
-        return frozendict.frozendict(result)
+    def _parse_call(self, request: Request) -> frozendict.frozendict[str, Any] | None:
+        """
+        Typed query and path parameters, None if they do not match the operation
+        """
+        with stage(Stage.VALIDATION):
+            return self._validate_parameters(self._get_query_params(request))
 
     def _validate_call(self, request: Request) -> bool:
-        query_params = self._get_query_params(request)
+        return self._parse_call(request) is not None
 
-        if self._required & set(query_params.keys()) != self._required:
-            return False
 
-        for name, val in query_params.items():
-            if name in self._parameters:
-                if not self._parameters[name].is_valid(val):
-                    return False
+class Get(Operation):
+    # Check parameters in query (i.e ?param1=foo&param2=bar)
+    def __call__(self, request: Request, cache: BaseCache) -> _BaseHTTPResponse | None:
+        # TODO send a default response if whatever goes wrong, and a random other if anything is ok
+        query_params = self._parse_call(request)
+        if query_params is None:
+            if not self._default_response:
+                return None
+            return self._default_response(request, cache)
+
+        response = request.rng.choice(self._responses)
+        request.query_params = query_params
+        if response.is_deleted(request, cache):
+            return _BaseHTTPResponse()
+        return response(request, cache)
+
+
+# Answer of write operations on deleted objects
+_NOT_FOUND = object()
+
+
+class _WriteOperation(Operation):
+    # Keeps written objects in the model cache, so that later calls return them.
+    # Objects are identified by path parameters named as model properties (i.e /pets/{id}),
+    # or by the primary key of the model in the body
+    complete_body = True
+
+    def __init__(
+        self,
+        spec: specification.Operation,
+        model: specification.Object | None = None,
+    ) -> None:
+        self._body_entity = None
+        # Fields the body is required to have, they are not checked for partial updates
+        self._body_required: set[str] = set()
+        if spec.request_body is not None:
+            body_schema = _json_object(spec.request_body.content)
+            if body_schema is not None:
+                self._body_entity = SCHEMA_MAP[type(body_schema)](body_schema)
+                if self.complete_body:
+                    self._body_required = set(body_schema.required)
+
+        super().__init__(spec, model)
+        self._entity = None
+        self._primary_key = None
+        if model is not None:
+            self._entity = SCHEMA_MAP[type(model)](model)
+            names = [i.name for i in model.properties]
+            if "id" in names:
+                self._primary_key = "id"
+            elif model.required:
+                self._primary_key = model.required[0]
+
+        successful = [i for i in self._responses if 200 <= i.status_code < 300]
+        self._success = min(successful, key=lambda i: i.status_code, default=None)
+        self._returns_model = self._success is not None and self._success.returns(model)
+
+    _COMPILED = Operation._COMPILED + ("_validate_body",)
+
+    def _compile(self) -> None:
+        super()._compile()
+        self._validate_body = compile_body(self._body_entity, self._body_required)
+
+    def _make_response(self, resp: specification.Response) -> _BaseEntity | None:
+        res = super()._make_response(resp)
+        if res is None and not resp.content:
+            res = EmptyResponse(resp)
+        return res
 
-        return True
+    @staticmethod
+    def _body(request: Request) -> collections.abc.Mapping[str, Any]:
+        if isinstance(request.data, collections.abc.Mapping):
+            return request.data
+        return _EMPTY
+
+    def _key_params(self, request: Request) -> frozendict.frozendict[str, Any]:
+        params = {
+            name: value
+            for name, value in request.path_params.items()
+            if name in self._entity.properties
+        }
+        return self._entity.cache_key(
+            GenerationContext.of(request).with_query_params(
+                frozendict.frozendict(params)
+            )
+        ).key.query_params
+
+    def _key(self, request: Request, params: Any) -> CompositeCacheKey:
+        return CompositeCacheKey(
+            key=GenerationContext.of(request).with_query_params(params),
+            model=self._model,
+        )
 
-    def __call__(self, request: Request) -> _BaseHTTPResponse | None:
-        # TODO send a default response if whatever goes wrong, and a random other if anything is ok
-        response = None
-        if self._validate_call(request):
-            response = random.choice(self._responses)
-        else:
+    def _complete(
+        self, request: Request, params: frozendict.frozendict[str, Any]
+    ) -> dict[str, Any]:
+        # Required fields missing in the body (i.e id assigned by the server) are generated
+        body = self._body(request)
+        generated = self._entity.generate(
+            GenerationContext.of(request).with_query_params(params), NO_CACHE
+        )
+        res = {
+            name: generated[name]
+            for name in self._entity.required
+            if name not in body and name in generated
+        }
+        res.update(body)
+        res.update(params)
+        return res
+
+    def _store(
+        self, request: Request, cache: BaseCache, value: dict[str, Any]
+    ) -> dict[str, Any]:
+        # Previous versions of the object are replaced
+        if self._primary_key in value:
+            params = frozendict.frozendict(
+                {self._primary_key: value[self._primary_key]}
+            )
+            cache.delete(self._key(request, params), remember=False)
+
+        key = self._key(request, frozendict.frozendict())
+        key.put_fields = frozendict.frozendict(value)
+        return cache.put_first(key, value)
+
+    def _apply(self, request: Request, cache: BaseCache) -> Any:
+        raise NotImplementedError
+
+    def __call__(self, request: Request, cache: BaseCache) -> _BaseHTTPResponse | None:
+        query_params = self._parse_call(request)
+        body = INVALID
+        if query_params is not None:
+            with stage(Stage.VALIDATION):
+                body = self._validate_body(request.data, request.path_params)
+        if body is INVALID:
             if not self._default_response:
                 return None
-            return self._default_response(request)
+            return self._default_response(request, cache)
+
+        request.query_params = query_params
+        request.data = body
+        if self._success is None:
+            if not self._responses:
+                return None
+            return request.rng.choice(self._responses)(request, cache)
+
+        if self._entity is None or not cache.has_by_model():
+            # Nothing to keep objects in, the call is only answered
+            return self._success(request, cache)
 
-        request.query_params = self._transform_parameters(
-            self._get_query_params(request)
+        value = self._apply(request, cache)
+        if value is _NOT_FOUND:
+            return _BaseHTTPResponse()
+        if value is not None and self._returns_model:
+            return self._success(request, cache, content=value)
+        return self._success(request, cache)
+
+
+class Post(_WriteOperation):
+    def _apply(self, request: Request, cache: BaseCache) -> Any:
+        return self._store(
+            request, cache, self._complete(request, self._key_params(request))
         )
-        return response(request)
 
 
-class JSONResponse(_BaseEntity):
-    def __init__(self, spec: specification.Response, cache: BaseCache) -> None:
-        super().__init__(spec, cache)
+class Put(Post):
+    # Replaces the whole object, the same way as it is created
+    pass
 
-    def __call__(self, request: Request) -> JsonHTTPResponse:
-        res = JsonHTTPResponse()
-        res.status_code = self._spec.code or http.HTTPStatus.NOT_FOUND.value
+
+class Patch(_WriteOperation):
+    complete_body = False
+
+    def _apply(self, request: Request, cache: BaseCache) -> Any:
+        params = self._key_params(request)
+        if not params:
+            return None
+
+        key = self._key(request, params)
+        if cache.is_deleted(key):
+            return _NOT_FOUND
+
+        # Objects never requested before exist as well, they are generated first
+        existing = self._entity.generate(key.key, cache)
+        value = {**existing, **self._body(request), **params}
+        return self._store(request, cache, value)
+
+
+class Delete(_WriteOperation):
+    complete_body = False
+
+    def _apply(self, request: Request, cache: BaseCache) -> Any:
+        params = self._key_params(request)
+        if not params:
+            return None
+
+        key = self._key(request, params)
+        if cache.is_deleted(key):
+            return _NOT_FOUND
+
+        existing = cache.get(key)
+        cache.delete(key)
+        return existing
+
+
+class JSONResponse(_BaseEntity):
+    def __init__(self, spec: specification.Response) -> None:
+        super().__init__(spec)
 
         cont: specification.Content = self._spec.content[0]
 
         assert cont.type == specification.ContentType.JSON
 
-        data = SCHEMA_MAP[type(cont.schema)](cont.schema)(request, self._cache)
+        self._status_code = self._spec.code or http.HTTPStatus.NOT_FOUND.value
+        self._data = SCHEMA_MAP[type(cont.schema)](cont.schema)
+        self._headers = [
+            (
+                header.name,
+                header.required,
+                SCHEMA_MAP[type(header.schema)](header.schema, header.name),
+            )
+            for header in self._spec.headers
+        ]
+
+    @property
+    def status_code(self) -> int:
+        return self._status_code
+
+    def returns(self, model: specification.Schema | None) -> bool:
+        return model is not None and self._data._spec == model
+
+    def is_deleted(self, request: Request, cache: BaseCache) -> bool:
+        # Objects removed by write operations are not generated again
+        if not isinstance(self._data, Object) or not cache.has_by_model():
+            return False
+        return cache.is_deleted(self._data.cache_key(request))
+
+    def __call__(
+        self, request: Request, cache: BaseCache, content: Any = None
+    ) -> JsonHTTPResponse:
+        res = JsonHTTPResponse()
+        res.status_code = self._status_code
 
-        res.content = data
+        if content is None:
+            content = self._data.generate(request, cache)
+        res.content = content
 
-        for header in self._spec.headers:
-            if random.choice([True, header.required]):
-                res.headers[header.name] = SCHEMA_MAP[type(header.schema)](
-                    header.schema, header.name
-                )(request, NO_CACHE)
+        for name, required, header in self._headers:
+            if request.rng.choice([True, required]):
+                res.headers[name] = header.generate(request, NO_CACHE)
 
         return res
+
+
+class EmptyResponse(_BaseEntity):
+    # Response without content, i.e. 204 of a deletion
+    def __init__(self, spec: specification.Response) -> None:
+        super().__init__(spec)
+        self._status_code = self._spec.code or http.HTTPStatus.NOT_FOUND.value
+
+    @property
+    def status_code(self) -> int:
+        return self._status_code
+
+    def returns(self, model: specification.Schema | None) -> bool:
+        return False
+
+    def __call__(
+        self, request: Request, cache: BaseCache, content: Any = None
+    ) -> _BaseHTTPResponse:
+        return _BaseHTTPResponse(status_code=self._status_code)
+
+
+OPERATION_MAP = {
+    "get": Get,
+    "post": Post,
+    "put": Put,
+    "patch": Patch,
+    "delete": Delete,
+}
@@ -0,0 +1,234 @@
+import collections.abc
+import copy
+import pathlib
+import threading
+import typing as tp
+
+from openapi_parser import specification
+from openapi_parser.builders.content import ContentBuilder
+from openapi_parser.builders.external_doc import ExternalDocBuilder
+from openapi_parser.builders.header import HeaderBuilder
+from openapi_parser.builders.info import InfoBuilder
+from openapi_parser.builders.operation import OperationBuilder
+from openapi_parser.builders.parameter import ParameterBuilder
+from openapi_parser.builders.path import PathBuilder
+from openapi_parser.builders.request import RequestBuilder
+from openapi_parser.builders.response import ResponseBuilder
+from openapi_parser.builders.schema import SchemaFactory
+from openapi_parser.builders.server import ServerBuilder
+from openapi_parser.errors import ParserError
+from prance.util import formats
+
+# Specs loaded without resolving the whole document up front. Paths and component
+# schemas are built with openapi_parser builders on first use, so the time and memory
+# spent follow the endpoints actually called. The document is not validated
+
+_SCHEMAS = "#/components/schemas/"
+
+
+def _pointer(document: dict[str, tp.Any], ref: str) -> tp.Any:
+    # Local JSON pointer, i.e. #/components/parameters/limit
+    node: tp.Any = document
+    try:
+        for part in ref[2:].split("/"):
+            part = part.replace("~1", "/").replace("~0", "~")
+            node = node[int(part)] if isinstance(node, list) else node[part]
+    except (KeyError, IndexError, ValueError, TypeError):
+        raise ParserError(f"Unresolvable $ref {ref!r}") from None
+    return node
+
+
+def has_external_refs(document: tp.Any) -> bool:
+    """
+    Check if the document refers to other files or urls, such specs are parsed eagerly
+    """
+    stack = [document]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and not ref.startswith("#"):
+                return True
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return False
+
+
+class _SchemaFactory(SchemaFactory):
+    # Resolves $refs while building. Components are built once, so schemas referring
+    # to one of them are the very model objects, not just equal ones
+    def __init__(self, document: dict[str, tp.Any]) -> None:
+        super().__init__()
+        self._document = document
+        self._raw: dict[str, tp.Any] = document.get("components", {}).get("schemas", {})
+        self._built: dict[str, specification.Schema] = {}
+        # id(schema) -> component name, built schemas are kept, so ids are not reused
+        self._names: dict[int, str] = {}
+        self._building: set[str] = set()
+        # Specs are shared by stubs called from several threads, nested builds reenter
+        self._lock = threading.RLock()
+
+    def __getstate__(self) -> dict[str, tp.Any]:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def component(self, name: str) -> specification.Schema:
+        schema = self._built.get(name)
+        if schema is not None:
+            return schema
+
+        with self._lock:
+            schema = self._built.get(name)
+            if schema is None:
+                if name in self._building:
+                    raise ParserError(f"Recursive schema {name!r} is not supported")
+                self._building.add(name)
+                try:
+                    schema = self.create(self._raw[name])
+                finally:
+                    self._building.discard(name)
+                self._built[name] = schema
+                self._names[id(schema)] = name
+        return schema
+
+    def __setstate__(self, state: dict[str, tp.Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        # Unpickled schemas are new objects
+        self._names = {id(schema): name for name, schema in self._built.items()}
+
+    def name_of(self, schema: specification.Schema) -> str:
+        return self._names.get(id(schema), "")
+
+    def _inline(self, data: dict[str, tp.Any]) -> dict[str, tp.Any]:
+        # allOf parts are merged as raw dicts, merging changes them in place
+        while "$ref" in data:
+            data = _pointer(self._document, data["$ref"])
+        return copy.deepcopy(data)
+
+    def create(self, data: dict) -> specification.Schema:
+        ref = data.get("$ref")
+        if ref is not None:
+            if ref.startswith(_SCHEMAS) and "/" not in ref[len(_SCHEMAS) :]:
+                return self.component(ref[len(_SCHEMAS) :])
+            return self.create(_pointer(self._document, ref))
+
+        if "allOf" in data:
+            data = {**data, "allOf": [self._inline(i) for i in data["allOf"]]}
+        # Type of oneOf and anyOf schemas is set in the given dict
+        return super().create(dict(data))
+
+
+class LazySchemas(collections.abc.Mapping):
+    """
+    Component schemas by name, each one is built on first access
+    """
+
+    def __init__(self, factory: _SchemaFactory, names: tp.Iterable[str]) -> None:
+        self._factory = factory
+        self._names = list(names)
+        self._known = set(self._names)
+
+    def __getitem__(self, name: str) -> specification.Schema:
+        if name not in self._known:
+            raise KeyError(name)
+        return self._factory.component(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._known
+
+    def __iter__(self) -> tp.Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def name_of(self, schema: specification.Schema) -> str:
+        """
+        Name of the component the schema was built from, empty if it is not one.
+        Nothing new is built
+        """
+        return self._factory.name_of(schema)
+
+
+class LazyPath:
+    """
+    specification.Path of a url, built from the document on first attribute access
+    """
+
+    def __init__(self, loader: "_PathLoader", url: str) -> None:
+        self.url = url
+        self._loader = loader
+        self._path: specification.Path | None = None
+
+    def __getattr__(self, name: str) -> tp.Any:
+        # Private names (i.e. looked up by pickle) never build the path
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._path is None:
+            self._path = self._loader.build(self.url)
+        return getattr(self._path, name)
+
+
+class _PathLoader:
+    def __init__(self, document: dict[str, tp.Any], factory: _SchemaFactory) -> None:
+        self._document = document
+        parameters = ParameterBuilder(factory)
+        content = ContentBuilder(factory)
+        self._builder = PathBuilder(
+            OperationBuilder(
+                ResponseBuilder(content, HeaderBuilder(factory)),
+                ExternalDocBuilder(),
+                RequestBuilder(content),
+                parameters,
+            ),
+            parameters,
+        )
+
+    def _resolve(self, node: tp.Any) -> tp.Any:
+        # Copy of the path item with $refs outside of schemas replaced by their targets.
+        # Schemas are kept as they are, the schema factory resolves them
+        if isinstance(node, list):
+            return [self._resolve(i) for i in node]
+        if not isinstance(node, dict):
+            return node
+        if "$ref" in node:
+            return self._resolve(_pointer(self._document, node["$ref"]))
+        return {
+            key: value if key == "schema" else self._resolve(value)
+            for key, value in node.items()
+        }
+
+    def build(self, url: str) -> specification.Path:
+        data = self._resolve(self._document["paths"][url])
+        return self._builder.build_list({url: data})[0]
+
+
+def read_document(oapi_spec: str) -> dict[str, tp.Any]:
+    return parse_document(pathlib.Path(oapi_spec).read_bytes(), oapi_spec)
+
+
+def parse_document(content: bytes, oapi_spec: str) -> dict[str, tp.Any]:
+    return formats.parse_spec(content.decode(), oapi_spec)
+
+
+def load(document: dict[str, tp.Any]) -> specification.Specification:
+    """
+    Specification with paths and schemas built on first use
+    """
+    try:
+        version = document["openapi"]
+    except KeyError:
+        raise ParserError("Invalid OpenAPI version, check 'openapi' property") from None
+
+    factory = _SchemaFactory(document)
+    loader = _PathLoader(document, factory)
+    return specification.Specification(
+        version=version,
+        info=InfoBuilder().build(document["info"]),
+        servers=ServerBuilder().build_list(document.get("servers", [])),
+        paths=[LazyPath(loader, url) for url in document.get("paths", {})],
+        schemas=LazySchemas(factory, document.get("components", {}).get("schemas", {})),
+    )
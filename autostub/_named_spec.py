@@ -0,0 +1,136 @@
+import collections.abc
+import copy
+import dataclasses
+import typing as tp
+
+import prance
+from openapi_parser import parser, specification
+from openapi_parser.resolver import OPENAPI_SPEC_VALIDATOR, OpenAPIResolver
+
+# Marks component schemas in the document, so copies made by resolving $refs keep the name
+_MODEL_KEY = "x-autostub-model"
+# The same mark as openapi_parser keeps it in Schema.extensions
+_MODEL_EXTENSION = "autostub_model"
+
+
+def _mark_models(document: dict[str, tp.Any]) -> dict[str, tp.Any]:
+    stack: list[tp.Any] = [document]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            all_of = node.get("allOf")
+            if isinstance(all_of, list):
+                # Merged schemas would take the mark of their last part otherwise
+                all_of.append({_MODEL_KEY: ""})
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+    schemas = document.get("components", {}).get("schemas", {})
+    for name, schema in schemas.items():
+        # Keys next to $ref and allOf are dropped, the last part of allOf wins
+        if not isinstance(schema, dict):
+            continue
+        if "$ref" in schema:
+            schemas[name] = {"allOf": [schema, {_MODEL_KEY: name}]}
+        elif isinstance(schema.get("allOf"), list):
+            schema["allOf"].append({_MODEL_KEY: name})
+        else:
+            schema[_MODEL_KEY] = name
+    return document
+
+
+def _unmark_models(
+    spec: specification.Specification,
+) -> list[tuple[specification.Schema, str]]:
+    named = []
+    seen = set()
+    stack: list[tp.Any] = [spec]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+
+        if isinstance(node, specification.Schema) and node.extensions:
+            name = node.extensions.pop(_MODEL_EXTENSION, "")
+            if name:
+                named.append((node, name))
+
+        if isinstance(node, dict):
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        elif dataclasses.is_dataclass(node):
+            children = [getattr(node, i.name) for i in dataclasses.fields(node)]
+        else:
+            continue
+        stack.extend(
+            i
+            for i in children
+            if isinstance(i, (dict, list)) or dataclasses.is_dataclass(i)
+        )
+    return named
+
+
+class _MarkingParser(prance.ResolvingParser):
+    def _validate(self) -> None:
+        # Fetched documents are cached by prance
+        self.specification = _mark_models(copy.deepcopy(self.specification))
+        super()._validate()
+
+
+class _MarkingResolver(OpenAPIResolver):
+    def __init__(self, uri: str) -> None:
+        # The same options as OpenAPIResolver
+        self._resolver = _MarkingParser(
+            uri, backend=OPENAPI_SPEC_VALIDATOR, strict=False, lazy=True
+        )
+
+
+class NamedSchemas(collections.abc.Mapping):
+    """
+    Component schemas by name, knowing the component every schema of the spec was copied from
+    """
+
+    def __init__(
+        self,
+        schemas: dict[str, specification.Schema],
+        named: list[tuple[specification.Schema, str]],
+    ) -> None:
+        self._schemas = schemas
+        # Schemas are kept to pin their ids
+        self._named = named
+        self._names = {id(schema): name for schema, name in named}
+
+    def __setstate__(self, state: dict[str, tp.Any]) -> None:
+        self.__dict__.update(state)
+        # Unpickled schemas are new objects
+        self._names = {id(schema): name for schema, name in self._named}
+
+    def __getitem__(self, name: str) -> specification.Schema:
+        return self._schemas[name]
+
+    def __iter__(self) -> tp.Iterator[str]:
+        return iter(self._schemas)
+
+    def __len__(self) -> int:
+        return len(self._schemas)
+
+    def name_of(self, schema: specification.Schema) -> str:
+        """
+        Name of the component the schema was built from, empty if it is not one
+        """
+        return self._names.get(id(schema), "")
+
+
+def parse(oapi_spec: str) -> specification.Specification:
+    """
+    openapi_parser.parse, with schemas of the spec named by NamedSchemas.
+    Structurally equal components are told apart by the $refs of the document
+    """
+    spec = parser._create_parser().load_specification(
+        _MarkingResolver(oapi_spec).resolve()
+    )
+    spec.schemas = NamedSchemas(spec.schemas, _unmark_models(spec))
+    return spec
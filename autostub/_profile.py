@@ -0,0 +1,224 @@
+import contextlib
+import contextvars
+import dataclasses
+import enum
+import sys
+import threading
+import time
+import typing as tp
+
+# Wall time and memory blocks of the stages of stubbed calls, grouped by operation.
+# Stages are scopes in the dispatch pipeline, they cost nothing unless a call is profiled
+
+
+class Stage(enum.Enum):
+    ROUTING = "routing"
+    VALIDATION = "validation"
+    GENERATION = "generation"
+    CACHE = "cache"
+    SERIALIZATION = "serialization"
+
+
+@dataclasses.dataclass
+class StageStats:
+    calls: int = 0
+    time: float = 0.0
+    # Net memory blocks allocated, see sys.getallocatedblocks
+    blocks: int = 0
+
+    def __add__(self, other: "StageStats") -> "StageStats":
+        return StageStats(
+            self.calls + other.calls,
+            self.time + other.time,
+            self.blocks + other.blocks,
+        )
+
+
+@dataclasses.dataclass
+class OperationProfile:
+    calls: int = 0
+    # Wall time of whole calls, including parts outside of any stage
+    time: float = 0.0
+    stages: dict[Stage, StageStats] = dataclasses.field(default_factory=dict)
+
+    def __add__(self, other: "OperationProfile") -> "OperationProfile":
+        stages = dict(self.stages)
+        for stage, stats in other.stages.items():
+            stages[stage] = stages.get(stage, StageStats()) + stats
+        return OperationProfile(
+            self.calls + other.calls, self.time + other.time, stages
+        )
+
+
+# Calls answered by no operation of the spec
+UNMATCHED = "<unmatched>"
+
+
+class _Call:
+    # Stages of one call. Time and blocks of nested stages are not counted in outer ones
+    __slots__ = ("operation", "stages", "_stack")
+
+    def __init__(self) -> None:
+        self.operation: str | None = None
+        self.stages: dict[Stage, StageStats] = {}
+        # [stage, start time, start blocks, time of nested stages, blocks of nested stages]
+        self._stack: list[list[tp.Any]] = []
+
+    def enter(self, stage: Stage) -> None:
+        self._stack.append([stage, time.perf_counter(), sys.getallocatedblocks(), 0, 0])
+
+    def exit(self) -> None:
+        end, end_blocks = time.perf_counter(), sys.getallocatedblocks()
+        stage, start, start_blocks, nested, nested_blocks = self._stack.pop()
+        elapsed, blocks = end - start, end_blocks - start_blocks
+
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.calls += 1
+        stats.time += elapsed - nested
+        stats.blocks += blocks - nested_blocks
+
+        if self._stack:
+            self._stack[-1][3] += elapsed
+            self._stack[-1][4] += blocks
+
+
+_CALL: contextvars.ContextVar[_Call | None] = contextvars.ContextVar(
+    "autostub_profile_call", default=None
+)
+_NOT_PROFILED = contextlib.nullcontext()
+
+
+class _StageScope:
+    __slots__ = ("_call", "_stage")
+
+    def __init__(self, call: _Call, stage: Stage) -> None:
+        self._call = call
+        self._stage = stage
+
+    def __enter__(self) -> None:
+        self._call.enter(self._stage)
+
+    def __exit__(self, *exc_info: tp.Any) -> None:
+        self._call.exit()
+
+
+def stage(name: Stage) -> tp.ContextManager[None]:
+    """
+    Scope of a stage of the current call, nothing is recorded if it is not profiled
+    """
+    call = _CALL.get()
+    if call is None:
+        return _NOT_PROFILED
+    return _StageScope(call, name)
+
+
+def set_operation(name: str) -> None:
+    """
+    Name the operation answering the current call, the first one given is kept
+    """
+    call = _CALL.get()
+    if call is not None and call.operation is None:
+        call.operation = name
+
+
+def is_profiled() -> bool:
+    return _CALL.get() is not None
+
+
+class Profiler:
+    """
+    Collects stage statistics of profiled calls by operation (i.e. 'GET /pets/{id}')
+    """
+
+    def __init__(self) -> None:
+        self._operations: dict[str, OperationProfile] = {}
+        # Calls may come from threads (i.e. async clients)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def call(self) -> tp.Iterator[None]:
+        """
+        Profile a stubbed call. Calls made inside an already profiled one are part of it
+        """
+        if _CALL.get() is not None:
+            yield
+            return
+
+        call = _Call()
+        token = _CALL.set(call)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _CALL.reset(token)
+            self._record(call, elapsed)
+
+    def _record(self, call: _Call, elapsed: float) -> None:
+        profile = OperationProfile(1, elapsed, call.stages)
+        name = call.operation or UNMATCHED
+        with self._lock:
+            self._operations[name] = (
+                self._operations.get(name, OperationProfile()) + profile
+            )
+
+    def merge(self, other: "Profiler") -> None:
+        for name, profile in other.report().items():
+            with self._lock:
+                self._operations[name] = (
+                    self._operations.get(name, OperationProfile()) + profile
+                )
+
+    def report(self) -> dict[str, OperationProfile]:
+        with self._lock:
+            return dict(self._operations)
+
+    def format(self) -> list[str]:
+        """
+        Report lines, the slowest operations first
+        """
+        lines = []
+        report = sorted(self.report().items(), key=lambda item: -item[1].time)
+        for name, profile in report:
+            lines.append(
+                f"{name}: calls={profile.calls} time={profile.time:.4f}s "
+                f"mean={profile.time / profile.calls * 1e6:.1f}us"
+            )
+            for stage in Stage:
+                stats = profile.stages.get(stage)
+                if stats is None:
+                    continue
+                share = stats.time / profile.time * 100 if profile.time else 0.0
+                lines.append(
+                    f"    {stage.value}: {stats.time:.4f}s ({share:.1f}%) "
+                    f"calls={stats.calls} blocks={stats.blocks:+d}"
+                )
+        return lines
+
+
+def profiled_call(profiler: Profiler | None) -> tp.ContextManager[None]:
+    if profiler is None:
+        return _NOT_PROFILED
+    return profiler.call()
+
+
+class ProfiledCache:
+    """
+    Cache wrapper counting all its methods into the cache stage
+    """
+
+    def __init__(self, cache: tp.Any) -> None:
+        self._cache = cache
+
+    def __getattr__(self, name: str) -> tp.Any:
+        attr = getattr(self._cache, name)
+        if not callable(attr):
+            return attr
+
+        def method(*args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+            with stage(Stage.CACHE):
+                return attr(*args, **kwargs)
+
+        return method
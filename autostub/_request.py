@@ -1,4 +1,7 @@
 import dataclasses
+import random
+from typing import Any
+
 from frozendict import frozendict
 
 
@@ -6,8 +9,44 @@ from frozendict import frozendict
 class Request:
     url: str
     method: str
-    data: frozendict[str, str]
+    # Decoded JSON body, kept as is if it is not JSON
+    data: frozendict[str, Any] | list[Any] | str | bytes
     parameters: frozendict[str, str]
     headers: frozendict[str, str]
     path_params: frozendict[str, str] = frozendict()
     query_params: frozendict[str, str] = frozendict()
+    # random.Random used by generators, the random module itself if the spec is not seeded
+    rng: Any = dataclasses.field(default=random, compare=False, repr=False)
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class GenerationContext:
+    # Read-only view of a request passed down to generators.
+    # Nested objects overlay their own query params instead of copying the request
+    request: Request
+    query_params: frozendict[str, Any] = frozendict()
+
+    @classmethod
+    def of(cls, request: "Request | GenerationContext") -> "GenerationContext":
+        if isinstance(request, GenerationContext):
+            return request
+        return cls(request, request.query_params)
+
+    @property
+    def url(self) -> str:
+        return self.request.url
+
+    @property
+    def method(self) -> str:
+        return self.request.method
+
+    @property
+    def rng(self) -> Any:
+        return self.request.rng
+
+    def with_query_params(
+        self, query_params: frozendict[str, Any]
+    ) -> "GenerationContext":
+        if query_params == self.query_params:
+            return self
+        return GenerationContext(self.request, query_params)
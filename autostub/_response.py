@@ -1,5 +1,10 @@
 import dataclasses
+import functools
 import http
+import typing as tp
+
+from autostub._cache import BaseCache
+from autostub._codec import DEFAULT_CODEC, JsonCodec
 
 
 @dataclasses.dataclass
@@ -9,8 +14,39 @@ class _BaseHTTPResponse:
     content_type: str | None = None
     headers: dict[str, str] = dataclasses.field(default_factory=dict)
     encoding: str | None = "utf-8"
+    # Encoded content, filled by encode()
+    body: bytes | None = None
+
+    def _encode_content(self, content: tp.Any, codec: JsonCodec) -> bytes:
+        if isinstance(content, str):
+            return content.encode(self.encoding or "utf-8")
+        return content
+
+    def encode(
+        self, cache: BaseCache | None = None, codec: JsonCodec | None = None
+    ) -> bytes:
+        """
+        Encode content once, reusing the bytes memoized in cache for the same content object
+        """
+        if self.body is None:
+            codec = codec or DEFAULT_CODEC
+            encode = functools.partial(self._encode_content, codec=codec)
+            if cache is None:
+                self.body = encode(self.content)
+            else:
+                self.body = cache.encoded(
+                    self.content, encode, (type(self), self.encoding, codec.name)
+                )
+        return self.body
 
 
+@dataclasses.dataclass
 class JsonHTTPResponse(_BaseHTTPResponse):
-    content_type = "application/json"
     content: dict[str, str] = dataclasses.field(default_factory=dict)
+    content_type: str | None = "application/json"
+
+    def _encode_content(self, content: tp.Any, codec: JsonCodec) -> bytes:
+        res = codec.dumps(content)
+        if self.encoding and self.encoding.lower() not in {"utf-8", "utf8"}:
+            res = res.decode("utf-8").encode(self.encoding)
+        return res
@@ -0,0 +1,62 @@
+from typing import Iterable, Optional
+
+import frozendict
+
+
+class _Node:
+    __slots__ = ("static", "params", "template")
+
+    def __init__(self) -> None:
+        self.static: dict[str, "_Node"] = {}
+        self.params: dict[str, "_Node"] = {}
+        self.template: Optional[str] = None
+
+
+class PathRouter:
+    # Segment trie over path templates (i.e /pets/{id}).
+    # Lookup cost depends on the depth of the requested path, not on the number of templates
+    def __init__(self, templates: Iterable[str] = ()) -> None:
+        self._root = _Node()
+        for template in templates:
+            self.add(template)
+
+    def add(self, template: str) -> None:
+        node = self._root
+        for segment in template.split("/"):
+            if segment.startswith("{") and segment.endswith("}"):
+                node = node.params.setdefault(segment[1:-1], _Node())
+            else:
+                node = node.static.setdefault(segment, _Node())
+        node.template = template
+
+    def match(self, path: str) -> list[tuple[str, frozendict.frozendict[str, str]]]:
+        """
+        Return (template, path parameters) for every template matching the path
+        """
+        result = []
+        self._match(self._root, path.split("/"), 0, {}, result)
+        return result
+
+    def _match(
+        self,
+        node: _Node,
+        segments: list[str],
+        idx: int,
+        params: dict[str, str],
+        result: list[tuple[str, frozendict.frozendict[str, str]]],
+    ) -> None:
+        if idx == len(segments):
+            if node.template is not None:
+                result.append((node.template, frozendict.frozendict(params)))
+            return
+
+        segment = segments[idx]
+
+        child = node.static.get(segment)
+        if child is not None:
+            self._match(child, segments, idx + 1, params, result)
+
+        for name, child in node.params.items():
+            params[name] = segment
+            self._match(child, segments, idx + 1, params, result)
+            del params[name]
@@ -1,42 +1,96 @@
 from types import NoneType
-from typing import Any
+from typing import Any, Callable
+import collections.abc
 
-from autostub._request import Request
+from autostub._request import GenerationContext, Request
 from autostub._cache import BaseCache, CompositeCacheKey, NO_CACHE
+from autostub import _bulk
 
 import openapi_parser.specification as spec
 from frozendict import frozendict
 
-import copy
-import random
 import sys
 import string
 
+# generate(request, cache, read_from_cache=True) -> value
+type Generator = Callable[..., Any]
+# generate_many(count, rng) -> list of values
+type BulkGenerator = Callable[[int, Any], list[Any]]
+# parse(value) -> typed value, INVALID if it does not match the schema
+type Parser = Callable[[Any], Any]
+
+# Returned by parsers, None is a valid value
+INVALID: Any = object()
+
+_ALLOWED_LETTERS = string.ascii_letters + string.digits + " "
+_BOOLEANS = [True, False]
+_BOOLEAN_STRINGS = {"true": True, "false": False}
+
 
 class GeneratableEntity:
+    # Parsed values differ from the given ones (i.e. numbers from query strings)
+    typed = True
+
     def __init__(self, spec: spec.Schema, name: str | None = None) -> None:
         self._spec = spec
         self._cacheable = False
         self._name = name
+        self._compiled: Generator | None = None
+        self._parser: Parser | None = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Compiled closures are not picklable, they are rebuilt on first use
+        state = self.__dict__.copy()
+        state["_compiled"] = None
+        state["_parser"] = None
+        return state
+
+    def compile(self) -> Generator:
+        """
+        Build a generator function with bounds and nested generators resolved ahead of time
+        """
+        raise NotImplementedError
 
-    def _read_cache(self, request: Request, cache: BaseCache) -> Any:
-        if self._cacheable:
-            key = CompositeCacheKey(key=request, model=self._spec)
-            if cache.has(key):
-                return cache.get(key)
-        else:
-            if self._name and self._name in request.query_params:
-                return request.query_params[self._name]
+    def compile_bulk(self) -> BulkGenerator | None:
+        """
+        Build a function generating many values at once, if the schema supports it
+        """
         return None
 
-    def __call__(self, request: Request, cache: BaseCache) -> Any:
-        return self._read_cache(request, cache)
+    def compile_parser(self) -> Parser:
+        """
+        Build a function checking a parameter or body value and converting it to the schema type
+        """
+        raise NotImplementedError
+
+    @property
+    def generate(self) -> Generator:
+        if self._compiled is None:
+            self._compiled = self.compile()
+        return self._compiled
+
+    @property
+    def parser(self) -> Parser:
+        if self._parser is None:
+            self._parser = self.compile_parser()
+        return self._parser
+
+    def __call__(
+        self,
+        request: Request | GenerationContext,
+        cache: BaseCache,
+        *args: Any,
+        **kwds: Any,
+    ) -> Any:
+        return self.generate(request, cache, **kwds)
 
     def is_valid(self, item: Any) -> bool:
-        raise NotImplementedError
+        return self.parser(item) is not INVALID
 
     def from_val(self, val: Any) -> Any:
-        return val
+        res = self.parser(val)
+        assert res is not INVALID
+        return res
 
 
 class Integer(GeneratableEntity):
@@ -58,137 +112,245 @@ class Integer(GeneratableEntity):
         else:
             self._upper_bound = sys.maxsize
 
-    def __call__(self, *args: Any, **kwds: Any) -> int:
-        r = super()._read_cache(*args, **kwds)
+    def compile(self) -> Generator:
+        name, lower, upper = self._name, self._lower_bound, self._upper_bound
 
-        if r:
-            return r
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> int:
+            if name:
+                r = request.query_params.get(name)
+                if r:
+                    return r
 
-        return random.randint(
-            self._lower_bound,
-            self._upper_bound,
-        )
+            return request.rng.randint(lower, upper)
 
-    def is_valid(self, item: int | str) -> bool:
-        try:
-            item = int(item)
-        except ValueError:
-            return False
-        return self._lower_bound <= item <= self._upper_bound
+        return generate
 
-    def from_val(self, val: str) -> int:
-        assert self.is_valid(val)
-        return int(val)
+    def compile_bulk(self) -> BulkGenerator | None:
+        lower, upper = self._lower_bound, self._upper_bound
+        return lambda count, rng: _bulk.integers(lower, upper, count, rng)
+
+    def compile_parser(self) -> Parser:
+        lower, upper = self._lower_bound, self._upper_bound
+
+        def parse(value: Any) -> int:
+            if isinstance(value, bool):
+                return INVALID
+            if isinstance(value, float) and not value.is_integer():
+                return INVALID
+            try:
+                value = int(value)
+            except (TypeError, ValueError, OverflowError):
+                return INVALID
+            return value if lower <= value <= upper else INVALID
+
+        return parse
 
 
 class Number(Integer):
-    def __call__(self, *args: Any, **kwds: Any) -> float:
-        r = super()._read_cache(*args, **kwds)
+    def compile(self) -> Generator:
+        name, lower, upper = self._name, self._lower_bound, self._upper_bound
 
-        if r:
-            return r
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> float:
+            if name:
+                r = request.query_params.get(name)
+                if r:
+                    return r
 
-        return random.uniform(
-            self._lower_bound,
-            self._upper_bound,
-        )
+            return request.rng.uniform(lower, upper)
+
+        return generate
 
-    def is_valid(self, item: str) -> bool:
-        try:
-            converted = float(item)
-        except ValueError:
-            return False
-        return self._lower_bound <= converted <= self._upper_bound
+    def compile_bulk(self) -> BulkGenerator | None:
+        lower, upper = self._lower_bound, self._upper_bound
+        return lambda count, rng: _bulk.numbers(lower, upper, count, rng)
 
-    def from_val(self, val: str) -> float:
-        assert self.is_valid(val)
-        return float(val)
+    def compile_parser(self) -> Parser:
+        lower, upper = self._lower_bound, self._upper_bound
+
+        def parse(value: Any) -> float:
+            if isinstance(value, bool):
+                return INVALID
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return INVALID
+            return value if lower <= value <= upper else INVALID
+
+        return parse
 
 
 class String(GeneratableEntity):
     _spec: spec.String
+    typed = False
 
     def __init__(self, spec: spec.String, name: str | None = None) -> NoneType:
         super().__init__(spec, name)
         self._lower_bound = self._spec.min_length or 1
         self._upper_bound = self._spec.max_length or 100
 
-    def __call__(self, *args: Any, **kwds: Any) -> str:
+    def compile(self) -> Generator:
         # TODO support formats
-
-        r = super()._read_cache(*args, **kwds)
-
-        if r:
-            return r
-
-        allowed_letters = string.ascii_letters + string.digits + " "
-        return "".join(
-            random.choices(
-                allowed_letters,
-                k=random.randint(
-                    self._lower_bound,
-                    self._upper_bound,
-                ),
-            )
+        name, lower, upper = self._name, self._lower_bound, self._upper_bound
+
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> str:
+            if name:
+                r = request.query_params.get(name)
+                if r:
+                    return r
+
+            rng = request.rng
+            return "".join(rng.choices(_ALLOWED_LETTERS, k=rng.randint(lower, upper)))
+
+        return generate
+
+    def compile_bulk(self) -> BulkGenerator | None:
+        lower, upper = self._lower_bound, self._upper_bound
+        return lambda count, rng: _bulk.strings(
+            lower, upper, _ALLOWED_LETTERS, count, rng
         )
 
-    def is_valid(self, item: str) -> bool:
+    def compile_parser(self) -> Parser:
         # TODO support formats
-        if not isinstance(item, str):
-            return False
-        return self._lower_bound <= len(item) <= self._upper_bound
+        lower, upper = self._lower_bound, self._upper_bound
+
+        def parse(value: Any) -> str:
+            if isinstance(value, str) and lower <= len(value) <= upper:
+                return value
+            return INVALID
+
+        return parse
 
 
 class Boolean(GeneratableEntity):
-    def __call__(self, *args: Any, **kwds: Any) -> bool:
-        r = super()._read_cache(*args, **kwds)
+    def compile(self) -> Generator:
+        name = self._name
+
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> bool:
+            if name:
+                r = request.query_params.get(name)
+                if r:
+                    return r
 
-        if r:
-            return r
+            return request.rng.choice(_BOOLEANS)
 
-        return random.choice([True, False])
+        return generate
 
-    def is_valid(self, item: bool) -> bool:
-        return item in [True, False]
+    def compile_bulk(self) -> BulkGenerator | None:
+        return _bulk.booleans
+
+    def compile_parser(self) -> Parser:
+        def parse(value: Any) -> bool:
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str):
+                # Query parameters come as strings
+                return _BOOLEAN_STRINGS.get(value.lower(), INVALID)
+            return INVALID
+
+        return parse
 
 
 class Null(GeneratableEntity):
-    def __call__(self, *args: Any, **kwds: Any) -> NoneType:
-        return None
+    typed = False
+
+    def compile(self) -> Generator:
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> NoneType:
+            return None
 
-    def is_valid(self, item: NoneType) -> bool:
-        return item is None
+        return generate
+
+    def compile_parser(self) -> Parser:
+        return lambda value: None if value is None else INVALID
 
 
 class Array(GeneratableEntity):
     _spec: spec.Array
 
-    def __call__(
-        self, request: Request, cache: BaseCache, *args: Any, **kwds: Any
-    ) -> Any:
-        limit = random.randint(
-            self._spec.min_items or 0,
-            self._spec.max_items or 100,
-        )
+    def __init__(self, spec: spec.Array, name: str | None = None) -> NoneType:
+        super().__init__(spec, name)
+        self._items = SCHEMA_MAP[type(self._spec.items)](self._spec.items)
+
+    def compile(self) -> Generator:
+        lower, upper = self._spec.min_items or 0, self._spec.max_items or 100
+        items_model = self._spec.items
+        # Primitive items are never stored by model, so they are always made in bulk
+        generate_items = self._items.compile_bulk()
+        if generate_items is None:
+            generate_item = self._items.generate
+
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> list[Any]:
+            rng = request.rng
+            limit = rng.randint(lower, upper)
+
+            key = CompositeCacheKey(key=request, model=items_model)
+
+            if generate_items is not None:
+                r = generate_items(limit, rng)
+                if not cache.has_by_model():
+                    r = cache.put_first(key, r)
+                return r
+            elif cache.has_by_model():
+                for _ in range(len(cache.get_all_by_model(key)), limit):
+                    generate_item(request, cache, read_from_cache=False)
 
-        key = CompositeCacheKey(key=copy.deepcopy(request), model=self._spec.items)
+                # Cache limits may evict entries while refilling, the pool can be smaller
+                items = list(cache.get_all_by_model(key).values())
 
-        obj = SCHEMA_MAP[type(self._spec.items)](self._spec.items)
-        if cache.has_by_model():
-            if len(cache.get_all_by_model(key)) < limit:
-                for _ in range(len(cache.get_all_by_model(key)), limit):
-                    obj(request, cache, read_from_cache=False)
+                return [rng.sample(items, min(limit, len(items)))]
+            else:
+                r = [generate_item(request, NO_CACHE) for _ in range(limit)]
+                return cache.put_first(key, r)
 
-            items = cache.get_all_by_model(key)
+        return generate
 
-            return [random.sample(list(items.values()), limit)]
-        else:
-            r = [obj(request, NO_CACHE) for _ in range(limit)]
-            cache.put(key, r)
-            return r
+    def compile_parser(self) -> Parser:
+        lower, upper = self._spec.min_items or 0, self._spec.max_items
+        parse_item = self._items.parser
 
-    def is_valid(self, item: list[Any]) -> bool:
-        return all([isinstance(x, self._spec.items) for x in item])
+        def parse(value: Any) -> tuple[Any, ...]:
+            if isinstance(value, str):
+                # Form style of query parameters, i.e ?ids=1,2,3
+                value = value.split(",") if value else []
+            elif not isinstance(value, (list, tuple)):
+                return INVALID
+
+            if len(value) < lower or (upper is not None and len(value) > upper):
+                return INVALID
+
+            res = []
+            for item in value:
+                item = parse_item(item)
+                if item is INVALID:
+                    return INVALID
+                res.append(item)
+            # Hashable, parsed values are used in cache keys
+            return tuple(res)
+
+        return parse
 
 
 class Object(GeneratableEntity):
@@ -205,59 +367,96 @@ class Object(GeneratableEntity):
     def _transform_parameters(
         self, q_params: frozendict[str, str]
     ) -> frozendict[str, Any]:
+        # Values not matching the property are kept as they are
         result = {}
         for name, val in q_params.items():
-            if name in self.properties:
-                result[name] = self.properties[name].from_val(val)
-            else:
-                result[name] = val
+            entity = self.properties.get(name)
+            if entity is not None and entity.typed:
+                parsed = entity.parser(val)
+                if parsed is not INVALID:
+                    val = parsed
+            result[name] = val
         return frozendict(result)
 
-    def __call__(
-        self,
-        request: Request,
-        cache: BaseCache,
-        *args: Any,
-        read_from_cache: bool = True,
-        **kwds: Any,
-    ) -> dict[str, Any]:
-        res = {}
-
-        inner_req = copy.deepcopy(request)
-        inner_req.query_params = self._transform_parameters(inner_req.query_params)
-
-        cache_key = CompositeCacheKey(
-            key=inner_req,
+    def cache_key(self, request: Request | GenerationContext) -> CompositeCacheKey:
+        """
+        Key the object generated for the request is cached by
+        """
+        q_params = self._transform_parameters(request.query_params)
+        return CompositeCacheKey(
+            key=GenerationContext.of(request).with_query_params(q_params),
             model=self._spec,
         )
 
-        if read_from_cache and cache.has(cache_key):
-            return cache.get(cache_key)
-
-        put_fields = dict()
-        for prop in self.properties:
-            if prop in self.required or random.choice([True, False]):
-                res[prop] = self.properties[prop](inner_req, cache, *args, **kwds)
-                put_fields[prop] = res[prop]
-
-        cache_key.put_fields = frozendict(put_fields)
-
-        cache.put(cache_key, res)
-
-        return res
-
-    def is_valid(self, item: dict) -> bool:
-        object_keys = set(item.keys())
-
-        if object_keys & self.required != self.required:
-            return False
-
-        res = True
-
-        for key in item:
-            res &= self.properties[key].is_valid(item[key])
-
-        return res
+    def compile(self) -> Generator:
+        model = self._spec
+        required = self.required
+        properties = [
+            (prop, entity.generate, prop in required)
+            for prop, entity in self.properties.items()
+        ]
+        # Only properties actually converting their values
+        converted = {prop for prop, entity in self.properties.items() if entity.typed}
+        transform = self._transform_parameters
+
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> dict[str, Any]:
+            q_params = request.query_params
+            if not converted.isdisjoint(q_params):
+                q_params = transform(q_params)
+            inner_req = GenerationContext.of(request).with_query_params(q_params)
+
+            cache_key = CompositeCacheKey(key=inner_req, model=model)
+
+            if read_from_cache:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+            rng = request.rng
+            # Without models every value is stored by the request, so nested ones
+            # are not stored at all, only the object is
+            prop_cache = cache if cache.has_by_model() else NO_CACHE
+            res = {}
+            for prop, generate_prop, is_required in properties:
+                if is_required or rng.choice(_BOOLEANS):
+                    res[prop] = generate_prop(inner_req, prop_cache)
+
+            cache_key.put_fields = frozendict(res)
+
+            if not read_from_cache:
+                # A new object is wanted (i.e. an item of a list), not one stored meanwhile
+                cache.put(cache_key, res)
+                return res
+            return cache.put_first(cache_key, res)
+
+        return generate
+
+    def compile_parser(self) -> Parser:
+        required = self.required
+        parsers = {prop: entity.parser for prop, entity in self.properties.items()}
+
+        def parse(value: Any) -> frozendict[str, Any]:
+            if not isinstance(value, collections.abc.Mapping):
+                return INVALID
+            if not required.issubset(value):
+                return INVALID
+
+            res = {}
+            for prop, item in value.items():
+                parse_prop = parsers.get(prop)
+                # Unknown properties are kept as they are
+                if parse_prop is not None:
+                    item = parse_prop(item)
+                    if item is INVALID:
+                        return INVALID
+                res[prop] = item
+            return frozendict(res)
+
+        return parse
 
 
 class AnyOf(GeneratableEntity):
@@ -269,17 +468,31 @@ class AnyOf(GeneratableEntity):
         for schema in self._spec.schemas:
             self._available_schemas.append(SCHEMA_MAP[type(schema)](schema))
 
-    def __call__(self, *args: Any, **kwds: Any) -> Any:
-        schema = random.choice(self._available_schemas)
-        return schema(*args, **kwds)
+    def compile(self) -> Generator:
+        generators = [schema.generate for schema in self._available_schemas]
 
-    def is_valid(self, item: Any) -> bool:
-        res = False
+        def generate(
+            request: Request | GenerationContext,
+            cache: BaseCache,
+            read_from_cache: bool = True,
+        ) -> Any:
+            return request.rng.choice(generators)(
+                request, cache, read_from_cache=read_from_cache
+            )
 
-        for schema in self._available_schemas:
-            res |= schema.is_valid(item)
+        return generate
 
-        return res
+    def compile_parser(self) -> Parser:
+        parsers = [schema.parser for schema in self._available_schemas]
+
+        def parse(value: Any) -> Any:
+            for parse_schema in parsers:
+                res = parse_schema(value)
+                if res is not INVALID:
+                    return res
+            return INVALID
+
+        return parse
 
 
 class OneOf(AnyOf):
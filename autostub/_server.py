@@ -0,0 +1,495 @@
+import asyncio
+import dataclasses
+import http
+import multiprocessing
+import os
+import pathlib
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import typing as tp
+import urllib.parse
+
+import frozendict
+from openapi_parser import specification
+
+from autostub._cache import BaseCache, CacheFactory, CacheLimits, CachingLevel
+from autostub._codec import get_codec
+from autostub._dispatch import ServerMap
+from autostub._generator import OAPISpec
+from autostub._request import Request
+from autostub._response import _BaseHTTPResponse
+from autostub._spec_cache import SPEC_CACHE
+from autostub.adapters.base import BaseAdapter
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Larger request heads are answered with 431 and the connection is closed
+MAX_HEAD_SIZE = 64 * 1024
+
+_STATUS_LINES = {
+    status.value: f"HTTP/1.1 {status.value} {status.phrase}\r\n".encode("latin-1")
+    for status in http.HTTPStatus
+}
+
+
+_EMPTY = frozendict.frozendict()
+
+
+class _BadRequest(Exception):
+    def __init__(self, status: http.HTTPStatus) -> None:
+        super().__init__(status.phrase)
+        self.status = status
+
+
+def _encode_head(status_code: int, headers: tp.Iterable[tuple[str, str]]) -> bytes:
+    status_line = _STATUS_LINES.get(status_code)
+    if status_line is None:
+        status_line = f"HTTP/1.1 {status_code} Unknown\r\n".encode("latin-1")
+
+    lines = [status_line]
+    for name, value in headers:
+        lines.append(f"{name}: {value}\r\n".encode("latin-1"))
+    lines.append(b"\r\n")
+    return b"".join(lines)
+
+
+def _empty_response(status: http.HTTPStatus, close: bool = False) -> bytes:
+    headers = [("Server", "autostub"), ("Content-Length", "0")]
+    if close:
+        headers.append(("Connection", "close"))
+    return _encode_head(status.value, headers)
+
+
+def _host_name(host: str) -> str:
+    # Host header without the port, it is the port of the stub server
+    try:
+        return urllib.parse.urlsplit(f"//{host}").hostname or ""
+    except ValueError:
+        return ""
+
+
+class ServerAdapter(BaseAdapter):
+    # Raw HTTP requests of the stub server.
+    # Paths are moved under the server urls of every spec, so /v1/pets/1
+    # is looked up as http://petstore.swagger.io/v1/pets/1
+    def __init__(self, servers: dict[str, OAPISpec]) -> None:
+        super().__init__()
+        self._servers = ServerMap(servers)
+        # (path prefix, host, server url)
+        self._prefixes: list[tuple[str, str, str]] = []
+        for server in servers.values():
+            for url in server.servers:
+                parsed = urllib.parse.urlparse(url.lower())
+                entry = (
+                    parsed.path.rstrip("/"),
+                    parsed.hostname or "",
+                    url.rstrip("/").lower(),
+                )
+                if entry not in self._prefixes:
+                    self._prefixes.append(entry)
+        # Longest prefixes first, the same way routes are matched
+        self._prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def _full_urls(self, path: str, host: str) -> list[str]:
+        """
+        Urls the path may stand for. Servers on the Host of the request are taken
+        if there are any, otherwise all servers with the path under them are tried
+        """
+        urls = []
+        on_host = []
+        for prefix, server_host, url in self._prefixes:
+            if not path.startswith(prefix):
+                continue
+            rest = path[len(prefix) :]
+            # /v10 is not under /v1
+            if not rest or rest[0] == "/":
+                urls.append(url + rest)
+                if server_host == host:
+                    on_host.append(url + rest)
+        return on_host or urls
+
+    @staticmethod
+    def from_response(resp: _BaseHTTPResponse) -> bytes:
+        body = resp.encode()
+
+        headers = [("Server", "autostub"), ("Content-Length", str(len(body)))]
+        names = {name.lower() for name in resp.headers}
+        if resp.content_type and "content-type" not in names:
+            content_type = resp.content_type
+            if resp.encoding:
+                content_type += f"; charset={resp.encoding}"
+            headers.append(("Content-Type", content_type))
+        headers.extend((name, str(value)) for name, value in resp.headers.items())
+
+        return _encode_head(resp.status_code, headers) + body
+
+    def to_requests(
+        self, method: str, target: str, headers: dict[str, str], body: bytes
+    ) -> list[Request]:
+        path, _, query = target.partition("?")
+        urls = self._full_urls(
+            urllib.parse.unquote(path).lower(), _host_name(headers.get("host", ""))
+        )
+        if not urls:
+            return []
+
+        params = (
+            frozendict.frozendict(urllib.parse.parse_qsl(query)) if query else _EMPTY
+        )
+        data = self.decode_body(body) if body else _EMPTY
+        headers = frozendict.frozendict(headers)
+        return [Request(url, method.lower(), data, params, headers) for url in urls]
+
+    def handle(
+        self, method: str, target: str, headers: dict[str, str], body: bytes
+    ) -> bytes:
+        for request in self.to_requests(method, target, headers, body):
+            for server in self._servers.candidates(request.url):
+                response = server(request)
+                if response is not None:
+                    return self.from_response(response)
+
+        return _empty_response(http.HTTPStatus.NOT_FOUND)
+
+
+class HTTPProtocol(asyncio.Protocol):
+    """
+    HTTP/1.1 connection with keep-alive. All complete requests in the buffer
+    are answered in order and written back at once, so pipelined requests cost one write
+    """
+
+    def __init__(self, adapter: ServerAdapter) -> None:
+        self._adapter = adapter
+        self._transport: asyncio.Transport | None = None
+        self._buffer = bytearray()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = tp.cast(asyncio.Transport, transport)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._transport = None
+
+    def data_received(self, data: bytes) -> None:
+        self._buffer += data
+
+        out = []
+        close = False
+        while True:
+            try:
+                parsed = self._parse()
+            except _BadRequest as e:
+                out.append(_empty_response(e.status, close=True))
+                close = True
+                break
+
+            if parsed is None:
+                break
+
+            method, target, headers, body, keep_alive = parsed
+            try:
+                out.append(self._adapter.handle(method, target, headers, body))
+            except Exception as e:
+                # Requests pipelined after a failed one are not answered
+                asyncio.get_running_loop().call_exception_handler(
+                    {
+                        "message": f"Stubbed {method} {target} failed",
+                        "exception": e,
+                        "protocol": self,
+                    }
+                )
+                out.append(
+                    _empty_response(http.HTTPStatus.INTERNAL_SERVER_ERROR, close=True)
+                )
+                close = True
+                break
+            if not keep_alive:
+                close = True
+                break
+
+        if out and self._transport is not None:
+            self._transport.write(b"".join(out))
+        if close and self._transport is not None:
+            self._transport.close()
+
+    def _parse(self) -> tuple[str, str, dict[str, str], bytes, bool] | None:
+        buffer = self._buffer
+        head_end = buffer.find(b"\r\n\r\n")
+        if head_end < 0:
+            if len(buffer) > MAX_HEAD_SIZE:
+                raise _BadRequest(http.HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            return None
+        if head_end > MAX_HEAD_SIZE:
+            raise _BadRequest(http.HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+        lines = bytes(buffer[:head_end]).decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise _BadRequest(http.HTTPStatus.BAD_REQUEST)
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise _BadRequest(http.HTTPStatus.BAD_REQUEST)
+            headers[name.strip().lower()] = value.strip()
+
+        if "transfer-encoding" in headers:
+            raise _BadRequest(http.HTTPStatus.NOT_IMPLEMENTED)
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise _BadRequest(http.HTTPStatus.BAD_REQUEST)
+        if length < 0:
+            raise _BadRequest(http.HTTPStatus.BAD_REQUEST)
+
+        body_start = head_end + 4
+        if len(buffer) < body_start + length:
+            return None
+
+        body = bytes(buffer[body_start : body_start + length])
+        del buffer[: body_start + length]
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+
+        return method, target, headers, body, keep_alive
+
+
+class StubServer:
+    """
+    Serves responses generated from OpenAPI specs over HTTP.
+    Specs without component schemas are cached by request at the ADVANCED level
+    """
+
+    def __init__(
+        self,
+        oapi_specs: tp.Sequence[str],
+        caching_level: CachingLevel = CachingLevel.ADVANCED,
+        cache_limits: CacheLimits | None = None,
+        codec: str | None = None,
+        spec_cache_dir: str | os.PathLike | None = None,
+        shared_cache: str | os.PathLike | None = None,
+        seed: int | None = None,
+        lazy: bool = False,
+    ) -> None:
+        self._caching_level = caching_level
+        self._seed = seed
+        self._cache_limits = cache_limits
+        self._codec = get_codec(codec)
+        # SQLite file with generated data, shared by all workers
+        self.shared_cache = shared_cache
+        # Parsed before workers are forked, so they share it
+        self._specs = {
+            name: SPEC_CACHE.load(name, spec_cache_dir, lazy) for name in oapi_specs
+        }
+
+    def _make_cache(self, name: str, spec: specification.Specification) -> BaseCache:
+        caching_level = self._caching_level
+        if caching_level == CachingLevel.ADVANCED and not spec.schemas:
+            # Nothing to cache by model, responses are cached by request instead
+            caching_level = CachingLevel.BASIC
+        limits = self._cache_limits
+        if (
+            caching_level == CachingLevel.BASIC
+            and limits is not None
+            and limits.max_entries is None
+        ):
+            # Responses are cached by request, the limit per model bounds them instead
+            limits = dataclasses.replace(
+                limits, max_entries=limits.max_entries_per_model
+            )
+        return CacheFactory.get_cache(
+            caching_level,
+            spec.schemas,
+            limits,
+            shared_path=self.shared_cache,
+            namespace=f"{name}:",
+        )
+
+    def make_adapter(self) -> ServerAdapter:
+        """
+        Adapter with fresh caches, one per worker process.
+        Generated data is still shared between workers if shared_cache is set
+        """
+        servers = {
+            name: entity.with_cache(
+                self._make_cache(name, spec), self._codec, self._seed
+            )
+            for name, (spec, entity) in self._specs.items()
+        }
+        return ServerAdapter(servers)
+
+    async def start(
+        self,
+        host: str | None = None,
+        port: int | None = None,
+        sock: socket.socket | None = None,
+    ) -> asyncio.Server:
+        adapter = self.make_adapter()
+        loop = asyncio.get_running_loop()
+        return await loop.create_server(
+            lambda: HTTPProtocol(adapter), host=host, port=port, sock=sock
+        )
+
+    async def _serve_forever(
+        self, sock: socket.socket, started: tp.Any | None = None
+    ) -> None:
+        server = await self.start(sock=sock)
+        if started is not None:
+            started.release()
+        async with server:
+            await server.serve_forever()
+
+    def _run_worker(
+        self,
+        sock: socket.socket,
+        address: tuple[str, int] | None = None,
+        started: tp.Any | None = None,
+    ) -> None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if address is not None:
+            # Own listening socket in the SO_REUSEPORT group of the address
+            sock.close()
+            sock = socket.create_server(address, backlog=1024, reuse_port=True)
+            sock.setblocking(False)
+        try:
+            if uvloop is not None:
+                asyncio.run(
+                    self._serve_forever(sock, started),
+                    loop_factory=uvloop.new_event_loop,
+                )
+            else:
+                asyncio.run(self._serve_forever(sock, started))
+        except KeyboardInterrupt:
+            pass
+
+    def serve(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        workers: int = 1,
+        ready: tp.Callable[[str, int], None] | None = None,
+        reuse_port: bool | None = None,
+    ) -> None:
+        """
+        Accept connections until interrupted. Several workers are forked processes
+        with own SO_REUSEPORT sockets, so the kernel balances connections between them.
+        Without SO_REUSEPORT they accept from a single shared socket
+        """
+        if workers <= 1:
+            sock = socket.create_server((host, port), backlog=1024)
+            sock.setblocking(False)
+            if ready is not None:
+                ready(*sock.getsockname()[:2])
+            self._run_worker(sock)
+            return
+
+        if reuse_port is None:
+            reuse_port = hasattr(socket, "SO_REUSEPORT")
+
+        if reuse_port:
+            # Bound but not listening, only holds the port for the workers
+            sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((host, port))
+        else:
+            sock = socket.create_server((host, port), backlog=1024)
+            sock.setblocking(False)
+        address = sock.getsockname()[:2]
+
+        tmp_dir = None
+        if self.shared_cache is None and self._caching_level != CachingLevel.NONE:
+            tmp_dir = tempfile.mkdtemp(prefix="autostub-")
+            self.shared_cache = pathlib.Path(tmp_dir) / "models.sqlite"
+
+        ctx = multiprocessing.get_context("fork")
+        # Released by every worker once it listens
+        started = ctx.Semaphore(0)
+        processes = [
+            ctx.Process(
+                target=self._run_worker,
+                args=(sock, address if reuse_port else None, started),
+                daemon=True,
+            )
+            for _ in range(workers)
+        ]
+        # Workers are stopped in finally below when the server is terminated too
+        previous_handler = signal.signal(signal.SIGTERM, _raise_interrupt)
+        try:
+            for process in processes:
+                process.start()
+            for _ in processes:
+                while not started.acquire(timeout=0.1):
+                    if not all(process.is_alive() for process in processes):
+                        raise RuntimeError("Stub server worker failed to start")
+            if ready is not None:
+                ready(*address)
+
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                if process.pid is not None:
+                    process.join()
+            sock.close()
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _raise_interrupt(signum: int, frame: tp.Any) -> None:
+    raise KeyboardInterrupt
+
+
+def _print_ready(workers: int) -> tp.Callable[[str, int], None]:
+    def ready(host: str, port: int) -> None:
+        print(f"Serving on http://{host}:{port} with {workers} worker(s)", flush=True)
+
+    return ready
+
+
+def serve(
+    oapi_specs: tp.Sequence[str],
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: int = 1,
+    caching_level: CachingLevel = CachingLevel.ADVANCED,
+    cache_limits: CacheLimits | None = None,
+    codec: str | None = None,
+    spec_cache_dir: str | os.PathLike | None = None,
+    shared_cache: str | os.PathLike | None = None,
+    reuse_port: bool | None = None,
+    seed: int | None = None,
+    lazy: bool = False,
+) -> None:
+    if workers > 1 and sys.platform == "win32":
+        raise ValueError("Several workers need fork, which is not available on Windows")
+
+    server = StubServer(
+        oapi_specs,
+        caching_level,
+        cache_limits,
+        codec,
+        spec_cache_dir,
+        shared_cache,
+        seed,
+        lazy,
+    )
+    server.serve(
+        host, port, workers, ready=_print_ready(workers), reuse_port=reuse_port
+    )
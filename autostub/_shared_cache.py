@@ -0,0 +1,573 @@
+import dataclasses
+import json
+import os
+import pickle
+import sqlite3
+import time
+import typing as tp
+
+from frozendict import frozendict
+from openapi_parser import specification
+
+from autostub._cache import (
+    CacheLimits,
+    CacheStats,
+    CompositeCache,
+    ModelCache,
+    ModelCacheKey,
+    RequestCache,
+    RequestCacheKey,
+)
+
+# Generated model objects kept in a SQLite file, so that several processes
+# (stub server workers, test session workers) return the same objects
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    -- Ids are never reused, so processes can remember loaded values by them
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires REAL,
+    UNIQUE (model, key)
+);
+CREATE TABLE IF NOT EXISTS fields (
+    entry INTEGER NOT NULL REFERENCES entries (id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fields_lookup ON fields (model, field, value);
+CREATE INDEX IF NOT EXISTS fields_entry ON fields (entry);
+CREATE TABLE IF NOT EXISTS deleted (
+    model TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (model, key)
+);
+"""
+
+
+def _dump_value(value: tp.Any) -> str:
+    return json.dumps(value, sort_keys=True, default=repr)
+
+
+def _dump_key(storage_key: frozendict) -> str:
+    return _dump_value(sorted(storage_key.items()))
+
+
+def _load_key(data: str) -> frozendict:
+    return frozendict((field, value) for field, value in json.loads(data))
+
+
+# Name under which RequestCache entries are stored
+_REQUESTS = "<requests>"
+
+# Loaded values remembered by a process
+_LOADED_MEMO_SIZE = 4096
+
+
+class SqliteStore:
+    """
+    Connection to the store file, reopened after fork since connections can not be shared
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.path = os.fspath(path)
+        self._connection: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        # Entry id -> value loaded by this process
+        self._loaded: dict[int, tp.Any] = {}
+        # id(value) -> entry id of loaded values, entry id -> (encoder key, encoded value)
+        self._entries: dict[int, int] = {}
+        self._encoded: dict[int, tuple[tp.Hashable, bytes]] = {}
+
+    def __getstate__(self) -> dict[str, tp.Any]:
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict[str, tp.Any]) -> None:
+        self.__init__(state["path"])
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            # Generation is serialized by OAPISpec, prefill threads may use the connection too
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            # A cache, losing the tail of it on power loss is fine
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("PRAGMA foreign_keys = ON")
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+            self._loaded = {}
+            self._entries = {}
+            self._encoded = {}
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    @staticmethod
+    def _matching(model: str, key: frozendict) -> tuple[list[str], list[tp.Any]]:
+        # Query of ids of the model entries containing every (field, value) of the key
+        query = [
+            "SELECT id FROM entries "
+            "WHERE model = ? AND (expires IS NULL OR expires > ?)"
+        ]
+        args: list[tp.Any] = [model, time.time()]
+        for field, value in key.items():
+            query.append(
+                "AND id IN (SELECT entry FROM fields "
+                "WHERE model = ? AND field = ? AND value = ?)"
+            )
+            args.extend((model, field, _dump_value(value)))
+        return query, args
+
+    def search(self, model: str, key: frozendict) -> int | None:
+        """
+        Id of a random entry of the model containing every (field, value) of the key
+        """
+        if not key:
+            return None
+
+        query, args = self._matching(model, key)
+        query.append("ORDER BY random() LIMIT 1")
+
+        row = self.connection.execute(" ".join(query), args).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def delete(self, model: str, key: frozendict, remember: bool = True) -> int:
+        """
+        Remove entries matching the key, with remember also mark it as deleted.
+        Return the number of removed entries
+        """
+        if not key:
+            return 0
+
+        connection = self.connection
+        query, args = self._matching(model, key)
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            removed = connection.execute(
+                f"DELETE FROM entries WHERE id IN ({' '.join(query)})", args
+            ).rowcount
+            if remember:
+                connection.execute(
+                    "INSERT INTO deleted (model, key) VALUES (?, ?) "
+                    "ON CONFLICT (model, key) DO NOTHING",
+                    (model, _dump_key(key)),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return removed
+
+    def is_deleted(self, model: str, key: frozendict) -> bool:
+        if not key:
+            return False
+
+        row = self.connection.execute(
+            "SELECT 1 FROM deleted WHERE model = ? AND key = ?",
+            (model, _dump_key(key)),
+        ).fetchone()
+        return row is not None
+
+    def load(self, entry: int) -> tp.Any:
+        # Stored values never change, so the same object is returned again
+        # (and its encoded body is reused too)
+        if entry in self._loaded:
+            return self._loaded[entry]
+
+        row = self.connection.execute(
+            "SELECT value FROM entries WHERE id = ?", (entry,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        res = pickle.loads(row[0])
+        self._remember(entry, res)
+        return res
+
+    def _remember(self, entry: int, value: tp.Any) -> None:
+        self._loaded[entry] = value
+        self._entries[id(value)] = entry
+        if len(self._loaded) > _LOADED_MEMO_SIZE:
+            oldest = next(iter(self._loaded))
+            value_id = id(self._loaded.pop(oldest))
+            if self._entries.get(value_id) == oldest:
+                del self._entries[value_id]
+            self._encoded.pop(oldest, None)
+
+    def encoded(
+        self,
+        value: tp.Any,
+        encode: tp.Callable[[tp.Any], bytes],
+        encoder_key: tp.Hashable,
+    ) -> bytes | None:
+        """
+        encode(value) remembered as long as the loaded value, None if it was not loaded
+        """
+        entry = self._entries.get(id(value))
+        if entry is None:
+            return None
+
+        memo = self._encoded.get(entry)
+        if memo is None or memo[0] != encoder_key:
+            memo = self._encoded[entry] = (encoder_key, encode(value))
+        return memo[1]
+
+    def put(
+        self,
+        model: str,
+        storage_key: frozendict,
+        value: tp.Any,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        match: frozendict | None = None,
+        replace: bool = False,
+    ) -> tuple[int, int]:
+        """
+        Store the value unless another process did it first, either for the same storage key
+        or for the lookup key match. With replace the value stored for the key is replaced.
+        Return id of the entry stored for the key and the number of evicted entries
+        """
+        connection = self.connection
+        now = time.time()
+        evicted = 0
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if ttl is not None:
+                evicted += connection.execute(
+                    "DELETE FROM entries WHERE model = ? AND expires <= ?",
+                    (model, now),
+                ).rowcount
+
+            row = None
+            if match:
+                # Generated with other values by another process after the same missed lookup
+                query, args = self._matching(model, match)
+                query.append("ORDER BY id LIMIT 1")
+                row = connection.execute(" ".join(query), args).fetchone()
+
+            if replace:
+                # A new entry rather than an updated one, loaded values stay valid by id
+                connection.execute(
+                    "DELETE FROM entries WHERE model = ? AND key = ?",
+                    (model, _dump_key(storage_key)),
+                )
+
+            inserted = False
+            if row is not None:
+                entry = row[0]
+            else:
+                entry, inserted = self._insert(
+                    model, storage_key, value, None if ttl is None else now + ttl
+                )
+
+            if max_entries is not None:
+                # The oldest stored entries go first
+                evicted += connection.execute(
+                    "DELETE FROM entries WHERE model = ? AND id NOT IN "
+                    "(SELECT id FROM entries WHERE model = ? ORDER BY id DESC LIMIT ?)",
+                    (model, model, max_entries),
+                ).rowcount
+
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        if inserted:
+            self._remember(entry, value)
+        return entry, evicted
+
+    def _insert(
+        self, model: str, storage_key: frozendict, value: tp.Any, expires: float | None
+    ) -> tuple[int, bool]:
+        connection = self.connection
+        cursor = connection.execute(
+            "INSERT INTO entries (model, key, value, expires) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (model, key) DO NOTHING",
+            (
+                model,
+                _dump_key(storage_key),
+                pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+                expires,
+            ),
+        )
+        if cursor.rowcount != 1:
+            entry = connection.execute(
+                "SELECT id FROM entries WHERE model = ? AND key = ?",
+                (model, _dump_key(storage_key)),
+            ).fetchone()[0]
+            return entry, False
+
+        entry = cursor.lastrowid
+        connection.executemany(
+            "INSERT INTO fields (entry, model, field, value) VALUES (?, ?, ?, ?)",
+            [
+                (entry, model, field, _dump_value(field_value))
+                for field, field_value in storage_key.items()
+            ],
+        )
+        # Same as ModelCache, only deletions by the whole key or one field are undone
+        connection.executemany(
+            "DELETE FROM deleted WHERE model = ? AND key = ?",
+            [(model, _dump_key(storage_key))]
+            + [
+                (model, _dump_key(frozendict({field: field_value})))
+                for field, field_value in storage_key.items()
+            ],
+        )
+        return entry, True
+
+    def all(self, model: str) -> dict[frozendict, tp.Any]:
+        rows = self.connection.execute(
+            "SELECT key, value FROM entries "
+            "WHERE model = ? AND (expires IS NULL OR expires > ?) ORDER BY id",
+            (model, time.time()),
+        )
+        return {_load_key(key): pickle.loads(value) for key, value in rows}
+
+    def count(self, model: str) -> int:
+        return self.connection.execute(
+            "SELECT count(*) FROM entries "
+            "WHERE model = ? AND (expires IS NULL OR expires > ?)",
+            (model, time.time()),
+        ).fetchone()[0]
+
+    def clear(self) -> None:
+        self.connection.execute("DELETE FROM entries")
+        self.connection.execute("DELETE FROM deleted")
+
+
+class SharedModelCache(ModelCache):
+    # Objects of one model in a SqliteStore. Keys are resolved the same way as in ModelCache
+    def __init__(
+        self,
+        model_description: specification.Object | None,
+        store: SqliteStore,
+        model_name: str,
+        max_entries: int | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        super().__init__(model_description)
+        self._store = store
+        self._model_name = model_name
+        self._shared_max_entries = max_entries
+        self._shared_ttl = ttl
+
+    def has(self, key: ModelCacheKey) -> bool:
+        start = time.perf_counter()
+        res = self._store.search(self._model_name, self._resolve_key(key)) is not None
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
+
+    def put(self, key: ModelCacheKey, value: tp.Any) -> None:
+        self._put(key, value)
+
+    def put_first(self, key: ModelCacheKey, value: tp.Any) -> tp.Any:
+        # An object stored for the same lookup meanwhile wins too
+        lookup = self._resolve_key(dataclasses.replace(key, put_fields=None))
+        return self._put(key, value, lookup)
+
+    def _put(
+        self, key: ModelCacheKey, value: tp.Any, match: frozendict | None = None
+    ) -> tp.Any:
+        self._stats.puts += 1
+        entry, evicted = self._store.put(
+            self._model_name,
+            self._resolve_key(key),
+            value,
+            ttl=self._shared_ttl,
+            max_entries=self._shared_max_entries,
+            match=match,
+        )
+        self._stats.evictions += evicted
+        res = self._store.load(entry)
+        # Evicted right away by the limits
+        return value if res is None else res
+
+    def get(self, key: ModelCacheKey) -> tp.Any:
+        start = time.perf_counter()
+        entry = self._store.search(self._model_name, self._resolve_key(key))
+        res = None
+        if entry is None:
+            self._stats.misses += 1
+        else:
+            self._stats.hits += 1
+            res = self._store.load(entry)
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
+
+    def delete(self, key: ModelCacheKey, remember: bool = True) -> int:
+        return self._store.delete(self._model_name, self._resolve_key(key), remember)
+
+    def _stored_encoded(
+        self,
+        value: tp.Any,
+        encode: tp.Callable[[tp.Any], bytes],
+        encoder_key: tp.Hashable,
+    ) -> bytes | None:
+        return self._store.encoded(value, encode, encoder_key)
+
+    def is_deleted(self, key: ModelCacheKey) -> bool:
+        return self._store.is_deleted(self._model_name, self._resolve_key(key))
+
+    def all(self) -> dict:
+        return self._store.all(self._model_name)
+
+    def stats(self) -> CacheStats:
+        return dataclasses.replace(
+            self._stats, entries=self._store.count(self._model_name)
+        )
+
+
+class SharedRequestCache(RequestCache):
+    """
+    RequestCache keeping responses in a SQLite file shared by several processes.
+    max_entries and ttl are supported
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        limits: CacheLimits | None = None,
+        namespace: str = "",
+    ) -> None:
+        limits = limits or CacheLimits()
+        if limits.max_bytes is not None:
+            raise ValueError("Shared cache supports only max_entries and ttl")
+
+        super().__init__()
+        self._store = SqliteStore(path)
+        self._model_name = namespace + _REQUESTS
+        self._shared_max_entries = limits.max_entries
+        self._shared_ttl = limits.ttl
+
+    @property
+    def store(self) -> SqliteStore:
+        return self._store
+
+    def has(self, key: RequestCacheKey) -> bool:
+        start = time.perf_counter()
+        storage_key = self._resolve_key(key).key
+        res = self._store.search(self._model_name, storage_key) is not None
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
+
+    def put(self, key: RequestCacheKey, value: tp.Any) -> None:
+        # Overwrites, the same as RequestCache
+        self._put(key, value, replace=True)
+
+    def put_first(self, key: RequestCacheKey, value: tp.Any) -> tp.Any:
+        return self._put(key, value, replace=False)
+
+    def _put(self, key: RequestCacheKey, value: tp.Any, replace: bool) -> tp.Any:
+        self._stats.puts += 1
+        entry, evicted = self._store.put(
+            self._model_name,
+            self._resolve_key(key).key,
+            value,
+            ttl=self._shared_ttl,
+            max_entries=self._shared_max_entries,
+            replace=replace,
+        )
+        self._stats.evictions += evicted
+        res = self._store.load(entry)
+        # Evicted right away by the limits
+        return value if res is None else res
+
+    def get(self, key: RequestCacheKey) -> tp.Any:
+        start = time.perf_counter()
+        entry = self._store.search(self._model_name, self._resolve_key(key).key)
+        res = None
+        if entry is None:
+            self._stats.misses += 1
+        else:
+            self._stats.hits += 1
+            res = self._store.load(entry)
+        self._stats.lookup_time += time.perf_counter() - start
+        return res
+
+    def _stored_encoded(
+        self,
+        value: tp.Any,
+        encode: tp.Callable[[tp.Any], bytes],
+        encoder_key: tp.Hashable,
+    ) -> bytes | None:
+        return self._store.encoded(value, encode, encoder_key)
+
+    def all(self) -> dict:
+        return self._store.all(self._model_name)
+
+    def stats(self) -> CacheStats:
+        return dataclasses.replace(
+            self._stats, entries=self._store.count(self._model_name)
+        )
+
+
+class SharedCompositeCache(CompositeCache):
+    """
+    CompositeCache keeping objects in a SQLite file shared by several processes.
+    Only per model limits and ttl are supported
+    """
+
+    def __init__(
+        self,
+        models: tp.Mapping[str, specification.Schema],
+        path: str | os.PathLike,
+        limits: CacheLimits | None = None,
+        namespace: str = "",
+    ) -> None:
+        limits = limits or CacheLimits()
+        if limits.max_entries is not None or limits.max_bytes is not None:
+            raise ValueError("Shared cache supports only max_entries_per_model and ttl")
+
+        super().__init__(models, limits)
+        # Entries are counted by the store, not in process
+        self._usage = None
+        self._store = SqliteStore(path)
+        # Keeps models of different specs in the same file apart
+        self._namespace = namespace
+
+    @property
+    def store(self) -> SqliteStore:
+        return self._store
+
+    def _new_model_cache(self, model_name: str) -> SharedModelCache:
+        return SharedModelCache(
+            self._models[model_name],
+            self._store,
+            self._namespace + model_name,
+            max_entries=self._limits.max_entries_per_model,
+            ttl=self._limits.ttl,
+        )
+
+    def has_model(self, model: str) -> bool:
+        # Other processes could have stored the model already
+        if model in self._models and model not in self._storage:
+            self._storage[model] = self._new_model_cache(model)
+        return model in self._storage
+
+    def stats(self) -> CacheStats:
+        res = super().stats()
+        # Models never used in this process can still have entries
+        for model_name in self._models:
+            if model_name not in self._storage:
+                entries = self._store.count(self._namespace + model_name)
+                if entries:
+                    res.entries += entries
+                    res.entries_by_model[model_name] = entries
+        return res
@@ -0,0 +1,126 @@
+import hashlib
+import importlib.metadata
+import os
+import pathlib
+import pickle
+import tempfile
+
+from openapi_parser import specification
+
+from autostub import _lazy_spec, _named_spec
+from autostub._cache import NO_CACHE
+from autostub._generator import OAPISpec
+
+# Bump when pickled entity tree layout changes
+_FORMAT_VERSION = 5
+# Pickled specifications are made of parser classes, other versions may not load them
+_PARSER_VERSION = importlib.metadata.version("openapi3-parser")
+
+type CachedSpec = tuple[specification.Specification, OAPISpec]
+
+
+class SpecCache:
+    # Keeps parsed specifications and their entity trees by the hash of spec contents.
+    # Only the top-level document is hashed, so specs with external $refs are not kept
+    def __init__(self) -> None:
+        self._memory: dict[str, CachedSpec] = {}
+        # Digests of specs with external $refs, parsed on every load
+        self._uncached: set[str] = set()
+
+    @staticmethod
+    def _digest(content: bytes, lazy: bool = False) -> str:
+        hasher = hashlib.sha256()
+        hasher.update(
+            f"{_FORMAT_VERSION}:{_PARSER_VERSION}:{'lazy' if lazy else 'eager'}:".encode()
+        )
+        hasher.update(content)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _build(
+        oapi_spec: str, document: dict | None = None, lazy: bool = False
+    ) -> CachedSpec:
+        # Other documents are resolved by the parser
+        if lazy and not _lazy_spec.has_external_refs(document):
+            spec = _lazy_spec.load(document)
+            return spec, OAPISpec(spec, NO_CACHE)
+
+        spec = _named_spec.parse(oapi_spec)
+        return spec, OAPISpec(spec, NO_CACHE)
+
+    @staticmethod
+    def _read_disk(path: pathlib.Path) -> CachedSpec | None:
+        try:
+            with path.open("rb") as f:
+                return pickle.load(f)
+        except Exception:
+            # Missing, broken or incompatible entry, it will be rewritten
+            return None
+
+    @staticmethod
+    def _write_disk(path: pathlib.Path, value: CachedSpec) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, path)
+        except Exception:
+            pathlib.Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+    def load(
+        self,
+        oapi_spec: str,
+        cache_dir: str | os.PathLike | None = None,
+        lazy: bool = False,
+    ) -> CachedSpec:
+        """
+        Parse the spec or take it from memory or cache_dir if its contents did not change.
+        With lazy, paths and schemas are built on first use and the spec is not validated.
+        Only local files are kept and loaded lazily
+        """
+        try:
+            content = pathlib.Path(oapi_spec).read_bytes()
+        except OSError:
+            if lazy:
+                raise ValueError(
+                    f"Only local spec files are loaded lazily: {oapi_spec}"
+                )
+            # Not a local file (i.e URL), nothing to hash
+            return self._build(oapi_spec)
+
+        digest = self._digest(content, lazy)
+
+        if digest in self._memory:
+            return self._memory[digest]
+        if digest in self._uncached:
+            return self._build(
+                oapi_spec, _lazy_spec.parse_document(content, oapi_spec), lazy
+            )
+
+        result = None
+        disk_path = None
+        if cache_dir is not None:
+            disk_path = pathlib.Path(cache_dir) / f"{digest}.pickle"
+            result = self._read_disk(disk_path)
+
+        if result is None:
+            document = _lazy_spec.parse_document(content, oapi_spec)
+            result = self._build(oapi_spec, document, lazy)
+            if _lazy_spec.has_external_refs(document):
+                # Changes in the referenced documents would not change the digest
+                self._uncached.add(digest)
+                return result
+            if disk_path is not None:
+                self._write_disk(disk_path, result)
+
+        self._memory[digest] = result
+        return result
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self._uncached.clear()
+
+
+SPEC_CACHE = SpecCache()
@@ -0,0 +1,68 @@
+import collections.abc
+import typing as tp
+
+from frozendict import frozendict
+
+from autostub._schemas import INVALID, GeneratableEntity
+
+# Parameters and bodies of an operation are checked and converted to typed values
+# in one pass. Parsers of all entities are resolved when the operation is built
+
+# validate(parameters) -> typed parameters, None if the call does not match the operation
+type ParametersValidator = tp.Callable[[dict[str, tp.Any]], frozendict | None]
+# validate(body, path_params) -> typed body, INVALID if it does not match the operation
+type BodyValidator = tp.Callable[[tp.Any, tp.Mapping[str, tp.Any]], tp.Any]
+
+
+def compile_parameters(
+    parameters: dict[str, GeneratableEntity], required: set[str]
+) -> ParametersValidator:
+    parsers = {name: entity.parser for name, entity in parameters.items()}
+    required = frozenset(required)
+
+    def validate(params: dict[str, tp.Any]) -> frozendict | None:
+        if not required.issubset(params):
+            return None
+
+        for name, value in params.items():
+            parse = parsers.get(name)
+            # Parameters not described by the operation are passed as they are
+            if parse is not None:
+                value = parse(value)
+                if value is INVALID:
+                    return None
+                params[name] = value
+        return frozendict(params)
+
+    return validate
+
+
+def compile_body(entity: GeneratableEntity | None, required: set[str]) -> BodyValidator:
+    """
+    Validator of JSON object bodies. Required fields can be given by path parameters
+    instead, i.e. id of PUT /pets/{id}
+    """
+    if entity is None:
+        # Not a JSON object, nothing to check
+        return lambda body, path_params: body
+
+    parsers = {name: prop.parser for name, prop in entity.properties.items()}
+
+    def validate(body: tp.Any, path_params: tp.Mapping[str, tp.Any]) -> tp.Any:
+        if not isinstance(body, collections.abc.Mapping):
+            return INVALID
+        for name in required:
+            if name not in body and name not in path_params:
+                return INVALID
+
+        res = {}
+        for name, value in body.items():
+            parse = parsers.get(name)
+            if parse is not None:
+                value = parse(value)
+                if value is INVALID:
+                    return INVALID
+            res[name] = value
+        return frozendict(res)
+
+    return validate
@@ -1,13 +1,32 @@
 import typing as tp
 
+import frozendict
+
+from autostub._codec import DEFAULT_CODEC, JsonCodec
+from autostub._dispatch import candidates
+from autostub._profile import Stage, profiled_call, stage
 from autostub._response import _BaseHTTPResponse
 from autostub._request import Request
 
 
 class BaseAdapter:
+    # Used for request bodies, response bodies are encoded with the codec of the stub
+    codec: JsonCodec = DEFAULT_CODEC
+
     def __init__(self):
         pass
 
+    @classmethod
+    def decode_body(cls, body: tp.Any) -> tp.Any:
+        if isinstance(body, (str, bytes, bytearray)):
+            try:
+                body = cls.codec.loads(body)
+            except ValueError:
+                return body
+        if isinstance(body, dict):
+            return frozendict.frozendict(body)
+        return body
+
     @staticmethod
     def from_response(resp: _BaseHTTPResponse) -> tp.Any:
         raise NotImplementedError
@@ -18,10 +37,21 @@ class BaseAdapter:
 
     @classmethod
     def mock(cls, servers, *args, **kwargs) -> tp.Any:
-        response = None
         request = cls.to_request(*args, **kwargs)
-        for s in servers.values():
-            response = s(request)
-            print(response)
-            if response is not None:
-                return cls.from_response(response)
+        for s in candidates(servers, request.url):
+            with profiled_call(getattr(s, "profiler", None)):
+                response = s(request)
+                if response is not None:
+                    with stage(Stage.SERIALIZATION):
+                        return cls.from_response(response)
+
+    @classmethod
+    async def amock(cls, servers, *args, **kwargs) -> tp.Any:
+        request = cls.to_request(*args, **kwargs)
+        # Servers may be stubbed or unstubbed while awaiting, candidates are a snapshot
+        for s in candidates(servers, request.url):
+            with profiled_call(getattr(s, "profiler", None)):
+                response = await s.acall(request)
+                if response is not None:
+                    with stage(Stage.SERIALIZATION):
+                        return cls.from_response(response)
@@ -0,0 +1,134 @@
+import functools
+import typing as tp
+
+import httpx
+import frozendict
+
+from autostub._request import Request
+from .base import BaseAdapter
+from autostub._response import _BaseHTTPResponse
+
+
+class HttpxAdapter(BaseAdapter):
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def from_response(resp: _BaseHTTPResponse) -> httpx.Response:
+        # Values are generated by the header schemas, i.e. integers
+        headers = {name: str(value) for name, value in resp.headers.items()}
+        if resp.content_type and "content-type" not in {k.lower() for k in headers}:
+            content_type = resp.content_type
+            if resp.encoding:
+                content_type += f"; charset={resp.encoding}"
+            headers["Content-Type"] = content_type
+
+        return httpx.Response(resp.status_code, headers=headers, content=resp.encode())
+
+    @classmethod
+    def to_request(cls, request: httpx.Request) -> Request:
+        method = request.method.lower()
+        url = str(request.url.copy_with(query=None)).lower()
+        params = frozendict.frozendict(request.url.params)
+        body = (
+            cls.decode_body(request.content)
+            if request.content
+            else frozendict.frozendict()
+        )
+        headers = frozendict.frozendict(request.headers)
+        return Request(url, method, body, params, headers)
+
+
+class StubTransport(httpx.BaseTransport):
+    """
+    Answers from stubbed servers, other requests go to the transport made by transport_factory.
+    The real transport is created only when needed, so stubbed calls never open connections
+    """
+
+    def __init__(
+        self,
+        servers: dict[str, tp.Any],
+        transport_factory: tp.Callable[[], httpx.BaseTransport] = httpx.HTTPTransport,
+    ) -> None:
+        self._servers = servers
+        self._transport_factory = transport_factory
+        self._transport: httpx.BaseTransport | None = None
+
+    def _get_transport(self) -> httpx.BaseTransport:
+        if self._transport is None:
+            self._transport = self._transport_factory()
+        return self._transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self._servers:
+            request.read()
+            response = HttpxAdapter.mock(self._servers, request)
+            if response is not None:
+                return response
+
+        return self._get_transport().handle_request(request)
+
+    def close(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+
+
+class AsyncStubTransport(httpx.AsyncBaseTransport):
+    """
+    Async counterpart of StubTransport. Stubbed responses are generated in a worker thread,
+    keeping the event loop free
+    """
+
+    def __init__(
+        self,
+        servers: dict[str, tp.Any],
+        transport_factory: tp.Callable[
+            [], httpx.AsyncBaseTransport
+        ] = httpx.AsyncHTTPTransport,
+    ) -> None:
+        self._servers = servers
+        self._transport_factory = transport_factory
+        self._transport: httpx.AsyncBaseTransport | None = None
+
+    def _get_transport(self) -> httpx.AsyncBaseTransport:
+        if self._transport is None:
+            self._transport = self._transport_factory()
+        return self._transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self._servers:
+            await request.aread()
+            response = await HttpxAdapter.amock(self._servers, request)
+            if response is not None:
+                return response
+
+        return await self._get_transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        if self._transport is not None:
+            await self._transport.aclose()
+
+
+def _transport(servers, *args, **kwargs) -> StubTransport:
+    return StubTransport(
+        servers, functools.partial(httpx.HTTPTransport, *args, **kwargs)
+    )
+
+
+def _async_transport(servers, *args, **kwargs) -> AsyncStubTransport:
+    return AsyncStubTransport(
+        servers, functools.partial(httpx.AsyncHTTPTransport, *args, **kwargs)
+    )
+
+
+# Clients created while stubbed get stub transports instead of the default ones
+ADAPTER_MAP = [
+    {
+        "replace_name": "httpx._client.HTTPTransport",
+        "replace_with": _transport,
+    },
+    {
+        "replace_name": "httpx._client.AsyncHTTPTransport",
+        "replace_with": _async_transport,
+    },
+]
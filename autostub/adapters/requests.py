@@ -1,5 +1,4 @@
 import io
-import json
 
 import requests
 import frozendict
@@ -20,32 +19,37 @@ class RequestsAdapter(BaseAdapter):
         r.status_code = resp.status_code
 
         r.encoding = resp.encoding
-        r.raw = io.BytesIO(json.dumps(resp.content).encode(r.encoding))
+        r.raw = io.BytesIO(resp.encode())
 
         for k, v in resp.headers.items():
             r.headers[k] = v
 
         return r
 
-    @staticmethod
-    def to_request(*args, **kwargs) -> Request:
+    @classmethod
+    def to_request(cls, *args, **kwargs) -> Request:
         method = kwargs.get("method") or args[0]
         url = (kwargs.get("url") or args[1]).lower()
         params = frozendict.frozendict(kwargs.get("params") or {})
-        body = frozendict.frozendict(kwargs.get("data") or {})
+        body = kwargs.get("json")
+        if body is None:
+            body = kwargs.get("data")
+        body = cls.decode_body(body) if body is not None else frozendict.frozendict()
         headers = frozendict.frozendict(kwargs.get("headers") or {})
         return Request(url, method, body, params, headers)
 
     @classmethod
     def mock(cls, servers, *args, **kwargs) -> requests.Response:
         inner_result = super().mock(servers, *args, **kwargs)
-        if inner_result:
+        if inner_result is not None:
             return inner_result
 
         return requests.request(*args, **kwargs)
 
 
-ADAPTER_MAP = {
-    "replace_name": "requests.api.request",  # XXX
-    "replace_with": RequestsAdapter.mock,
-}
+ADAPTER_MAP = [
+    {
+        "replace_name": "requests.api.request",  # XXX
+        "replace_with": RequestsAdapter.mock,
+    },
+]
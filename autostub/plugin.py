@@ -1,46 +1,98 @@
-from typing import Any
+from typing import Any, Iterator
+import contextlib
 import importlib
 import collections
+import pathlib
+import shutil
+import tempfile
+import threading
 
 from autostub._generator import OAPISpec
-from autostub._cache import CachingLevel, CacheFactory
-import openapi_parser as oapi_parser
+from autostub._cache import CachingLevel, CacheFactory, CacheLimits, CacheStats
+from autostub._spec_cache import SPEC_CACHE
+from autostub._codec import get_codec
+from autostub._dispatch import ServerMap
+from autostub._profile import Profiler
 
 import pytest
 import pytest_mock
 
+SUPPORTED_MODULES = {
+    "requests": "autostub.adapters.requests",
+    "httpx": "autostub.adapters.httpx",
+}
 
-SUPPORTED_MODULES = {"requests": "autostub.adapters.requests"}
+# Cache statistics of finished stubs, by spec
+SESSION_CACHE_STATS = pytest.StashKey[dict[str, CacheStats]]()
+# Stage statistics of stubbed calls of the session, by operation
+SESSION_PROFILE = pytest.StashKey[Profiler]()
+# Directory of the cache shared by the whole session, pytest-xdist workers included
+SHARED_CACHE_DIR = pytest.StashKey[pathlib.Path]()
+# Set if this process made the directory and has to remove it
+SHARED_CACHE_OWNER = pytest.StashKey[bool]()
+
+_WORKER_SHARED_CACHE_DIR = "autostub_shared_cache_dir"
 
 
 class AutoStub:
     def __init__(self, config: Any) -> None:
-        self._servers: collections.defaultdict[str, dict[str, OAPISpec]] = (
-            collections.defaultdict(dict)
+        self._servers: collections.defaultdict[str, ServerMap] = (
+            collections.defaultdict(ServerMap)
         )
         self._config = config
-        self._mock: dict[str, pytest_mock.MockType | None] = {}
+        self._mock: dict[str, list[pytest_mock.MockType]] = {}
         self._mocker = pytest_mock.MockFixture(self._config)
+        self._spec_cache_dir = self._get_spec_cache_dir()
+        self._shared_cache = self._get_shared_cache()
+        # Records every stubbed call if the session is profiled
+        self._profiler = self._get_profiler()
+        # Background pre-generation of stubbed specs, by (module, spec)
+        self._prefill: dict[
+            tuple[str, str], tuple[threading.Thread, threading.Event]
+        ] = {}
+
+        # Adapters are imported on first use, so only stubbed libraries have to be installed
+        self.adapters_map: dict[str, list[dict[str, Any]]] = {}
+
+    def _get_shared_cache(self) -> pathlib.Path | None:
+        if self._config is None:
+            return None
+
+        shared_dir = self._config.stash.get(SHARED_CACHE_DIR, None)
+        if shared_dir is None:
+            return None
+        return shared_dir / "cache.sqlite"
+
+    def _get_profiler(self) -> Profiler | None:
+        if self._config is None or not self._config.getoption(
+            "autostub_profile", False
+        ):
+            return None
+        return Profiler()
+
+    def _get_spec_cache_dir(self):
+        if self._config is None:
+            return None
 
-        self.adapters_map = self._get_adapter_map()
+        value = self._config.getini("autostub_spec_cache_dir")
+        if not value:
+            return None
+        return self._config.rootpath / value
 
-    @staticmethod
-    def _get_adapter_map():
-        a_map = {}
-        for m_name, path in SUPPORTED_MODULES.items():
+    def _get_adapter(self, m_name: str) -> list[dict[str, Any]]:
+        if m_name not in self.adapters_map:
             try:
-                module = importlib.import_module(path)
+                module = importlib.import_module(SUPPORTED_MODULES[m_name])
                 adapter = getattr(module, "ADAPTER_MAP")
-            except ImportError:
+            except (ImportError, KeyError):
                 raise Exception(f"Adapter for {m_name} not found")
             else:
-                a_map[m_name] = adapter
-        return a_map
+                self.adapters_map[m_name] = adapter
+        return self.adapters_map[m_name]
 
     def _stop_mock_if_needed(self, module):
-        if self._mock.get(module):
-            self._mocker.stop(self._mock[module])
-            self._mock[module] = None
+        for mock in self._mock.pop(module, []):
+            self._mocker.stop(mock)
 
     def _generate_mock(self, module, source_mock):
         def func(*args, **kwargs):
@@ -51,29 +103,231 @@ class AutoStub:
     def _create_mock(self, module: str | None = None):
         self._stop_mock_if_needed(module)
         if module:
-            replace_name = self.adapters_map[module]["replace_name"]
-            replace_with = self._generate_mock(
-                module, self.adapters_map[module]["replace_with"]
-            )
-            self._mock[module] = self._mocker.patch(replace_name, new=replace_with)
+            self._mock[module] = [
+                self._mocker.patch(
+                    patch["replace_name"],
+                    new=self._generate_mock(module, patch["replace_with"]),
+                )
+                for patch in self._get_adapter(module)
+            ]
         return self._mock
 
-    def stub(self, oapi_spec: str, module: str, caching_level: CachingLevel):
+    def stub(
+        self,
+        oapi_spec: str,
+        module: str,
+        caching_level: CachingLevel,
+        cache_limits: CacheLimits | None = None,
+        codec: str | None = None,
+        seed: int | None = None,
+        prefill: int = 0,
+        lazy: bool = False,
+    ):
         """
-        Generate requests.get stub and patch the function
+        Generate requests.get stub and patch the function.
+        codec is a JSON library name for response bodies, the fastest installed one if not set.
+        With seed the same request always gets the same response, even without caching.
+        With prefill that many objects of every model are generated in background.
+        With lazy, paths and schemas of a local spec file are built on the first call using them
         """
-        spec = oapi_parser.parse(oapi_spec)
-        self._servers[module][oapi_spec] = OAPISpec(
-            spec, CacheFactory.get_cache(caching_level, spec.schemas)
+        self._stop_prefill(module, oapi_spec)
+        spec, oapi_spec_entity = SPEC_CACHE.load(oapi_spec, self._spec_cache_dir, lazy)
+        server = self._servers[module][oapi_spec] = oapi_spec_entity.with_cache(
+            CacheFactory.get_cache(
+                caching_level,
+                spec.schemas,
+                cache_limits,
+                shared_path=self._shared_cache,
+                namespace=f"{oapi_spec}:",
+            ),
+            get_codec(codec),
+            seed,
         )
+        server.profiler = self._profiler
+        if prefill:
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=server.prefill,
+                args=(prefill, stop),
+                name=f"autostub-prefill-{oapi_spec}",
+                daemon=True,
+            )
+            self._prefill[(module, oapi_spec)] = (thread, stop)
+            thread.start()
         return self._create_mock(module)
 
+    def wait_prefill(self, timeout: float | None = None) -> bool:
+        """
+        Wait for background pre-generation to finish. Return False on timeout
+        """
+        for thread, _ in list(self._prefill.values()):
+            thread.join(timeout)
+            if thread.is_alive():
+                return False
+        return True
+
+    @contextlib.contextmanager
+    def profile(self) -> Iterator[Profiler]:
+        """
+        Record wall time and allocated memory blocks of every stage (routing, validation,
+        generation, cache and serialization) of calls stubbed inside the block, by operation
+        """
+        outer = self._profiler
+        profiler = self._profiler = Profiler()
+        self._set_profiler(profiler)
+        try:
+            yield profiler
+        finally:
+            self._profiler = outer
+            self._set_profiler(outer)
+            # Calls of the block are part of the session report too
+            if outer is not None:
+                outer.merge(profiler)
+
+    def _set_profiler(self, profiler: Profiler | None):
+        for servers in self._servers.values():
+            for server in servers.values():
+                server.profiler = profiler
+
+    def _stop_prefill(self, module: str, oapi_spec: str):
+        thread, stop = self._prefill.pop((module, oapi_spec), (None, None))
+        if thread is not None:
+            stop.set()
+            thread.join()
+
     def unstub(self, oapi_spec: str, module):
-        self._servers[module].pop(oapi_spec, None)
+        self._stop_prefill(module, oapi_spec)
+        server = self._servers[module].pop(oapi_spec, None)
+        if server is not None:
+            self._record_stats(oapi_spec, server)
         return self._create_mock(module)
 
+    def cache_stats(
+        self, oapi_spec: str | None = None, module: str | None = None
+    ) -> CacheStats:
+        """
+        Sum up cache statistics of active stubs, optionally only for given spec or module
+        """
+        res = CacheStats()
+        for m_name, servers in self._servers.items():
+            if module is not None and m_name != module:
+                continue
+            for spec_name, server in servers.items():
+                if oapi_spec is None or spec_name == oapi_spec:
+                    res += server.cache.stats()
+        return res
+
+    def _record_stats(self, oapi_spec: str, server: OAPISpec):
+        if self._config is None:
+            return
+
+        session_stats = self._config.stash.setdefault(SESSION_CACHE_STATS, {})
+        session_stats[oapi_spec] = (
+            session_stats.get(oapi_spec, CacheStats()) + server.cache.stats()
+        )
+
     def stop(self):
+        for module, oapi_spec in list(self._prefill):
+            self._stop_prefill(module, oapi_spec)
+        for servers in self._servers.values():
+            for oapi_spec, server in servers.items():
+                self._record_stats(oapi_spec, server)
+            # Stub transports of httpx clients may still refer to these
+            servers.clear()
+        self._servers.clear()
         self._mocker.stopall()
+        self._record_profile()
+
+    def _record_profile(self):
+        if self._config is None or self._profiler is None:
+            return
+
+        session_profile = self._config.stash.setdefault(SESSION_PROFILE, Profiler())
+        session_profile.merge(self._profiler)
+        self._profiler = Profiler()
+
+
+def pytest_addoption(parser: pytest.Parser):
+    parser.addini(
+        "autostub_spec_cache_dir",
+        "Directory (relative to rootdir) to keep parsed OpenAPI specs between sessions",
+        default="",
+    )
+    parser.addoption(
+        "--autostub-shared-cache",
+        action="store_true",
+        default=False,
+        help="Share generated data between all tests of the session, "
+        "pytest-xdist workers included",
+    )
+    parser.addoption(
+        "--autostub-profile",
+        action="store_true",
+        default=False,
+        help="Print time and allocations of every stage of stubbed calls "
+        "by operation in the terminal summary",
+    )
+    parser.addoption(
+        "--autostub-cache-stats",
+        action="store_true",
+        default=False,
+        help="Print autostub cache statistics in the terminal summary",
+    )
+
+
+def pytest_configure(config: pytest.Config):
+    if not config.getoption("autostub_shared_cache"):
+        return
+
+    # pytest-xdist workers get the directory made by the controller
+    workerinput = getattr(config, "workerinput", None)
+    if workerinput is not None and _WORKER_SHARED_CACHE_DIR in workerinput:
+        config.stash[SHARED_CACHE_DIR] = pathlib.Path(
+            workerinput[_WORKER_SHARED_CACHE_DIR]
+        )
+        return
+
+    config.stash[SHARED_CACHE_DIR] = pathlib.Path(tempfile.mkdtemp(prefix="autostub-"))
+    config.stash[SHARED_CACHE_OWNER] = True
+
+
+def pytest_unconfigure(config: pytest.Config):
+    if config.stash.get(SHARED_CACHE_OWNER, False):
+        shutil.rmtree(config.stash[SHARED_CACHE_DIR], ignore_errors=True)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node: Any):
+    shared_dir = node.config.stash.get(SHARED_CACHE_DIR, None)
+    if shared_dir is not None:
+        node.workerinput[_WORKER_SHARED_CACHE_DIR] = str(shared_dir)
+
+
+def pytest_terminal_summary(terminalreporter: Any, exitstatus: int, config: Any):
+    session_profile = config.stash.get(SESSION_PROFILE, None)
+    if session_profile is not None and session_profile.report():
+        terminalreporter.section("autostub profile")
+        for line in session_profile.format():
+            terminalreporter.write_line(line)
+
+    if not config.getoption("autostub_cache_stats"):
+        return
+
+    session_stats = config.stash.get(SESSION_CACHE_STATS, {})
+    if not session_stats:
+        return
+
+    terminalreporter.section("autostub cache statistics")
+    for oapi_spec, stats in session_stats.items():
+        lookups = stats.hits + stats.misses
+        hit_rate = stats.hits / lookups * 100 if lookups else 0.0
+        terminalreporter.write_line(
+            f"{oapi_spec}: hits={stats.hits} misses={stats.misses} "
+            f"({hit_rate:.1f}% hit rate) puts={stats.puts} "
+            f"evictions={stats.evictions} lookup_time={stats.lookup_time:.4f}s"
+        )
+        for model, entries in sorted(stats.entries_by_model.items()):
+            terminalreporter.write_line(f"    {model}: {entries} entries")
 
 
 def _autostub(pytestconfig: Any):
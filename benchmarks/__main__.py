@@ -0,0 +1,102 @@
+import argparse
+import fnmatch
+import pathlib
+import sys
+import tempfile
+import typing as tp
+
+from benchmarks._runner import Result, compare, format_time, load, measure, save
+from benchmarks._suites import SUITES, Context
+
+DEFAULT_SIZES = "10,100,1000"
+THRESHOLD = 0.25
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Measure autostub performance on synthetic OpenAPI specs",
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="Comma-separated numbers of spec paths, up to 5000 "
+        "(parsing one of that size takes minutes)",
+    )
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=list(SUITES),
+        help="Suites to run, all of them if not set",
+    )
+    parser.add_argument(
+        "-k", dest="pattern", default="*", help="Glob of case names to run"
+    )
+    parser.add_argument("--save", type=pathlib.Path, help="Write results as JSON")
+    parser.add_argument(
+        "--compare", type=pathlib.Path, help="JSON baseline to compare results with"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Relative slowdown against the baseline reported as a regression",
+    )
+    return parser
+
+
+def run(
+    suites: tp.Iterable[str], ctx: Context, pattern: str = "*"
+) -> dict[str, Result]:
+    results = {}
+    for suite in suites:
+        for case in SUITES[suite](ctx):
+            if not fnmatch.fnmatch(case.name, pattern):
+                continue
+            result = results[case.name] = measure(case)
+            print(
+                f"{case.name:<32} {format_time(result.seconds):>10} "
+                f"{result.ops:>12.1f} ops/s",
+                flush=True,
+            )
+    return results
+
+
+def report(
+    baseline: dict[str, Result], results: dict[str, Result], threshold: float
+) -> bool:
+    """
+    Print changes against the baseline. Return False if any case got slower than threshold
+    """
+    ok = True
+    print(f"\n{'case':<32} {'baseline':>10} {'current':>10} {'change':>8}")
+    for change in compare(baseline, results):
+        regressed = change.ratio > 1 + threshold
+        ok = ok and not regressed
+        print(
+            f"{change.name:<32} {format_time(change.baseline):>10} "
+            f"{format_time(change.current):>10} {change.ratio - 1:>+8.1%}"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return ok
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    sizes = sorted({int(size) for size in args.sizes.split(",")})
+    # The baseline is read first, so a wrong path does not waste a run
+    baseline = load(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory(prefix="autostub-bench-") as directory:
+        ctx = Context(pathlib.Path(directory), sizes)
+        results = run(args.suite or list(SUITES), ctx, args.pattern)
+
+    if args.save:
+        save(args.save, results)
+    if baseline is not None and not report(baseline, results, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
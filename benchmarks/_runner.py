@@ -0,0 +1,94 @@
+import dataclasses
+import datetime
+import json
+import pathlib
+import platform
+import sys
+import timeit
+import typing as tp
+
+# Timing of benchmark cases and JSON baselines of their results
+
+
+@dataclasses.dataclass(frozen=True)
+class Case:
+    name: str
+    func: tp.Callable[[], tp.Any]
+    # Calls per repeat, picked to run for at least 0.2s if not set
+    number: int | None = None
+    repeat: int = 5
+
+
+@dataclasses.dataclass(frozen=True)
+class Result:
+    # Seconds per call, the best of all repeats
+    seconds: float
+    number: int
+    repeat: int
+
+    @property
+    def ops(self) -> float:
+        return 1 / self.seconds if self.seconds else float("inf")
+
+
+def measure(case: Case) -> Result:
+    timer = timeit.Timer(case.func)
+    number = case.number
+    if number is None:
+        number, _ = timer.autorange()
+    best = min(timer.repeat(case.repeat, number))
+    return Result(best / number, number, case.repeat)
+
+
+def metadata() -> dict[str, str]:
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def save(path: pathlib.Path, results: dict[str, Result]) -> None:
+    data = {
+        "meta": metadata(),
+        "results": {
+            name: dataclasses.asdict(result) for name, result in results.items()
+        },
+    }
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def load(path: pathlib.Path) -> dict[str, Result]:
+    data = json.loads(path.read_text())
+    return {name: Result(**result) for name, result in data["results"].items()}
+
+
+@dataclasses.dataclass(frozen=True)
+class Change:
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare(baseline: dict[str, Result], current: dict[str, Result]) -> list[Change]:
+    """
+    Changes of cases measured in both runs, in the order of the current run
+    """
+    return [
+        Change(name, baseline[name].seconds, result.seconds)
+        for name, result in current.items()
+        if name in baseline
+    ]
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
@@ -0,0 +1,106 @@
+import json
+import pathlib
+import typing as tp
+
+# Synthetic OpenAPI documents of a given size, written as JSON files
+
+_SERVER = "http://bench.autostub.test/v1"
+
+_PRIMITIVES = [
+    {"type": "integer", "minimum": 0, "maximum": 1000000},
+    {"type": "string", "maxLength": 32},
+    {"type": "boolean"},
+    {"type": "number", "minimum": 0, "maximum": 1000},
+]
+
+
+def _object(depth: int, width: int) -> dict[str, tp.Any]:
+    # width properties, one of them nested down to depth levels
+    properties: dict[str, tp.Any] = {"id": {"type": "integer", "minimum": 1}}
+    for i in range(1, width):
+        properties[f"field{i}"] = _PRIMITIVES[i % len(_PRIMITIVES)]
+    if depth > 1:
+        properties["child"] = _object(depth - 1, width)
+    return {
+        "type": "object",
+        "required": ["id"] + [f"field{i}" for i in range(1, width, 2)],
+        "properties": properties,
+    }
+
+
+def build_spec(
+    paths: int, models: int = 10, depth: int = 2, width: int = 8
+) -> dict[str, tp.Any]:
+    """
+    Document with paths list/detail pairs (/r{i} and /r{i}/{id}) over models schemas
+    """
+    schemas = {}
+    for m in range(models):
+        schemas[f"Model{m}"] = _object(depth, width)
+        schemas[f"Model{m}List"] = {
+            "type": "array",
+            "minItems": 10,
+            "maxItems": 10,
+            "items": {"$ref": f"#/components/schemas/Model{m}"},
+        }
+
+    doc_paths = {}
+    for i in range(paths // 2 or 1):
+        model = f"Model{i % models}"
+        doc_paths[f"/r{i}"] = {
+            "get": {
+                "operationId": f"list{i}",
+                "parameters": [
+                    {
+                        "name": "limit",
+                        "in": "query",
+                        "required": False,
+                        "schema": {"type": "integer", "maximum": 100},
+                    }
+                ],
+                "responses": {"200": _json_response(f"{model}List")},
+            }
+        }
+        doc_paths[f"/r{i}/{{id}}"] = {
+            "get": {
+                "operationId": f"show{i}",
+                "parameters": [
+                    {
+                        "name": "id",
+                        "in": "path",
+                        "required": True,
+                        "schema": {"type": "integer"},
+                    }
+                ],
+                "responses": {"200": _json_response(model)},
+            }
+        }
+
+    return {
+        "openapi": "3.0.0",
+        "info": {"version": "1.0.0", "title": f"Bench {paths}"},
+        "servers": [{"url": _SERVER}],
+        "paths": doc_paths,
+        "components": {"schemas": schemas},
+    }
+
+
+def _json_response(schema: str) -> dict[str, tp.Any]:
+    return {
+        "description": "ok",
+        "content": {
+            "application/json": {"schema": {"$ref": f"#/components/schemas/{schema}"}}
+        },
+    }
+
+
+def write_spec(directory: pathlib.Path, paths: int, **kwargs: tp.Any) -> pathlib.Path:
+    suffix = "-".join(f"{k}{v}" for k, v in sorted(kwargs.items()))
+    path = directory / f"spec{paths}{'-' + suffix if suffix else ''}.json"
+    if not path.exists():
+        path.write_text(json.dumps(build_spec(paths, **kwargs)))
+    return path
+
+
+def url(path: str) -> str:
+    return _SERVER + path
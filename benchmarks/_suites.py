@@ -0,0 +1,197 @@
+import dataclasses
+import functools
+import importlib.util
+import pathlib
+import typing as tp
+
+import frozendict
+import pytest
+
+from autostub._cache import NO_CACHE, CacheFactory, CachingLevel
+from autostub._request import Request
+from autostub._schemas import SCHEMA_MAP
+from autostub._spec_cache import SPEC_CACHE, CachedSpec, SpecCache
+from autostub.plugin import AutoStub
+
+from benchmarks._runner import Case
+from benchmarks._specs import url, write_spec
+
+_HAS_REQUESTS = importlib.util.find_spec("requests") is not None
+
+# Depth and width of generated objects
+SHAPES = [(1, 8), (1, 32), (3, 8), (3, 32), (5, 8)]
+
+
+@dataclasses.dataclass
+class Context:
+    # Spec files and pickled specs of this run
+    directory: pathlib.Path
+    # Number of paths of specs measured
+    sizes: list[int]
+
+    @property
+    def cache_dir(self) -> pathlib.Path:
+        return self.directory / "spec_cache"
+
+    def spec(self, paths: int, **kwargs: tp.Any) -> str:
+        return str(write_spec(self.directory, paths, **kwargs))
+
+    def load(self, path: str) -> CachedSpec:
+        # Parsed once per run, later loads are served from memory
+        return SPEC_CACHE.load(path, self.cache_dir)
+
+
+class _Config:
+    # Stands in for pytest.Config outside of a session, all options keep their defaults
+    _INI = {"mock_use_standalone_module": False}
+
+    def __init__(self) -> None:
+        self.stash = pytest.Stash()
+        self.rootpath = pathlib.Path.cwd()
+
+    def getini(self, name: str) -> tp.Any:
+        return self._INI.get(name, "")
+
+    def getoption(self, name: str, default: tp.Any = None) -> tp.Any:
+        return default
+
+
+def _autostub() -> AutoStub:
+    return AutoStub(config=_Config())
+
+
+type Suite = tp.Callable[[Context], tp.Iterator[Case]]
+
+
+def _request(path: str, method: str = "get") -> Request:
+    return Request(
+        url=url(path),
+        method=method,
+        data=frozendict.frozendict(),
+        parameters=frozendict.frozendict(),
+        headers=frozendict.frozendict(),
+    )
+
+
+def _detail_path(size: int) -> str:
+    # The last path of the spec, the worst case of linear lookups
+    return f"/r{max(size // 2 - 1, 0)}/7"
+
+
+def _load_fresh(
+    path: str, cache_dir: pathlib.Path | None, lazy: bool = False
+) -> CachedSpec:
+    # Nothing is kept in memory between calls
+    return SpecCache().load(path, cache_dir, lazy)
+
+
+def stub(ctx: Context) -> tp.Iterator[Case]:
+    """
+    AutoStub.stub latency: parsing a spec, loading it pickled, loading it lazily
+    and reusing a parsed one
+    """
+    autostub = _autostub()
+    for size in ctx.sizes:
+        path = ctx.spec(size)
+        # Parsing large specs takes minutes, it is done only once
+        yield Case(
+            f"stub/cold/{size}",
+            functools.partial(_load_fresh, path, ctx.cache_dir),
+            number=1,
+            repeat=1,
+        )
+        yield Case(
+            f"stub/disk/{size}",
+            functools.partial(_load_fresh, path, ctx.cache_dir),
+            repeat=3,
+        )
+        yield Case(
+            f"stub/lazy/{size}",
+            functools.partial(_load_fresh, path, None, lazy=True),
+            repeat=3,
+        )
+
+        ctx.load(path)
+        if not _HAS_REQUESTS:
+            continue
+        yield Case(
+            f"stub/warm/{size}",
+            functools.partial(autostub.stub, path, "requests", CachingLevel.ADVANCED),
+        )
+        autostub.unstub(path, "requests")
+    autostub.stop()
+
+
+def route(ctx: Context) -> tp.Iterator[Case]:
+    """
+    Matching a request url to the paths of a spec
+    """
+    for size in ctx.sizes:
+        _, entity = ctx.load(ctx.spec(size))
+        yield Case(
+            f"route/{size}",
+            functools.partial(entity._get_valid_paths, url(_detail_path(size))),
+        )
+
+
+def generate(ctx: Context) -> tp.Iterator[Case]:
+    """
+    Object and Array generation throughput without caching
+    """
+    for depth, width in SHAPES:
+        spec, _ = ctx.load(ctx.spec(2, models=1, depth=depth, width=width))
+        request = _request("/r0")
+        for kind, model in (("object", "Model0"), ("array", "Model0List")):
+            schema = spec.schemas[model]
+            entity = SCHEMA_MAP[type(schema)](schema)
+            yield Case(
+                f"generate/{kind}/d{depth}-w{width}",
+                functools.partial(entity.generate, request, NO_CACHE),
+            )
+
+
+def cache(ctx: Context) -> tp.Iterator[Case]:
+    """
+    Repeated calls of the same url under each caching level
+    """
+    size = min(ctx.sizes)
+    spec, entity = ctx.load(ctx.spec(size))
+    path = _detail_path(size)
+    for level in CachingLevel:
+        service = entity.with_cache(CacheFactory.get_cache(level, spec.schemas))
+        yield Case(
+            f"cache/{level.name.lower()}",
+            lambda service=service: service(_request(path)),
+        )
+
+
+def adapter(ctx: Context) -> tp.Iterator[Case]:
+    """
+    requests.get round-trip through the RequestsAdapter patch
+    """
+    if not _HAS_REQUESTS:
+        return
+
+    import requests
+
+    size = min(ctx.sizes)
+    path = ctx.spec(size)
+    ctx.load(path)
+    autostub = _autostub()
+    autostub.stub(path, "requests", CachingLevel.ADVANCED)
+    try:
+        yield Case(
+            "adapter/requests",
+            functools.partial(requests.get, url(_detail_path(size))),
+        )
+    finally:
+        autostub.stop()
+
+
+SUITES: dict[str, Suite] = {
+    "stub": stub,
+    "route": route,
+    "generate": generate,
+    "cache": cache,
+    "adapter": adapter,
+}
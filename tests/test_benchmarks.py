@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from benchmarks import __main__ as bench
+from benchmarks._runner import Case, Result, compare, load, measure, save
+from benchmarks._specs import build_spec
+
+
+class TestSpecs:
+    @pytest.mark.parametrize("paths", [2, 10, 100])
+    def test_size(self, paths):
+        doc = build_spec(paths, models=3)
+
+        assert len(doc["paths"]) == paths
+        assert len(doc["components"]["schemas"]) == 6
+
+    def test_depth(self):
+        schema = build_spec(2, models=1, depth=3, width=4)["components"]["schemas"][
+            "Model0"
+        ]
+
+        depth = 0
+        while schema is not None:
+            assert len(schema["properties"]) in (4, 5)
+            schema = schema["properties"].get("child")
+            depth += 1
+        assert depth == 3
+
+
+class TestRunner:
+    def test_measure(self):
+        result = measure(Case("noop", lambda: None, number=10, repeat=2))
+
+        assert result.number == 10
+        assert result.repeat == 2
+        assert result.seconds >= 0
+
+    def test_save_load(self, tmp_path):
+        results = {"a": Result(0.5, 10, 3)}
+
+        save(tmp_path / "res.json", results)
+
+        assert load(tmp_path / "res.json") == results
+        assert "python" in json.loads((tmp_path / "res.json").read_text())["meta"]
+
+    def test_compare(self):
+        baseline = {"a": Result(1.0, 1, 1), "b": Result(2.0, 1, 1)}
+        current = {"a": Result(1.5, 1, 1), "c": Result(1.0, 1, 1)}
+
+        changes = compare(baseline, current)
+
+        assert [(c.name, c.ratio) for c in changes] == [("a", 1.5)]
+
+
+class TestMain:
+    ARGS = ["--sizes", "10", "--suite", "cache", "-k", "cache/basic"]
+
+    @pytest.fixture
+    def results(self, tmp_path):
+        path = tmp_path / "baseline.json"
+        assert bench.main(self.ARGS + ["--save", str(path)]) == 0
+        return path
+
+    def test_saved(self, results):
+        assert list(load(results)) == ["cache/basic"]
+
+    @pytest.mark.parametrize("scale, code", [(1e6, 0), (1e-6, 1)])
+    def test_regression(self, results, scale, code):
+        data = json.loads(results.read_text())
+        data["results"]["cache/basic"]["seconds"] *= scale
+        results.write_text(json.dumps(data))
+
+        assert bench.main(self.ARGS + ["--compare", str(results)]) == code
@@ -0,0 +1,82 @@
+import random
+import string
+
+import pytest
+
+import autostub._bulk as bulk
+
+ALPHABET = string.ascii_letters + string.digits + " "
+
+
+@pytest.fixture(params=["numpy", "getrandbits"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(bulk, "np", None)
+    return request.param
+
+
+@pytest.mark.parametrize(
+    "lower,upper",
+    (
+        (0, 0),
+        (-5, 5),
+        (0, 1000),
+        (-(2**63), 2**63 - 1),
+        (-(2**70), 2**70),
+    ),
+)
+def test_integers(backend, lower, upper):
+    res = bulk.integers(lower, upper, 1000)
+
+    assert len(res) == 1000
+    assert all(isinstance(x, int) and lower <= x <= upper for x in res)
+
+
+def test_integers_cover_range(backend):
+    assert set(bulk.integers(1, 4, 1000)) == {1, 2, 3, 4}
+
+
+def test_numbers(backend):
+    res = bulk.numbers(-1.5, 2.5, 1000)
+
+    assert len(res) == 1000
+    assert all(isinstance(x, float) and -1.5 <= x <= 2.5 for x in res)
+
+
+def test_booleans(backend):
+    res = bulk.booleans(1000)
+
+    assert len(res) == 1000
+    assert set(res) == {True, False}
+
+
+@pytest.mark.parametrize("lower,upper", ((1, 1), (1, 100), (10, 20)))
+def test_strings(backend, lower, upper):
+    res = bulk.strings(lower, upper, ALPHABET, 500)
+
+    assert len(res) == 500
+    assert all(isinstance(x, str) and lower <= len(x) <= upper for x in res)
+    assert set("".join(res)) <= set(ALPHABET)
+
+
+@pytest.mark.parametrize(
+    "func", (bulk.booleans, lambda count: bulk.integers(0, 1, count))
+)
+def test_empty(backend, func):
+    assert func(0) == []
+
+
+def test_seeded(backend):
+    def generate(seed):
+        rng = random.Random(seed)
+        return (
+            bulk.integers(-(2**70), 2**70, 10, rng),
+            bulk.numbers(0, 1, 10, rng),
+            bulk.booleans(10, rng),
+            bulk.strings(1, 10, ALPHABET, 10, rng),
+        )
+
+    assert generate(1) == generate(1)
+    assert generate(1) != generate(2)
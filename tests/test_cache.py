@@ -1,21 +1,24 @@
+import json
 import pathlib
+import random
+import pytest
 import frozendict
 
 import autostub._cache as cache
+import autostub._codec as codec
 import autostub._request as request
 import autostub._generator as generator
-
-import openapi_parser as oapi_parser
+import autostub._named_spec as named_spec
+import autostub._spec_cache as spec_cache
 
 TEST_DATA_DIR = pathlib.Path(__file__).resolve().parent / "data"
+# Caches name models of the schemas copied from them in the same spec
+SPEC = named_spec.parse(str(TEST_DATA_DIR / "oapi_spec.yaml"))
 
 
 class PetStore:
     def __init__(self, cache_instance):
-        self.service = generator.OAPISpec(
-            oapi_parser.parse(str(TEST_DATA_DIR / "oapi_spec.yaml")),
-            cache=cache_instance,
-        )
+        self.service = generator.OAPISpec(SPEC, cache=cache_instance)
         self.url = "http://petstore.swagger.io/v1"
 
     def __call__(self, path, **kwargs):
@@ -76,6 +79,18 @@ class TestBasicCache:
         assert res2 == res1
         assert len(cache_instance._storage.keys()) == 1
 
+    def test_encoded_once(self, mocker):
+        cache_instance = cache.RequestCache()
+        service = PetStore(cache_instance)
+        dumps_spy = mocker.spy(codec.DEFAULT_CODEC, "dumps")
+
+        _, res1 = service("pets/1")
+        _, res2 = service("pets/1")
+
+        assert dumps_spy.call_count == 1
+        assert res2.body is res1.body
+        assert json.loads(res1.body) == res1.content
+
     def test_different_requests(self):
         cache_instance = cache.RequestCache()
 
@@ -93,9 +108,7 @@ class TestBasicCache:
 
 class TestAdvancedCache:
     def test_in_cache(self):
-        cache_instance = cache.CompositeCache(
-            oapi_parser.parse(str(TEST_DATA_DIR / "oapi_spec.yaml")).schemas
-        )
+        cache_instance = cache.CompositeCache(SPEC.schemas)
 
         service = PetStore(cache_instance)
 
@@ -114,9 +127,7 @@ class TestAdvancedCache:
         assert model_store.get(key) == res1.content
 
     def test_req_returning_multiple(self):
-        cache_instance = cache.CompositeCache(
-            oapi_parser.parse(str(TEST_DATA_DIR / "oapi_spec.yaml")).schemas
-        )
+        cache_instance = cache.CompositeCache(SPEC.schemas)
 
         service = PetStore(cache_instance)
 
@@ -139,3 +150,281 @@ class TestAdvancedCache:
                 assert model_store.has(key)
 
                 assert pet_entry == model_store.get(key)
+
+    @pytest.mark.parametrize("lazy", [False, True])
+    def test_model_names(self, tmp_path, lazy):
+        animal = {
+            "type": "object",
+            "required": ["id"],
+            "properties": {"id": {"type": "integer"}, "name": {"type": "string"}},
+        }
+
+        def returning(schema):
+            content = {"application/json": {"schema": schema}}
+            return {
+                "get": {"responses": {"200": {"description": "", "content": content}}}
+            }
+
+        spec_path = tmp_path / "animals.json"
+        spec_path.write_text(
+            json.dumps(
+                {
+                    "openapi": "3.0.0",
+                    "info": {"title": "Animals", "version": "1.0.0"},
+                    "servers": [{"url": "http://animals.example.com"}],
+                    "paths": {
+                        "/cats": returning({"$ref": "#/components/schemas/Cat"}),
+                        "/dogs": returning({"$ref": "#/components/schemas/Dog"}),
+                        "/pets": returning(
+                            {
+                                "allOf": [
+                                    {"$ref": "#/components/schemas/Dog"},
+                                    {"properties": {"age": {"type": "integer"}}},
+                                ]
+                            }
+                        ),
+                        "/kennels": returning({"$ref": "#/components/schemas/Kennel"}),
+                        "/puppies": returning({"$ref": "#/components/schemas/Puppy"}),
+                    },
+                    "components": {
+                        "schemas": {
+                            # Structurally equal models
+                            "Cat": animal,
+                            "Dog": animal,
+                            "Kennel": {
+                                "type": "object",
+                                "properties": {
+                                    "dog": {"$ref": "#/components/schemas/Dog"}
+                                },
+                            },
+                            "Puppy": {
+                                "allOf": [
+                                    {"$ref": "#/components/schemas/Dog"},
+                                    {"properties": {"age": {"type": "integer"}}},
+                                ]
+                            },
+                        }
+                    },
+                }
+            )
+        )
+        spec, _ = spec_cache.SpecCache().load(str(spec_path), lazy=lazy)
+        cache_instance = cache.CompositeCache(spec.schemas)
+        cats, dogs, pets, kennels, puppies = [
+            path.operations[0].responses[0].content[0].schema for path in spec.paths
+        ]
+
+        assert cats == dogs
+        assert cache_instance._resolve_model_name(cats) == "Cat"
+        assert cache_instance._resolve_model_name(dogs) == "Dog"
+        assert cache_instance._resolve_model_name(kennels) == "Kennel"
+        assert cache_instance._resolve_model_name(kennels.properties[0].schema) == "Dog"
+        assert cache_instance._resolve_model_name(puppies) == "Puppy"
+        # Made of a model, but not the model itself
+        assert pets == puppies
+        assert cache_instance._resolve_model_name(pets) == ""
+
+    def test_model_names_of_mapping(self):
+        cache_instance = cache.CompositeCache(dict(SPEC.schemas))
+        pet = SPEC.paths[1].operations[0].responses[0].content[0].schema
+
+        assert pet == SPEC.schemas["Pet"]
+        assert cache_instance._resolve_model_name(SPEC.schemas["Pet"]) == "Pet"
+        # Plain mappings only name the models themselves
+        assert cache_instance._resolve_model_name(pet) == ""
+
+
+class TestModelCache:
+    @staticmethod
+    def make_key(rng=random, **fields):
+        req = request.Request(
+            url="http://petstore.swagger.io/v1/pets",
+            method="get",
+            data=frozendict.frozendict(),
+            parameters=frozendict.frozendict(),
+            headers=frozendict.frozendict(),
+            query_params=frozendict.frozendict(fields),
+            rng=rng,
+        )
+        return cache.ModelCacheKey(req)
+
+    def test_partial_key_lookup(self):
+        pet = SPEC.schemas["Pet"]
+        model_store = cache.ModelCache(pet)
+
+        model_store.put(self.make_key(id=1, name="rex"), {"id": 1, "name": "rex"})
+        model_store.put(self.make_key(id=2, name="rex"), {"id": 2, "name": "rex"})
+
+        assert model_store.get(self.make_key(id=1)) == {"id": 1, "name": "rex"}
+        assert model_store.get(self.make_key(id=2, name="rex"))["id"] == 2
+        assert model_store.get(self.make_key(name="rex"))["id"] in {1, 2}
+
+        assert not model_store.has(self.make_key(id=3))
+        assert not model_store.has(self.make_key(id=1, name="max"))
+        assert model_store.get(self.make_key(id=3)) is None
+
+    def test_partial_key_seeded(self):
+        pet = SPEC.schemas["Pet"]
+        model_store = cache.ModelCache(pet)
+        for pid in range(20):
+            model_store.put(self.make_key(id=pid, name="rex"), {"id": pid})
+
+        def pick():
+            rng = random.Random(1)
+            key = self.make_key(rng=rng, name="rex")
+            # Checking for an entry does not use up the random source
+            assert model_store.has(key)
+            return [model_store.get(key)["id"] for _ in range(5)]
+
+        expected = pick()
+        random.seed(2)
+        assert pick() == expected
+
+    def test_delete(self):
+        pet = SPEC.schemas["Pet"]
+        model_store = cache.ModelCache(pet)
+
+        model_store.put(self.make_key(id=1, name="rex"), {"id": 1, "name": "rex"})
+        model_store.put(self.make_key(id=2, name="rex"), {"id": 2, "name": "rex"})
+
+        assert model_store.delete(self.make_key(id=1)) == 1
+        assert model_store.get(self.make_key(id=1)) is None
+        assert model_store.is_deleted(self.make_key(id=1))
+        assert not model_store.is_deleted(self.make_key(id=2))
+        assert model_store.get(self.make_key(name="rex"))["id"] == 2
+        assert model_store.stats().entries == 1
+
+        # Put again, the object exists
+        model_store.put(self.make_key(id=1, name="max"), {"id": 1, "name": "max"})
+        assert not model_store.is_deleted(self.make_key(id=1))
+        assert model_store.get(self.make_key(id=1))["name"] == "max"
+
+    def test_delete_not_remembered(self):
+        pet = SPEC.schemas["Pet"]
+        model_store = cache.ModelCache(pet)
+
+        model_store.put(self.make_key(id=1, name="rex"), {"id": 1, "name": "rex"})
+
+        assert model_store.delete(self.make_key(id=1), remember=False) == 1
+        assert not model_store.is_deleted(self.make_key(id=1))
+        assert model_store.delete(self.make_key(id=1)) == 0
+        assert model_store.is_deleted(self.make_key(id=1))
+
+
+class TestBoundedCache:
+    @staticmethod
+    def make_key(**fields):
+        return TestModelCache.make_key(**fields)
+
+    @staticmethod
+    def pet_schema():
+        return SPEC.schemas["Pet"]
+
+    def test_request_cache_lru(self):
+        cache_instance = cache.RequestCache(max_entries=2)
+
+        keys = [cache.RequestCacheKey(self.make_key(id=i).key) for i in range(3)]
+        cache_instance.put(keys[0], 0)
+        cache_instance.put(keys[1], 1)
+        assert cache_instance.get(keys[0]) == 0
+        cache_instance.put(keys[2], 2)
+
+        assert cache_instance.has(keys[0])
+        assert not cache_instance.has(keys[1])
+        assert cache_instance.has(keys[2])
+
+    def test_model_cache_lru_keeps_index(self):
+        model_store = cache.ModelCache(self.pet_schema(), max_entries=2)
+
+        for i in range(3):
+            model_store.put(self.make_key(id=i, name="rex"), {"id": i, "name": "rex"})
+
+        assert len(model_store.all()) == 2
+        assert not model_store.has(self.make_key(id=0))
+        for _ in range(10):
+            assert model_store.get(self.make_key(name="rex"))["id"] in {1, 2}
+        assert 0 not in model_store._index["id"]
+
+    def test_ttl(self, mocker):
+        now = mocker.patch("time.monotonic", return_value=100.0)
+        model_store = cache.ModelCache(self.pet_schema(), ttl=10)
+
+        model_store.put(self.make_key(id=1, name="rex"), {"id": 1, "name": "rex"})
+        now.return_value = 105.0
+        model_store.put(self.make_key(id=2, name="rex"), {"id": 2, "name": "rex"})
+        assert model_store.has(self.make_key(id=1))
+
+        now.return_value = 111.0
+        assert not model_store.has(self.make_key(id=1))
+        assert model_store.get(self.make_key(name="rex"))["id"] == 2
+        assert len(model_store.all()) == 1
+
+        now.return_value = 116.0
+        assert not model_store.all()
+        assert not model_store._index["id"]
+
+    def test_encoded_kept_with_entries(self):
+        cache_instance = cache.CompositeCache(
+            SPEC.schemas,
+            cache.CacheLimits(max_entries=5),
+        )
+        service = PetStore(cache_instance)
+
+        for i in range(20):
+            service(f"pets/{i}")
+            # Lists are new objects made of stored pets, they are not remembered
+            service("pets")
+
+        (pets,) = cache_instance._storage.values()
+        assert len(pets._storage) == 5
+        assert len(pets._encoded) <= 5
+        assert len(pets._keys_by_id) == 5
+
+    def test_encoded_counted_in_max_bytes(self):
+        cache_instance = cache.RequestCache(max_bytes=2000)
+        keys = [
+            cache.RequestCacheKey(TestModelCache.make_key(id=i).key) for i in range(2)
+        ]
+
+        cache_instance.put(keys[0], {"id": 0})
+        cache_instance.put(keys[1], {"id": 1})
+        size = cache_instance._bytes
+        cache_instance.encoded(cache_instance.get(keys[1]), lambda value: b"1" * 100)
+        assert cache_instance._bytes == size + 100
+
+        # Replaced by the value of another encoder, the oldest entry is evicted to fit it
+        cache_instance.encoded(
+            cache_instance.get(keys[1]), lambda value: b"1" * 1800, "other"
+        )
+        assert not cache_instance.has(keys[0])
+        assert cache_instance._bytes == cache._approx_size({"id": 1}) + 1800
+
+        # Values not stored are not remembered
+        assert cache_instance.encoded({"id": 2}, lambda value: b"2") == b"2"
+        assert len(cache_instance._encoded) == 1
+
+    @pytest.mark.parametrize(
+        "limits",
+        (
+            cache.CacheLimits(max_entries=3),
+            cache.CacheLimits(max_entries_per_model=3),
+            cache.CacheLimits(max_bytes=3000),
+        ),
+    )
+    def test_composite_limits(self, limits):
+        cache_instance = cache.CacheFactory.get_cache(
+            cache.CachingLevel.ADVANCED, SPEC.schemas, limits
+        )
+
+        for i in range(50):
+            req = self.make_key(id=i, name="rex").key
+            cache_instance.put(
+                cache.CompositeCacheKey(req, model=SPEC.schemas["Pet"]),
+                {"id": i, "name": "rex"},
+            )
+
+        stored = cache_instance.get_all_by_model(
+            cache.CompositeCacheKey(req, model=SPEC.schemas["Pet"])
+        )
+        assert 0 < len(stored) < 50
+        assert {"id": 49, "name": "rex"} in stored.values()
@@ -0,0 +1,41 @@
+import pytest
+
+import autostub._codec as codec
+
+VALUE = {"id": 1, "name": "rex", "tags": ["a", "b"], "weight": 1.5, "alive": True}
+
+
+@pytest.mark.parametrize("name", list(codec.CODECS))
+def test_roundtrip(name):
+    pytest.importorskip(name)
+    json_codec = codec.get_codec(name)
+
+    data = json_codec.dumps(VALUE)
+
+    assert isinstance(data, bytes)
+    assert json_codec.loads(data) == VALUE
+    assert json_codec.loads(data.decode()) == VALUE
+
+
+def test_wide_integers():
+    value = {"id": 2**70}
+
+    for name in codec.CODECS:
+        try:
+            json_codec = codec.get_codec(name)
+        except ImportError:
+            continue
+        assert codec.JsonCodec().loads(json_codec.dumps(value)) == value
+
+
+def test_default(monkeypatch):
+    monkeypatch.setitem(codec.CODECS, "orjson", (codec.OrjsonCodec, None))
+    monkeypatch.setitem(codec.CODECS, "ujson", (codec.UjsonCodec, None))
+
+    assert type(codec.get_codec()) is codec.JsonCodec
+
+    with pytest.raises(ImportError):
+        codec.get_codec("orjson")
+
+    with pytest.raises(ValueError):
+        codec.get_codec("yaml")
@@ -0,0 +1,65 @@
+import pytest
+
+from autostub._dispatch import ServerMap, candidates
+
+
+class FakeSpec:
+    def __init__(self, *servers):
+        self.servers = list(servers)
+
+
+@pytest.fixture
+def specs():
+    return {
+        "pets": FakeSpec("http://petstore.swagger.io/v1"),
+        "users": FakeSpec("https://users.example.com", "http://Users.Example.com/v2"),
+        "relative": FakeSpec("/api"),
+        "other_pets": FakeSpec("http://petstore.swagger.io/v2"),
+    }
+
+
+class TestServerMap:
+    def test_by_host(self, specs):
+        servers = ServerMap(specs)
+
+        assert servers.candidates("http://petstore.swagger.io/v1/pets/1") == [
+            specs["pets"],
+            specs["relative"],
+            specs["other_pets"],
+        ]
+        assert servers.candidates("https://users.example.com/users") == [
+            specs["users"],
+            specs["relative"],
+        ]
+        assert servers.candidates("http://users.example.com/v2/users?id=1") == [
+            specs["users"],
+            specs["relative"],
+        ]
+
+    def test_unknown_host(self, specs):
+        servers = ServerMap(specs)
+
+        assert servers.candidates("http://example.com/pets") == [specs["relative"]]
+        assert servers.candidates("pets") == [specs["relative"]]
+
+    def test_updated_on_change(self, specs):
+        servers = ServerMap(specs)
+        servers.candidates("http://petstore.swagger.io/v1/pets")
+
+        del servers["pets"]
+        servers["new"] = FakeSpec("http://example.com")
+
+        assert servers.candidates("http://petstore.swagger.io/v1/pets") == [
+            specs["relative"],
+            specs["other_pets"],
+        ]
+        assert servers.candidates("http://example.com") == [
+            specs["relative"],
+            servers["new"],
+        ]
+
+        servers.clear()
+        assert servers.candidates("http://example.com") == []
+
+    def test_plain_dict(self, specs):
+        assert candidates(specs, "http://example.com") == list(specs.values())
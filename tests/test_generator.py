@@ -0,0 +1,321 @@
+import asyncio
+import random
+import threading
+import pathlib
+import pickle
+import time
+
+import frozendict
+import pytest
+
+import autostub._cache as cache
+import autostub._generator as generator
+import autostub._spec_cache as spec_cache
+from autostub._request import Request
+
+PET_URL = "http://petstore.swagger.io/v1/pets/1"
+
+
+@pytest.fixture
+def service():
+    spec_path = pathlib.Path(__file__).resolve().parent / "data" / "oapi_spec.yaml"
+    spec, entity = spec_cache.SpecCache().load(str(spec_path))
+    return entity.with_cache(
+        cache.CacheFactory.get_cache(cache.CachingLevel.ADVANCED, spec.schemas)
+    )
+
+
+def make_request(url=PET_URL):
+    return Request(
+        url=url,
+        method="get",
+        data=frozendict.frozendict(),
+        parameters=frozendict.frozendict(),
+        headers=frozendict.frozendict(),
+    )
+
+
+class TestAsyncCall:
+    def test_acall(self, service):
+        response = asyncio.run(service.acall(make_request()))
+
+        assert response.status_code == 200
+        assert response.content["id"] == 1
+        assert response.body is not None
+
+    def test_unknown_url(self, mocker, service):
+        to_thread = mocker.spy(asyncio, "to_thread")
+
+        response = asyncio.run(
+            service.acall(make_request("http://petstore.swagger.io/v1/toys"))
+        )
+
+        assert response is None
+        assert to_thread.call_count == 0
+
+    def test_event_loop_not_blocked(self, mocker, service):
+        call = generator.OAPISpec.__call__
+
+        def slow_call(self, request):
+            time.sleep(0.2)
+            return call(self, request)
+
+        mocker.patch.object(generator.OAPISpec, "__call__", slow_call)
+
+        async def tick(ticks):
+            while True:
+                ticks.append(1)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            ticks = []
+            ticker = asyncio.create_task(tick(ticks))
+            response = await service.acall(make_request())
+            ticker.cancel()
+            return response, ticks
+
+        response, ticks = asyncio.run(run())
+
+        assert response.content["id"] == 1
+        assert len(ticks) > 5
+
+    def test_concurrent_calls(self, service):
+        async def run():
+            return await asyncio.gather(
+                *(
+                    service.acall(
+                        make_request(f"http://petstore.swagger.io/v1/pets/{i}")
+                    )
+                    for i in range(1, 21)
+                )
+            )
+
+        responses = asyncio.run(run())
+
+        assert [r.content["id"] for r in responses] == list(range(1, 21))
+        assert service.cache.stats().puts == 20
+
+
+class TestSeed:
+    @pytest.fixture
+    def seeded(self, service):
+        return service.with_cache(cache.NO_CACHE, seed=42)
+
+    def call(self, service, url=PET_URL, **parameters):
+        req = make_request(url)
+        req.parameters = frozendict.frozendict(parameters)
+        return service(req).content
+
+    def test_same_request_same_response(self, seeded):
+        url = "http://petstore.swagger.io/v1/pets"
+
+        assert self.call(seeded) == self.call(seeded)
+        assert self.call(seeded, url, limit="5") == self.call(seeded, url, limit="5")
+        assert self.call(seeded, url + "?limit=5") == self.call(seeded, url, limit="5")
+
+    def test_different_requests(self, seeded):
+        first = self.call(seeded)
+        second = self.call(seeded, "http://petstore.swagger.io/v1/pets/2")
+
+        assert first["name"] != second["name"]
+
+    def test_different_seeds(self, service, seeded):
+        other = service.with_cache(cache.NO_CACHE, seed=43)
+
+        assert self.call(seeded)["name"] != self.call(other)["name"]
+
+    def test_not_seeded(self, service):
+        unseeded = service.with_cache(cache.NO_CACHE)
+
+        assert self.call(unseeded)["name"] != self.call(unseeded)["name"]
+
+    def test_global_random_untouched(self, seeded):
+        random.seed(1)
+        expected = random.random()
+
+        random.seed(1)
+        self.call(seeded)
+
+        assert random.random() == expected
+
+
+class TestPrefill:
+    def test_prefill(self, service):
+        # Pets holds up to 100 items
+        assert service.prefill(100) == 200
+
+        stats = service.cache.stats()
+        assert stats.entries_by_model == {"Pet": 100, "Error": 100}
+
+        # Prefilled objects are served, nothing new is generated
+        service(make_request("http://petstore.swagger.io/v1/pets"))
+        assert service.cache.stats().puts == stats.puts
+
+    def test_stopped(self, service):
+        stop = threading.Event()
+        stop.set()
+
+        assert service.prefill(20, stop) == 0
+        assert service.cache.stats().entries == 0
+
+    @pytest.mark.parametrize(
+        "level", [cache.CachingLevel.NONE, cache.CachingLevel.BASIC]
+    )
+    def test_no_model_cache(self, service, level):
+        other = service.with_cache(cache.CacheFactory.get_cache(level, {}))
+
+        assert other.prefill(20) == 0
+
+
+class TestLazyOperations:
+    def built(self, service):
+        return {url for url, path in service._paths.items() if path._ops}
+
+    def test_built_on_first_call(self, service):
+        assert self.built(service) == set()
+
+        service(make_request())
+        assert self.built(service) == {"/pets/{id}"}
+
+        op = service._paths["/pets/{id}"]._ops["get"]
+        service(make_request("http://petstore.swagger.io/v1/pets/2"))
+        assert service._paths["/pets/{id}"]._ops["get"] is op
+
+    def test_unknown_method(self, service):
+        req = make_request()
+        req.method = "options"
+
+        assert service(req) is None
+        assert self.built(service) == set()
+
+    def test_shared_between_caches(self, service):
+        other = service.with_cache(cache.NO_CACHE)
+        other(make_request())
+
+        assert self.built(service) == {"/pets/{id}"}
+
+
+class TestCrud:
+    @pytest.fixture(params=["memory", "shared", "lazy"])
+    def crud(self, request, tmp_path):
+        spec_path = pathlib.Path(__file__).resolve().parent / "data" / "crud_spec.yaml"
+        spec, entity = spec_cache.SpecCache().load(
+            str(spec_path), lazy=request.param == "lazy"
+        )
+        shared_path = tmp_path / "cache.sqlite" if request.param == "shared" else None
+        return entity.with_cache(
+            cache.CacheFactory.get_cache(
+                cache.CachingLevel.ADVANCED, spec.schemas, shared_path=shared_path
+            )
+        )
+
+    @staticmethod
+    def call(service, method, path, **data):
+        req = make_request("http://petstore.swagger.io/v1" + path)
+        req.method = method
+        req.data = frozendict.frozendict(data)
+        response = service(req)
+        return response.status_code, response.content
+
+    def test_create(self, crud):
+        status, created = self.call(crud, "post", "/pets", id=5, name="rex")
+
+        assert status == 201
+        assert created == {"id": 5, "name": "rex"}
+        assert self.call(crud, "get", "/pets/5") == (200, created)
+
+    def test_create_generates_required(self, crud):
+        status, created = self.call(crud, "post", "/pets", name="rex", tag="dog")
+
+        assert status == 201
+        assert set(created) == {"id", "name", "tag"}
+        assert self.call(crud, "get", f"/pets/{created['id']}") == (200, created)
+
+    def test_create_invalid(self, crud):
+        status, error = self.call(crud, "post", "/pets", tag="dog")
+
+        assert status == 404
+        assert set(error) == {"code", "message"}
+
+    def test_create_replaces(self, crud):
+        self.call(crud, "post", "/pets", id=5, name="rex")
+        self.call(crud, "post", "/pets", id=5, name="max")
+
+        assert self.call(crud, "get", "/pets/5")[1]["name"] == "max"
+        assert crud.cache.stats().entries_by_model == {"Pet": 1}
+
+    def test_replace(self, crud):
+        self.call(crud, "post", "/pets", id=5, name="rex", tag="dog")
+
+        # Id is taken from the path
+        status, replaced = self.call(crud, "put", "/pets/5", name="max")
+
+        assert status == 200
+        assert replaced == {"id": 5, "name": "max"}
+        assert self.call(crud, "get", "/pets/5") == (200, replaced)
+
+    def test_update(self, crud):
+        self.call(crud, "post", "/pets", id=5, name="rex")
+
+        status, updated = self.call(crud, "patch", "/pets/5", tag="dog")
+
+        assert status == 200
+        assert updated == {"id": 5, "name": "rex", "tag": "dog"}
+        assert self.call(crud, "get", "/pets/5") == (200, updated)
+
+    def test_update_generated(self, crud):
+        _, pet = self.call(crud, "get", "/pets/5")
+
+        _, updated = self.call(crud, "patch", "/pets/5", tag="dog")
+
+        assert updated == {**pet, "tag": "dog"}
+
+    def test_delete(self, crud):
+        self.call(crud, "post", "/pets", id=5, name="rex")
+        self.call(crud, "post", "/pets", id=6, name="max")
+
+        assert self.call(crud, "delete", "/pets/5") == (204, "")
+        assert self.call(crud, "get", "/pets/5") == (404, "")
+        assert self.call(crud, "delete", "/pets/5") == (404, "")
+        assert self.call(crud, "patch", "/pets/5", tag="dog") == (404, "")
+        assert self.call(crud, "get", "/pets/6")[1]["name"] == "max"
+
+        # Created again
+        self.call(crud, "post", "/pets", id=5, name="bob")
+        assert self.call(crud, "get", "/pets/5") == (200, {"id": 5, "name": "bob"})
+
+    def test_without_model_cache(self, crud):
+        stateless = crud.with_cache(cache.NO_CACHE)
+
+        status, created = self.call(stateless, "post", "/pets", id=5, name="rex")
+
+        # Answered with a generated object, nothing is stored
+        assert status == 201
+        assert {"id", "name"} <= set(created)
+        assert self.call(stateless, "delete", "/pets/5") == (204, "")
+
+
+class TestParameters:
+    def test_typed(self, service):
+        req = make_request("http://petstore.swagger.io/v1/pets?limit=5")
+
+        service(req)
+
+        assert req.query_params == {"limit": 5}
+
+    def test_invalid(self, service):
+        req = make_request("http://petstore.swagger.io/v1/pets?limit=abc")
+
+        response = service(req)
+
+        # Default response
+        assert set(response.content) == {"code", "message"}
+
+    def test_pickle(self, service):
+        service(make_request("http://petstore.swagger.io/v1/pets?limit=5"))
+
+        restored = pickle.loads(pickle.dumps(service))
+        req = make_request("http://petstore.swagger.io/v1/pets?limit=5")
+        restored(req)
+
+        assert req.query_params == {"limit": 5}
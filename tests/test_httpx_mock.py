@@ -0,0 +1,149 @@
+import asyncio
+import pathlib
+
+import httpx
+import pytest
+
+import autostub._cache as cache
+from autostub.adapters import httpx as httpx_adapter
+from autostub.plugin import AutoStub
+
+
+@pytest.fixture
+def data_dir():
+    res = pathlib.Path(__file__).resolve().parent / "data"
+    assert res.exists()
+
+    return res
+
+
+@pytest.fixture
+def plugin(data_dir):
+    result = AutoStub(config=None)
+    result.stub(
+        oapi_spec=str(data_dir / "oapi_spec.yaml"),
+        module="httpx",
+        caching_level=cache.CachingLevel.ADVANCED,
+    )
+    yield result
+    result.stop()
+
+
+def fallback_handler(request):
+    return httpx.Response(404, text="Tried to go to internet")
+
+
+@pytest.mark.usefixtures("plugin")
+def test_httpx_mock():
+    with httpx.Client() as client:
+        result = client.get("http://petstore.swagger.io/v1/pets/1")
+
+    assert isinstance(client._transport, httpx_adapter.StubTransport)
+    assert result.is_success
+    assert result.headers["content-type"].startswith("application/json")
+    assert result.json()["id"] == 1
+
+
+def test_httpx_typed_headers(data_dir):
+    plugin = AutoStub(config=None)
+    plugin.stub(
+        oapi_spec=str(data_dir / "nested_spec.yaml"),
+        module="httpx",
+        caching_level=cache.CachingLevel.BASIC,
+    )
+
+    result = httpx.get("http://petstore.swagger.io/v1/pets/1")
+
+    assert result.is_success
+    int(result.headers["x-rate-limit"])
+    plugin.stop()
+
+
+@pytest.mark.usefixtures("plugin")
+def test_httpx_module_functions():
+    result = httpx.get("http://petstore.swagger.io/v1/pets/2")
+
+    assert result.is_success
+    assert result.json()["id"] == 2
+
+
+@pytest.mark.usefixtures("plugin")
+def test_httpx_async_mock():
+    async def get():
+        async with httpx.AsyncClient() as client:
+            assert isinstance(client._transport, httpx_adapter.AsyncStubTransport)
+            return await client.get("http://petstore.swagger.io/v1/pets/1")
+
+    result = asyncio.run(get())
+
+    assert result.is_success
+    assert result.json()["id"] == 1
+
+
+def test_httpx_fallback():
+    transport = httpx_adapter.StubTransport(
+        {}, lambda: httpx.MockTransport(fallback_handler)
+    )
+
+    with httpx.Client(transport=transport) as client:
+        result = client.get("http://petstore.swagger.io/v1/not_pets/1")
+
+    assert result.status_code == 404
+    assert "Tried to go to internet" in result.text
+
+
+def test_httpx_fallback_not_created(plugin):
+    factory_calls = []
+
+    def factory():
+        factory_calls.append(1)
+        return httpx.MockTransport(fallback_handler)
+
+    transport = httpx_adapter.StubTransport(plugin._servers["httpx"], factory)
+
+    with httpx.Client(transport=transport) as client:
+        assert client.get("http://petstore.swagger.io/v1/pets/1").is_success
+        assert factory_calls == []
+
+        assert client.get("http://petstore.swagger.io/v1/not_pets/1").status_code == 404
+        assert factory_calls == [1]
+
+
+def test_httpx_async_fallback():
+    transport = httpx_adapter.AsyncStubTransport(
+        {}, lambda: httpx.MockTransport(fallback_handler)
+    )
+
+    async def get():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.get("http://petstore.swagger.io/v1/not_pets/1")
+
+    assert asyncio.run(get()).status_code == 404
+
+
+def test_httpx_unstub(plugin, data_dir):
+    transport = httpx_adapter.StubTransport(
+        plugin._servers["httpx"], lambda: httpx.MockTransport(fallback_handler)
+    )
+    client = httpx.Client(transport=transport)
+
+    assert client.get("http://petstore.swagger.io/v1/pets/1").is_success
+
+    plugin.unstub(str(data_dir / "oapi_spec.yaml"), "httpx")
+
+    assert client.get("http://petstore.swagger.io/v1/pets/1").status_code == 404
+
+
+def test_httpx_to_request():
+    request = httpx.Request(
+        "POST",
+        "http://Petstore.swagger.io/v1/pets?limit=10",
+        json={"name": "rex"},
+    )
+
+    result = httpx_adapter.HttpxAdapter.to_request(request)
+
+    assert result.method == "post"
+    assert result.url == "http://petstore.swagger.io/v1/pets"
+    assert result.parameters == {"limit": "10"}
+    assert result.data == {"name": "rex"}
@@ -0,0 +1,241 @@
+import json
+import pathlib
+import pickle
+import subprocess
+import sys
+
+import frozendict
+import pytest
+from openapi_parser.errors import ParserError
+
+import autostub._cache as cache
+import autostub._lazy_spec as lazy_spec
+import autostub._spec_cache as spec_cache
+from autostub._request import Request
+
+DATA_DIR = pathlib.Path(__file__).resolve().parent / "data"
+SERVER = "http://petstore.swagger.io/v1"
+
+
+def json_response(schema):
+    return {
+        "description": "ok",
+        "content": {"application/json": {"schema": schema}},
+    }
+
+
+REFS_DOC = {
+    "openapi": "3.0.0",
+    "info": {"version": "1.0.0", "title": "Refs"},
+    "servers": [{"url": SERVER}],
+    "paths": {
+        "/pets": {
+            "get": {
+                "parameters": [{"$ref": "#/components/parameters/limit"}],
+                "responses": {"200": {"$ref": "#/components/responses/Pets"}},
+            }
+        },
+        "/pets/{id}": {
+            "parameters": [
+                {
+                    "name": "id",
+                    "in": "path",
+                    "required": True,
+                    "schema": {"type": "integer"},
+                }
+            ],
+            "get": {
+                "responses": {
+                    "200": json_response({"$ref": "#/components/schemas/Dog"})
+                }
+            },
+        },
+        "/toys": {
+            "get": {
+                "responses": {
+                    "200": json_response({"$ref": "#/components/schemas/Toy"})
+                }
+            }
+        },
+    },
+    "components": {
+        "parameters": {
+            "limit": {
+                "name": "limit",
+                "in": "query",
+                "schema": {"type": "integer", "maximum": 10},
+            }
+        },
+        "responses": {
+            "Pets": json_response(
+                {"type": "array", "items": {"$ref": "#/components/schemas/Pet"}}
+            )
+        },
+        "schemas": {
+            "Pet": {
+                "type": "object",
+                "required": ["id"],
+                "properties": {
+                    "id": {"type": "integer"},
+                    "name": {"type": "string"},
+                },
+            },
+            "Dog": {
+                "allOf": [
+                    {"$ref": "#/components/schemas/Pet"},
+                    {
+                        "type": "object",
+                        "required": ["breed"],
+                        "properties": {"breed": {"type": "string"}},
+                    },
+                ]
+            },
+            "Toy": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}},
+            },
+        },
+    },
+}
+
+
+@pytest.fixture
+def refs_path(tmp_path):
+    path = tmp_path / "refs.json"
+    path.write_text(json.dumps(REFS_DOC))
+    return str(path)
+
+
+def make_request(path):
+    return Request(
+        url=SERVER + path,
+        method="get",
+        data=frozendict.frozendict(),
+        parameters=frozendict.frozendict(),
+        headers=frozendict.frozendict(),
+    )
+
+
+def built_paths(spec):
+    return {path.url for path in spec.paths if path._path is not None}
+
+
+class TestLoad:
+    @pytest.mark.parametrize("name", ["oapi_spec.yaml", "crud_spec.yaml"])
+    def test_same_as_parsed(self, name):
+        eager, _ = spec_cache.SpecCache().load(str(DATA_DIR / name))
+        lazy, _ = spec_cache.SpecCache().load(str(DATA_DIR / name), lazy=True)
+
+        assert lazy.servers == eager.servers
+        assert [p.url for p in lazy.paths] == [p.url for p in eager.paths]
+        for lazy_path, eager_path in zip(lazy.paths, eager.paths):
+            assert lazy_path.operations == eager_path.operations
+        assert dict(lazy.schemas) == eager.schemas
+
+    def test_refs(self, refs_path):
+        spec = lazy_spec.load(lazy_spec.read_document(refs_path))
+        pets, pet, _ = spec.paths
+
+        (limit,) = pets.operations[0].parameters
+        assert limit.name == "limit"
+        assert limit.schema.maximum == 10
+
+        # Components are the very objects schemas of paths refer to
+        items = pets.operations[0].responses[0].content[0].schema.items
+        assert items is spec.schemas["Pet"]
+
+        dog = pet.operations[0].responses[0].content[0].schema
+        assert [p.name for p in dog.properties] == ["id", "name", "breed"]
+        assert dog.required == ["id", "breed"]
+        # Merging allOf leaves the document as it is
+        assert REFS_DOC["components"]["schemas"]["Pet"]["required"] == ["id"]
+
+        # Parameters of the path item are added to operations
+        assert [p.name for p in pet.operations[0].parameters] == ["id"]
+
+    def test_built_on_use(self, refs_path):
+        spec, entity = spec_cache.SpecCache().load(refs_path, lazy=True)
+        service = entity.with_cache(
+            cache.CacheFactory.get_cache(cache.CachingLevel.ADVANCED, spec.schemas)
+        )
+        assert built_paths(spec) == set()
+
+        response = service(make_request("/pets/1"))
+
+        assert response.content["id"] == 1
+        assert built_paths(spec) == {"/pets/{id}"}
+        assert service.cache.stats().entries_by_model == {"Dog": 1}
+        # Other models are not built to find out the model of a schema,
+        # Pet is merged into Dog as a part of the document
+        assert spec.schemas._factory._built.keys() == {"Dog"}
+
+    def test_pickle(self, refs_path):
+        spec, entity = spec_cache.SpecCache().load(refs_path, lazy=True)
+        entity(make_request("/toys"))
+
+        spec, entity = pickle.loads(pickle.dumps((spec, entity)))
+        service = entity.with_cache(
+            cache.CacheFactory.get_cache(cache.CachingLevel.ADVANCED, spec.schemas)
+        )
+        service(make_request("/toys"))
+        service(make_request("/pets/1"))
+
+        assert service.cache.stats().entries_by_model == {"Toy": 1, "Dog": 1}
+
+    def test_recursive(self):
+        doc = {
+            **REFS_DOC,
+            "components": {
+                "schemas": {
+                    "Pet": {
+                        "type": "object",
+                        "properties": {"parent": {"$ref": "#/components/schemas/Pet"}},
+                    }
+                }
+            },
+        }
+        spec = lazy_spec.load(doc)
+
+        with pytest.raises(ParserError, match="Recursive"):
+            spec.schemas["Pet"]
+
+    def test_unresolvable(self):
+        spec = lazy_spec.load(
+            {**REFS_DOC, "components": {"schemas": REFS_DOC["components"]["schemas"]}}
+        )
+
+        with pytest.raises(ParserError, match="Unresolvable"):
+            spec.paths[0].operations
+
+    @pytest.mark.parametrize(
+        "ref, expected",
+        [
+            ("#/components/schemas/Pet", False),
+            ("pets.yaml#/Pet", True),
+            ("http://example.com/spec.yaml#/Pet", True),
+        ],
+    )
+    def test_external_refs(self, ref, expected):
+        doc = {"paths": {"/pets": {"get": {"parameters": [{"$ref": ref}]}}}}
+
+        assert lazy_spec.has_external_refs(doc) is expected
+
+    def test_cached_apart(self, refs_path):
+        specs = spec_cache.SpecCache()
+
+        eager, _ = specs.load(refs_path)
+        lazy, _ = specs.load(refs_path, lazy=True)
+
+        assert isinstance(lazy.schemas, lazy_spec.LazySchemas)
+        assert not isinstance(eager.schemas, lazy_spec.LazySchemas)
+
+
+def test_builders_not_exported():
+    # openapi3-parser 1.1.20+ does not export builders from the package
+    code = """
+import openapi_parser.builders as builders
+for name in builders.__all__:
+    delattr(builders, name)
+import autostub, autostub.plugin, autostub._lazy_spec
+"""
+    subprocess.run([sys.executable, "-c", code], check=True)
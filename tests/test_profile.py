@@ -0,0 +1,162 @@
+import pathlib
+import time
+
+import frozendict
+import pytest
+
+import autostub._cache as cache
+import autostub._spec_cache as spec_cache
+from autostub._profile import (
+    UNMATCHED,
+    Profiler,
+    Stage,
+    StageStats,
+    profiled_call,
+    set_operation,
+    stage,
+)
+from autostub._request import Request
+
+
+@pytest.fixture
+def service():
+    spec_path = pathlib.Path(__file__).resolve().parent / "data" / "crud_spec.yaml"
+    spec, entity = spec_cache.SpecCache().load(str(spec_path))
+    return entity.with_cache(
+        cache.CacheFactory.get_cache(cache.CachingLevel.ADVANCED, spec.schemas)
+    )
+
+
+def make_request(path, method="get", **data):
+    return Request(
+        url="http://petstore.swagger.io/v1" + path,
+        method=method,
+        data=frozendict.frozendict(data),
+        parameters=frozendict.frozendict(),
+        headers=frozendict.frozendict(),
+    )
+
+
+class TestProfiler:
+    def test_not_profiled(self):
+        with stage(Stage.ROUTING):
+            set_operation("GET /pets")
+
+        with profiled_call(None):
+            pass
+
+    def test_nested_stages(self):
+        profiler = Profiler()
+
+        with profiler.call():
+            set_operation("GET /pets")
+            with stage(Stage.GENERATION):
+                time.sleep(0.02)
+                with stage(Stage.CACHE):
+                    time.sleep(0.05)
+
+        profile = profiler.report()["GET /pets"]
+        assert profile.calls == 1
+        generation = profile.stages[Stage.GENERATION]
+        cached = profile.stages[Stage.CACHE]
+        # Nested stages are not counted in outer ones
+        assert 0.02 <= generation.time < 0.05
+        assert cached.time >= 0.05
+        assert profile.time >= generation.time + cached.time
+
+    def test_nested_calls(self):
+        profiler = Profiler()
+
+        with profiler.call(), profiler.call():
+            set_operation("GET /pets")
+            set_operation("GET /other")
+
+        report = profiler.report()
+        assert list(report) == ["GET /pets"]
+        assert report["GET /pets"].calls == 1
+
+    def test_unmatched(self):
+        profiler = Profiler()
+
+        with profiler.call():
+            pass
+
+        assert list(profiler.report()) == [UNMATCHED]
+
+    def test_allocations(self):
+        profiler = Profiler()
+
+        with profiler.call(), stage(Stage.GENERATION):
+            kept = [object() for _ in range(1000)]
+
+        assert profiler.report()[UNMATCHED].stages[Stage.GENERATION].blocks >= 1000
+        assert len(kept) == 1000
+
+    def test_merge(self):
+        first, second = Profiler(), Profiler()
+        for profiler in (first, second, second):
+            with profiler.call(), stage(Stage.ROUTING):
+                set_operation("GET /pets")
+
+        first.merge(second)
+
+        profile = first.report()["GET /pets"]
+        assert profile.calls == 3
+        assert profile.stages[Stage.ROUTING].calls == 3
+
+    def test_add(self):
+        stats = StageStats(1, 0.5, 10) + StageStats(2, 0.25, -4)
+
+        assert stats == StageStats(3, 0.75, 6)
+
+    def test_format(self):
+        profiler = Profiler()
+        with profiler.call(), stage(Stage.VALIDATION):
+            set_operation("GET /pets")
+
+        lines = profiler.format()
+
+        assert lines[0].startswith("GET /pets: calls=1 time=")
+        assert lines[1].startswith("    validation: ")
+
+
+class TestServiceProfile:
+    def test_stages(self, service):
+        service.profiler = profiler = Profiler()
+
+        service(make_request("/pets/1"))
+        service(make_request("/pets/1"))
+
+        profile = profiler.report()["GET /pets/{id}"]
+        assert profile.calls == 2
+        assert set(profile.stages) == set(Stage)
+        assert profile.stages[Stage.ROUTING].calls == 2
+        # Generated once, then served from the cache
+        assert profile.stages[Stage.CACHE].calls >= 2
+
+    def test_write(self, service):
+        service.profiler = profiler = Profiler()
+
+        service(make_request("/pets", "post", id=1, name="rex"))
+        service(make_request("/pets/1", "delete"))
+
+        report = profiler.report()
+        assert set(report) == {"POST /pets", "DELETE /pets/{id}"}
+        # Parameters and body
+        assert report["POST /pets"].stages[Stage.VALIDATION].calls == 2
+
+    def test_unmatched(self, service):
+        service.profiler = profiler = Profiler()
+
+        assert service(make_request("/toys")) is None
+
+        assert set(profiler.report()[UNMATCHED].stages) == {Stage.ROUTING}
+
+    def test_not_shared(self, service):
+        service.profiler = Profiler()
+
+        other = service.with_cache(cache.NO_CACHE)
+        other.profiler = None
+        other(make_request("/pets/1"))
+
+        assert service.profiler.report() == {}
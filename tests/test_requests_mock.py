@@ -4,6 +4,7 @@ import requests
 import io
 
 import autostub._cache as cache
+from autostub._profile import Stage
 from autostub.plugin import AutoStub
 
 
@@ -61,3 +62,272 @@ def test_requests_mock_fallback(mocker, data_dir, cache_level):
     mock.assert_called_once_with(
         "get", "http://petstore.swagger.io/v1/not_pets/1", params=None
     )
+
+
+@pytest.mark.parametrize("codec", ["json", None])
+def test_requests_codec(data_dir, codec):
+    plugin = AutoStub(config=None)
+
+    plugin.stub(
+        oapi_spec=str(data_dir / "oapi_spec.yaml"),
+        module="requests",
+        caching_level=cache.CachingLevel.NONE,
+        codec=codec,
+    )
+
+    result = requests.get(url="http://petstore.swagger.io/v1/pets/1")
+
+    assert result.headers.get("Content-Type", "application/json").startswith(
+        "application/json"
+    )
+    assert result.json()["id"] == 1
+
+    plugin.stop()
+
+
+def test_cache_stats(data_dir):
+    plugin = AutoStub(config=None)
+
+    plugin.stub(
+        oapi_spec=str(data_dir / "oapi_spec.yaml"),
+        module="requests",
+        caching_level=cache.CachingLevel.ADVANCED,
+    )
+
+    requests.get(url="http://petstore.swagger.io/v1/pets/1")
+    requests.get(url="http://petstore.swagger.io/v1/pets/1")
+
+    stats = plugin.cache_stats()
+    assert stats.hits == 1
+    assert stats.misses == 1
+    assert stats.puts == 1
+    assert stats.entries_by_model == {"Pet": 1}
+    assert stats.lookup_time > 0
+
+    assert plugin.cache_stats(module="httpx") == cache.CacheStats()
+
+    plugin.stop()
+
+
+@pytest.mark.parametrize(
+    "limits",
+    (
+        cache.CacheLimits(max_entries_per_model=5),
+        cache.CacheLimits(max_entries=3),
+        cache.CacheLimits(ttl=0),
+    ),
+)
+def test_cache_limits_list(data_dir, limits):
+    plugin = AutoStub(config=None)
+
+    plugin.stub(
+        oapi_spec=str(data_dir / "oapi_spec.yaml"),
+        module="requests",
+        caching_level=cache.CachingLevel.ADVANCED,
+        cache_limits=limits,
+        seed=1,
+    )
+
+    # Lists longer than the cache may keep are made of the pets left in it
+    for _ in range(5):
+        result = requests.get(url="http://petstore.swagger.io/v1/pets?limit=50")
+        assert result.ok
+        (pets,) = result.json()
+        assert len(pets) <= 5
+
+    plugin.stop()
+
+
+def test_cache_stats_summary(pytester, data_dir):
+    pytester.makepyfile(f"""
+        import requests
+        from autostub import CachingLevel
+
+        def test_pets(autostub):
+            autostub.stub(
+                oapi_spec={str(data_dir / "oapi_spec.yaml")!r},
+                module="requests",
+                caching_level=CachingLevel.ADVANCED,
+            )
+            assert requests.get("http://petstore.swagger.io/v1/pets/1").ok
+        """)
+
+    result = pytester.runpytest_inprocess("--autostub-cache-stats")
+
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*autostub cache statistics*",
+            "*oapi_spec.yaml: hits=0 misses=1*",
+            "*Pet: 1 entries",
+        ]
+    )
+
+
+def test_shared_cache_xdist(pytester, monkeypatch, data_dir):
+    pytest.importorskip("xdist")
+    # Workers have to find autostub from the temporary directory
+    monkeypatch.setenv("PYTHONPATH", str(data_dir.parent.parent))
+
+    out_dir = pytester.path / "out"
+    out_dir.mkdir()
+    pytester.makepyfile(f"""
+        import pathlib
+        import pytest
+        import requests
+        from autostub import CachingLevel
+
+        @pytest.mark.parametrize("n", range(4))
+        def test_pet(autostub, worker_id, n):
+            autostub.stub(
+                oapi_spec={str(data_dir / "oapi_spec.yaml")!r},
+                module="requests",
+                caching_level=CachingLevel.ADVANCED,
+            )
+            body = requests.get("http://petstore.swagger.io/v1/pets/1").content
+            pathlib.Path({str(out_dir)!r}, f"{{worker_id}}-{{n}}").write_bytes(body)
+        """)
+
+    result = pytester.runpytest_subprocess("-n", "2", "--autostub-shared-cache")
+
+    result.assert_outcomes(passed=4)
+    outputs = list(out_dir.iterdir())
+    # Every worker took part
+    assert {i.name.split("-")[0] for i in outputs} == {"gw0", "gw1"}
+    assert len({i.read_bytes() for i in outputs}) == 1
+
+
+def test_prefill(data_dir):
+    plugin = AutoStub(config=None)
+
+    plugin.stub(
+        oapi_spec=str(data_dir / "oapi_spec.yaml"),
+        module="requests",
+        caching_level=cache.CachingLevel.ADVANCED,
+        prefill=100,
+    )
+    assert plugin.wait_prefill(timeout=30)
+
+    puts = plugin.cache_stats().puts
+    assert puts == 200
+
+    result = requests.get(url="http://petstore.swagger.io/v1/pets")
+    assert result.status_code == 200
+    assert plugin.cache_stats().puts == puts
+
+    plugin.stop()
+
+
+def test_prefill_stopped_on_unstub(data_dir):
+    plugin = AutoStub(config=None)
+    oapi_spec = str(data_dir / "oapi_spec.yaml")
+
+    plugin.stub(
+        oapi_spec=oapi_spec,
+        module="requests",
+        caching_level=cache.CachingLevel.ADVANCED,
+        prefill=10**6,
+    )
+    plugin.unstub(oapi_spec, "requests")
+
+    assert plugin.wait_prefill(timeout=0)
+
+    plugin.stop()
+
+
+def test_requests_crud(data_dir):
+    plugin = AutoStub(config=None)
+
+    plugin.stub(
+        oapi_spec=str(data_dir / "crud_spec.yaml"),
+        module="requests",
+        caching_level=cache.CachingLevel.ADVANCED,
+    )
+
+    created = requests.post(
+        url="http://petstore.swagger.io/v1/pets", json={"id": 7, "name": "rex"}
+    )
+    assert created.status_code == 201
+
+    result = requests.get(url="http://petstore.swagger.io/v1/pets/7")
+    assert result.json() == {"id": 7, "name": "rex"}
+
+    assert (
+        requests.delete(url="http://petstore.swagger.io/v1/pets/7").status_code == 204
+    )
+    assert requests.get(url="http://petstore.swagger.io/v1/pets/7").status_code == 404
+
+    plugin.stop()
+
+
+def test_profile(data_dir):
+    plugin = AutoStub(config=None)
+    oapi_spec = str(data_dir / "oapi_spec.yaml")
+    plugin.stub(
+        oapi_spec=oapi_spec,
+        module="requests",
+        caching_level=cache.CachingLevel.ADVANCED,
+    )
+    requests.get(url="http://petstore.swagger.io/v1/pets/1")
+
+    with plugin.profile() as profiler:
+        requests.get(url="http://petstore.swagger.io/v1/pets/1")
+        requests.get(url="http://petstore.swagger.io/v1/pets?limit=5")
+
+    requests.get(url="http://petstore.swagger.io/v1/pets/1")
+
+    report = profiler.report()
+    assert set(report) == {"GET /pets/{id}", "GET /pets"}
+    assert report["GET /pets/{id}"].calls == 1
+    # Response of requests is made by the adapter
+    assert report["GET /pets/{id}"].stages[Stage.SERIALIZATION].calls == 2
+
+    plugin.stop()
+
+
+def test_profile_summary(pytester, data_dir):
+    pytester.makepyfile(f"""
+        import requests
+        from autostub import CachingLevel
+
+        def test_pets(autostub):
+            autostub.stub(
+                oapi_spec={str(data_dir / "oapi_spec.yaml")!r},
+                module="requests",
+                caching_level=CachingLevel.ADVANCED,
+            )
+            assert requests.get("http://petstore.swagger.io/v1/pets/1").ok
+            with autostub.profile():
+                assert requests.get("http://petstore.swagger.io/v1/pets/2").ok
+        """)
+
+    result = pytester.runpytest_inprocess("--autostub-profile")
+
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(
+        [
+            "*autostub profile*",
+            "GET /pets/{id}: calls=2 *",
+            "    routing: *",
+            "    generation: *",
+        ]
+    )
+
+
+def test_requests_lazy(data_dir):
+    plugin = AutoStub(config=None)
+
+    plugin.stub(
+        oapi_spec=str(data_dir / "oapi_spec.yaml"),
+        module="requests",
+        caching_level=cache.CachingLevel.ADVANCED,
+        lazy=True,
+    )
+
+    result = requests.get(url="http://petstore.swagger.io/v1/pets/1")
+    assert result.json()["id"] == 1
+    assert requests.get(url="http://petstore.swagger.io/v1/pets/1").json() == (
+        result.json()
+    )
+
+    plugin.stop()
@@ -0,0 +1,36 @@
+import frozendict
+import pytest
+
+import autostub._router as router
+
+
+@pytest.fixture
+def path_router():
+    return router.PathRouter(
+        ["/pets", "/pets/{id}", "/pets/{id}/photos", "/pets/mine", "/owners/{owner}"]
+    )
+
+
+@pytest.mark.parametrize(
+    "path,expected",
+    (
+        ("/pets", [("/pets", {})]),
+        ("/pets/1", [("/pets/{id}", {"id": "1"})]),
+        ("/pets/1/photos", [("/pets/{id}/photos", {"id": "1"})]),
+        ("/owners/bob", [("/owners/{owner}", {"owner": "bob"})]),
+        ("/pets/1/2", []),
+        ("/cats", []),
+        ("", []),
+    ),
+)
+def test_match(path_router, path, expected):
+    assert path_router.match(path) == [
+        (template, frozendict.frozendict(params)) for template, params in expected
+    ]
+
+
+def test_match_static_and_param(path_router):
+    assert path_router.match("/pets/mine") == [
+        ("/pets/mine", frozendict.frozendict()),
+        ("/pets/{id}", frozendict.frozendict(id="mine")),
+    ]
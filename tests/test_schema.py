@@ -1,5 +1,6 @@
 import sys
 import copy
+import pickle
 import string
 from types import NoneType
 import frozendict
@@ -218,6 +219,7 @@ class TestBoolean(BaseTest):
             ("bar", False),
             (False, True),
             (True, True),
+            ("true", True),
         ),
     )
     def test_validate(self, value, expected):
@@ -225,6 +227,11 @@ class TestBoolean(BaseTest):
 
         assert schema.is_valid(value) == expected
 
+    def test_from_query(self):
+        schema = schemas.Boolean(self.base_spec, "bool")
+
+        assert schema.from_val("false") is False
+
 
 class TestAnyOf(BaseTest):
 
@@ -255,6 +262,60 @@ class TestAnyOf(BaseTest):
         assert schema.is_valid(value) == expected
 
 
+class TestArray(BaseTest):
+    @classmethod
+    def setup_class(cls):
+        super().setup_class()
+
+        cls.base_spec = oapi_spec.Array(
+            type="array",
+            items=oapi_spec.Integer(type="integer", minimum=0, maximum=10),
+            min_items=2,
+            max_items=5,
+        )
+
+    def test_generate(self):
+        schema = schemas.Array(self.base_spec, "array")
+
+        res = schema(self.dummy_request, self.dummy_cache)
+
+        assert 2 <= len(res) <= 5
+        assert all(isinstance(x, int) and 0 <= x <= 10 for x in res)
+
+    def test_compiled_once(self, mocker):
+        schema = schemas.Array(self.base_spec, "array")
+        compile_spy = mocker.spy(schemas.Integer, "compile_bulk")
+
+        for _ in range(3):
+            schema(self.dummy_request, self.dummy_cache)
+
+        assert compile_spy.call_count == 1
+
+    @pytest.mark.parametrize(
+        "value,expected",
+        (
+            ([1, 2], (1, 2)),
+            ("1,2,3", (1, 2, 3)),
+            ([1], schemas.INVALID),
+            ([1, 11], schemas.INVALID),
+            ("1,a", schemas.INVALID),
+            (1, schemas.INVALID),
+        ),
+    )
+    def test_parse(self, value, expected):
+        schema = schemas.Array(self.base_spec, "array")
+
+        assert schema.parser(value) == expected
+
+    def test_pickle(self):
+        schema = schemas.Array(self.base_spec, "array")
+        schema(self.dummy_request, self.dummy_cache)
+
+        restored = pickle.loads(pickle.dumps(schema))
+
+        assert 2 <= len(restored(self.dummy_request, self.dummy_cache)) <= 5
+
+
 class TestObject(BaseTest):
     @classmethod
     def setup_class(cls):
@@ -287,10 +348,36 @@ class TestObject(BaseTest):
         (
             ({"foo": "bar"}, True),
             ({"foo": "bar", "bar": 1}, True),
+            ({"foo": "bar", "baz": 1}, True),
+            ({"foo": "bar", "bar": "x"}, False),
             ({"bar": 1}, False),
+            ("foo", False),
         ),
     )
     def test_validate(self, value, expected):
         schema = schemas.Object(self.base_spec, "object")
 
         assert schema.is_valid(value) == expected
+
+    def test_parse(self):
+        schema = schemas.Object(self.base_spec, "object")
+
+        assert schema.parser({"foo": "bar", "bar": "7"}) == {"foo": "bar", "bar": 7}
+
+    def test_generate_with_query_params(self):
+        schema = schemas.Object(self.base_spec, "object")
+        req = request.Request(
+            url="funny.service",
+            method="get",
+            data=frozendict.frozendict(),
+            parameters=frozendict.frozendict(),
+            headers=frozendict.frozendict(),
+            query_params=frozendict.frozendict(foo="baz", bar="7"),
+        )
+
+        res = schema(req, self.dummy_cache)
+
+        assert res["foo"] == "baz"
+        if "bar" in res:
+            assert res["bar"] == 7
+        assert req.query_params == frozendict.frozendict(foo="baz", bar="7")
@@ -0,0 +1,297 @@
+import asyncio
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+import autostub._server as server
+from autostub.__main__ import build_parser
+
+DATA_DIR = pathlib.Path(__file__).resolve().parent / "data"
+
+NO_MODELS_SPEC = {
+    "openapi": "3.0.0",
+    "info": {"version": "1.0.0", "title": "No models"},
+    "servers": [{"url": "http://petstore.swagger.io/v1"}],
+    "paths": {
+        "/pets/{id}": {
+            "get": {
+                "parameters": [
+                    {
+                        "name": "id",
+                        "in": "path",
+                        "required": True,
+                        "schema": {"type": "integer"},
+                    }
+                ],
+                "responses": {
+                    "200": {
+                        "description": "ok",
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "required": ["id"],
+                                    "properties": {"id": {"type": "integer"}},
+                                }
+                            }
+                        },
+                    }
+                },
+            }
+        }
+    },
+}
+
+
+@pytest.fixture
+def spec_path():
+    res = pathlib.Path(__file__).resolve().parent / "data" / "oapi_spec.yaml"
+    assert res.exists()
+
+    return str(res)
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ")[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    return status, headers, body
+
+
+def exchange(spec_path, payload, responses, **kwargs):
+    specs = spec_path if isinstance(spec_path, list) else [spec_path]
+
+    async def run():
+        stub = server.StubServer(specs, **kwargs)
+        srv = await stub.start("127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+        async with srv:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(payload)
+            result = [await read_response(reader) for _ in range(responses)]
+            tail = await reader.read()
+            writer.close()
+            return result, tail
+
+    return asyncio.run(run())
+
+
+def get(path, connection=None, host="localhost"):
+    res = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+    if connection:
+        res += f"Connection: {connection}\r\n"
+    return (res + "\r\n").encode()
+
+
+class TestServer:
+    def test_get(self, spec_path):
+        [(status, headers, body)], _ = exchange(
+            spec_path, get("/v1/pets/1", "close"), 1
+        )
+
+        assert status == 200
+        assert headers["content-type"].startswith("application/json")
+        assert json.loads(body)["id"] == 1
+
+    def test_pipelining(self, spec_path):
+        payload = get("/v1/pets/1") + get("/v1/pets/2") + get("/v1/pets/3", "close")
+
+        responses, tail = exchange(spec_path, payload, 3)
+
+        assert [json.loads(body)["id"] for _, _, body in responses] == [1, 2, 3]
+        assert tail == b""
+
+    def test_cached_between_requests(self, spec_path):
+        payload = get("/v1/pets/1") + get("/v1/pets/1", "close")
+
+        (_, _, first), (_, _, second) = exchange(spec_path, payload, 2)[0]
+
+        assert first == second
+
+    def test_query_params(self, spec_path):
+        [(status, _, body)], _ = exchange(
+            spec_path, get("/v1/pets?limit=3", "close"), 1
+        )
+
+        assert status == 200
+        assert isinstance(json.loads(body), list)
+
+    @pytest.mark.parametrize("path", ["/v1/toys", "/pets/1", "/v10/pets/1"])
+    def test_not_found(self, spec_path, path):
+        [(status, headers, body)], _ = exchange(spec_path, get(path, "close"), 1)
+
+        assert status == 404
+        assert body == b""
+
+    def test_split_body(self, spec_path):
+        async def run():
+            stub = server.StubServer([spec_path])
+            srv = await stub.start("127.0.0.1", 0)
+            port = srv.sockets[0].getsockname()[1]
+            async with srv:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(
+                    b'GET /v1/pets/1 HTTP/1.1\r\nContent-Length: 7\r\n\r\n{"a":'
+                )
+                await writer.drain()
+                await asyncio.sleep(0.05)
+                writer.write(b"1}" + get("/v1/pets/2", "close"))
+                result = [await read_response(reader) for _ in range(2)]
+                writer.close()
+                return result
+
+        responses = asyncio.run(run())
+
+        assert [json.loads(body)["id"] for _, _, body in responses] == [1, 2]
+
+    def test_generation_error(self):
+        payload = get("/v1/pets/1") + get("/v1/owners") + get("/v1/pets/2")
+
+        responses, tail = exchange(
+            str(DATA_DIR / "nested_spec.yaml"),
+            payload,
+            2,
+            caching_level=server.CachingLevel.BASIC,
+        )
+
+        assert [status for status, _, _ in responses] == [200, 500]
+        assert responses[1][1]["connection"] == "close"
+        assert tail == b""
+
+    def test_without_models(self, tmp_path):
+        path = tmp_path / "spec.json"
+        path.write_text(json.dumps(NO_MODELS_SPEC))
+
+        (_, _, first), (_, _, second) = exchange(
+            str(path), get("/v1/pets/1") + get("/v1/pets/1", "close"), 2
+        )[0]
+
+        assert json.loads(first)["id"] == 1
+        # Cached by request
+        assert first == second
+
+    def test_basic_limits(self, spec_path):
+        stub = server.StubServer(
+            [spec_path],
+            server.CachingLevel.BASIC,
+            server.CacheLimits(max_entries_per_model=1),
+        )
+        adapter = stub.make_adapter()
+
+        for pet_id in (1, 2, 3):
+            adapter.handle("GET", f"/v1/pets/{pet_id}", {}, b"")
+
+        # Responses are limited the same way as objects of a model
+        (service,) = adapter._servers.values()
+        assert service.cache.stats().entries == 1
+
+    @pytest.mark.parametrize(
+        "path, host, status",
+        [
+            ("/v1/pets/1", "localhost:8080", 200),
+            ("/v1/dogs/1", "localhost:8080", 200),
+            ("/v1/pets/1", "petstore.swagger.io", 200),
+            ("/v1/dogs/1", "dogs.example.com:8080", 200),
+            ("/v1/pets/1", "dogs.example.com", 404),
+        ],
+    )
+    def test_same_base_path(self, spec_path, tmp_path, path, host, status):
+        dogs_spec = tmp_path / "dogs.json"
+        dogs = dict(NO_MODELS_SPEC, servers=[{"url": "http://dogs.example.com/v1"}])
+        dogs["paths"] = {"/dogs/{id}": NO_MODELS_SPEC["paths"]["/pets/{id}"]}
+        dogs_spec.write_text(json.dumps(dogs))
+
+        [(result, _, _)], _ = exchange(
+            [spec_path, str(dogs_spec)], get(path, "close", host), 1
+        )
+
+        assert result == status
+
+    @pytest.mark.parametrize(
+        "payload, status",
+        [
+            (b"nonsense\r\n\r\n", 400),
+            (b"GET / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n", 501),
+            (b"GET / HTTP/1.1\r\nContent-Length: x\r\n\r\n", 400),
+            (b"GET / HTTP/1.1\r\nX: " + b"a" * server.MAX_HEAD_SIZE, 431),
+        ],
+    )
+    def test_bad_request(self, spec_path, payload, status):
+        [(result, headers, _)], tail = exchange(spec_path, payload, 1)
+
+        assert result == status
+        assert headers["connection"] == "close"
+        assert tail == b""
+
+
+def test_cli_args(spec_path):
+    args = build_parser().parse_args(
+        [
+            "serve",
+            spec_path,
+            "--port",
+            "0",
+            "--workers",
+            "4",
+            "--caching-level",
+            "basic",
+            "--lazy",
+        ]
+    )
+
+    assert args.specs == [spec_path]
+    assert args.port == 0
+    assert args.workers == 4
+    assert args.caching_level == "basic"
+    assert args.lazy
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Workers need fork")
+@pytest.mark.parametrize("reuse_port", ["--reuse-port", "--no-reuse-port"])
+@pytest.mark.parametrize(
+    "spec_name, caching_level",
+    [("oapi_spec.yaml", "advanced"), ("nested_spec.yaml", "basic")],
+)
+def test_serve_workers(reuse_port, spec_name, caching_level):
+    spec_path = str(DATA_DIR / spec_name)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "autostub", "serve", spec_path, "--port", "0"]
+        + ["--workers", "2", reuse_port, "--caching-level", caching_level],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        line = process.stdout.readline()
+        assert "with 2 worker(s)" in line
+        port = int(line.split()[2].rsplit(":", 1)[1])
+
+        async def fetch():
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(get("/v1/pets/1", "close"))
+            result = await read_response(reader)
+            writer.close()
+            return result
+
+        async def run():
+            # Separate connections, answered by both workers
+            return await asyncio.gather(*(fetch() for _ in range(20)))
+
+        responses = asyncio.run(run())
+        assert {status for status, _, _ in responses} == {200}
+        # Workers share generated data, whole responses with nested values included
+        assert len({body for _, _, body in responses}) == 1
+        pet = json.loads(responses[0][2])
+        assert isinstance(pet, dict)
+        assert pet["id"] == 1
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
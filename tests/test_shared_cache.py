@@ -0,0 +1,294 @@
+import multiprocessing
+import pathlib
+import sys
+import time
+
+import frozendict
+import pytest
+
+import autostub._cache as cache
+import autostub._generator as generator
+import autostub._named_spec as named_spec
+import autostub._request as request
+import autostub._shared_cache as shared_cache
+
+TEST_DATA_DIR = pathlib.Path(__file__).resolve().parent / "data"
+
+
+@pytest.fixture(scope="module")
+def spec():
+    return named_spec.parse(str(TEST_DATA_DIR / "oapi_spec.yaml"))
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "models.sqlite"
+
+
+def make_key(spec, **fields):
+    req = request.Request(
+        url="http://petstore.swagger.io/v1/pets",
+        method="get",
+        data=frozendict.frozendict(),
+        parameters=frozendict.frozendict(),
+        headers=frozendict.frozendict(),
+        query_params=frozendict.frozendict(fields),
+    )
+    return cache.CompositeCacheKey(req, model=spec.schemas["Pet"])
+
+
+def get_pet(service, pet_id):
+    req = request.Request(
+        url=f"http://petstore.swagger.io/v1/pets/{pet_id}",
+        method="get",
+        data=frozendict.frozendict(),
+        parameters=frozendict.frozendict(),
+        headers=frozendict.frozendict(),
+    )
+    return service(req).content
+
+
+def _put_pet(path, pet_id):
+    spec = named_spec.parse(str(TEST_DATA_DIR / "oapi_spec.yaml"))
+    cache_instance = shared_cache.SharedCompositeCache(spec.schemas, path)
+    cache_instance.put(
+        make_key(spec, id=pet_id, name="rex"), {"id": pet_id, "name": "rex"}
+    )
+
+
+class TestSharedCompositeCache:
+    def test_shared_between_instances(self, spec, db_path):
+        first = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+        second = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+
+        first.put(make_key(spec, id=1, name="rex"), {"id": 1, "name": "rex"})
+        first.put(make_key(spec, id=2, name="max"), {"id": 2, "name": "max"})
+
+        assert second.get(make_key(spec, id=1)) == {"id": 1, "name": "rex"}
+        assert second.get(make_key(spec, name="max"))["id"] == 2
+        assert second.has(make_key(spec, id=2, name="max"))
+        assert not second.has(make_key(spec, id=1, name="max"))
+        assert second.get(make_key(spec, id=3)) is None
+        assert len(second.get_all_by_model(make_key(spec))) == 2
+
+    def test_first_put_wins(self, spec, db_path):
+        first = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+        second = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+
+        first.put(make_key(spec, id=1, name="rex"), {"id": 1, "name": "rex"})
+        second.put(make_key(spec, id=1, name="rex"), {"id": 1, "name": "other"})
+
+        assert first.get(make_key(spec, id=1))["name"] == "rex"
+        assert second.put_first(
+            make_key(spec, id=1, name="rex"), {"id": 1, "name": "other"}
+        ) == {"id": 1, "name": "rex"}
+
+    def test_first_put_for_lookup_wins(self, spec, db_path):
+        first = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+        second = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+
+        # Both missed a lookup of id=1 and generated different objects
+        key = make_key(spec, id=1)
+        key.put_fields = frozendict.frozendict(id=1, name="rex")
+        first.put_first(key, {"id": 1, "name": "rex"})
+        key.put_fields = frozendict.frozendict(id=1, name="max")
+
+        assert second.put_first(key, {"id": 1, "name": "max"})["name"] == "rex"
+        assert len(second.get_all_by_model(key)) == 1
+
+    def test_delete(self, spec, db_path):
+        first = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+        second = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+
+        first.put(make_key(spec, id=1, name="rex"), {"id": 1, "name": "rex"})
+        first.put(make_key(spec, id=2, name="rex"), {"id": 2, "name": "rex"})
+
+        assert second.delete(make_key(spec, id=1)) == 1
+        assert first.get(make_key(spec, id=1)) is None
+        assert first.is_deleted(make_key(spec, id=1))
+        assert not first.is_deleted(make_key(spec, id=2))
+
+        first.put(make_key(spec, id=1, name="max"), {"id": 1, "name": "max"})
+        assert not second.is_deleted(make_key(spec, id=1))
+        assert second.get(make_key(spec, id=1))["name"] == "max"
+
+    def test_namespaces(self, spec, db_path):
+        first = shared_cache.SharedCompositeCache(spec.schemas, db_path, namespace="a")
+        second = shared_cache.SharedCompositeCache(spec.schemas, db_path, namespace="b")
+
+        first.put(make_key(spec, id=1, name="rex"), {"id": 1, "name": "rex"})
+
+        assert not second.has(make_key(spec, id=1))
+
+    def test_limits(self, spec, db_path):
+        cache_instance = shared_cache.SharedCompositeCache(
+            spec.schemas, db_path, cache.CacheLimits(max_entries_per_model=2)
+        )
+
+        for i in range(3):
+            cache_instance.put(make_key(spec, id=i, name="rex"), {"id": i})
+
+        assert not cache_instance.has(make_key(spec, id=0))
+        assert cache_instance.has(make_key(spec, id=2))
+        assert cache_instance.stats().evictions == 1
+        assert cache_instance.stats().entries_by_model == {"Pet": 2}
+
+    def test_ttl(self, spec, db_path):
+        cache_instance = shared_cache.SharedCompositeCache(
+            spec.schemas, db_path, cache.CacheLimits(ttl=0.05)
+        )
+
+        cache_instance.put(make_key(spec, id=1, name="rex"), {"id": 1})
+        assert cache_instance.has(make_key(spec, id=1))
+
+        time.sleep(0.1)
+        assert not cache_instance.has(make_key(spec, id=1))
+
+    def test_global_limits_not_supported(self, spec, db_path):
+        with pytest.raises(ValueError):
+            shared_cache.SharedCompositeCache(
+                spec.schemas, db_path, cache.CacheLimits(max_entries=10)
+            )
+
+    def test_stats(self, spec, db_path):
+        first = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+        second = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+
+        first.put(make_key(spec, id=1, name="rex"), {"id": 1})
+        second.get(make_key(spec, id=1))
+        second.get(make_key(spec, id=2))
+
+        stats = second.stats()
+        assert (stats.hits, stats.misses, stats.puts) == (1, 1, 0)
+        assert stats.entries_by_model == {"Pet": 1}
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="Needs fork")
+    def test_shared_between_processes(self, spec, db_path):
+        cache_instance = shared_cache.SharedCompositeCache(spec.schemas, db_path)
+        # Connection is opened before fork and must not be reused by the child
+        assert not cache_instance.has(make_key(spec, id=7))
+
+        process = multiprocessing.get_context("fork").Process(
+            target=_put_pet, args=(db_path, 7)
+        )
+        process.start()
+        process.join()
+
+        assert process.exitcode == 0
+        assert cache_instance.get(make_key(spec, id=7)) == {"id": 7, "name": "rex"}
+
+    def test_generated_once(self, spec, db_path):
+        services = [
+            generator.OAPISpec(
+                spec, shared_cache.SharedCompositeCache(spec.schemas, db_path)
+            )
+            for _ in range(2)
+        ]
+
+        first = get_pet(services[0], 5)
+
+        assert get_pet(services[1], 5) == first
+        assert services[1].cache.stats().puts == 0
+
+
+class TestSharedRequestCache:
+    @staticmethod
+    def make_key(**params):
+        req = request.Request(
+            url="http://petstore.swagger.io/v1/pets",
+            method="get",
+            data=frozendict.frozendict(),
+            parameters=frozendict.frozendict(),
+            headers=frozendict.frozendict(),
+            query_params=frozendict.frozendict(params),
+        )
+        return cache.RequestCacheKey(req)
+
+    def test_shared_between_instances(self, db_path):
+        first = shared_cache.SharedRequestCache(db_path)
+        second = shared_cache.SharedRequestCache(db_path)
+
+        first.put(self.make_key(limit=1), [{"id": 1}])
+
+        assert second.get(self.make_key(limit=1)) == [{"id": 1}]
+        assert not second.has(self.make_key(limit=2))
+        assert not second.has(self.make_key())
+        assert second.stats().entries == 1
+
+    def test_limits(self, db_path):
+        cache_instance = shared_cache.SharedRequestCache(
+            db_path, cache.CacheLimits(max_entries=1)
+        )
+
+        cache_instance.put(self.make_key(limit=1), 1)
+        cache_instance.put(self.make_key(limit=2), 2)
+
+        assert not cache_instance.has(self.make_key(limit=1))
+        assert cache_instance.get(self.make_key(limit=2)) == 2
+
+    def test_encoded(self, db_path):
+        cache_instance = shared_cache.SharedRequestCache(db_path)
+        encoded = []
+
+        def encode(value):
+            encoded.append(value)
+            return b"{}"
+
+        cache_instance.put(self.make_key(limit=1), {"id": 1})
+        for _ in range(2):
+            cache_instance.encoded(cache_instance.get(self.make_key(limit=1)), encode)
+            cache_instance.encoded({"id": 2}, encode)
+
+        # Only the stored value is encoded once
+        assert encoded == [{"id": 1}, {"id": 2}, {"id": 2}]
+
+    def test_put_replaces(self, db_path):
+        first = shared_cache.SharedRequestCache(db_path)
+        second = shared_cache.SharedRequestCache(db_path)
+
+        first.put(self.make_key(limit=1), ["tag"])
+        assert second.get(self.make_key(limit=1)) == ["tag"]
+        first.put(self.make_key(limit=1), {"id": 1})
+
+        assert second.get(self.make_key(limit=1)) == {"id": 1}
+        assert second.put_first(self.make_key(limit=1), {"id": 2}) == {"id": 1}
+        assert second.stats().entries == 1
+
+    @pytest.mark.parametrize("shared", [False, True])
+    def test_nested_values(self, db_path, shared):
+        nested = named_spec.parse(str(TEST_DATA_DIR / "nested_spec.yaml"))
+        services = [
+            generator.OAPISpec(
+                nested,
+                cache.CacheFactory.get_cache(
+                    cache.CachingLevel.BASIC,
+                    nested.schemas,
+                    shared_path=db_path if shared else None,
+                ),
+            )
+            for _ in range(2)
+        ]
+
+        pet = get_pet(services[0], 1)
+
+        # Only whole responses are stored by the request
+        assert set(pet) == {"id", "name", "tags", "owner"}
+        assert isinstance(pet["tags"], list)
+        assert set(pet["owner"]) == {"name", "phones"}
+        assert get_pet(services[0], 1) == pet
+        if shared:
+            assert get_pet(services[1], 1) == pet
+
+
+@pytest.mark.parametrize(
+    "level, cache_type",
+    [
+        (cache.CachingLevel.NONE, cache.DummyCache),
+        (cache.CachingLevel.BASIC, shared_cache.SharedRequestCache),
+        (cache.CachingLevel.ADVANCED, shared_cache.SharedCompositeCache),
+    ],
+)
+def test_factory(spec, db_path, level, cache_type):
+    result = cache.CacheFactory.get_cache(level, spec.schemas, shared_path=db_path)
+
+    assert type(result) is cache_type
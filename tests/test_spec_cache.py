@@ -0,0 +1,97 @@
+import pathlib
+import shutil
+
+import pytest
+
+import autostub._spec_cache as spec_cache
+import autostub._generator as generator
+
+TEST_DATA_DIR = pathlib.Path(__file__).resolve().parent / "data"
+
+
+@pytest.fixture
+def spec_path(tmp_path):
+    path = tmp_path / "oapi_spec.yaml"
+    shutil.copy(TEST_DATA_DIR / "oapi_spec.yaml", path)
+    return path
+
+
+def test_memory_cache(mocker, spec_path):
+    cache = spec_cache.SpecCache()
+    parse_mock = mocker.spy(spec_cache._named_spec, "parse")
+
+    spec1, entity1 = cache.load(str(spec_path))
+    spec2, entity2 = cache.load(str(spec_path))
+
+    assert parse_mock.call_count == 1
+    assert spec1 is spec2
+    assert entity1 is entity2
+    assert isinstance(entity1, generator.OAPISpec)
+
+
+def test_disk_cache(mocker, tmp_path, spec_path):
+    cache_dir = tmp_path / "cache"
+    spec, _ = spec_cache.SpecCache().load(str(spec_path), cache_dir)
+    assert list(cache_dir.glob("*.pickle"))
+
+    parse_mock = mocker.spy(spec_cache._named_spec, "parse")
+    loaded_spec, entity = spec_cache.SpecCache().load(str(spec_path), cache_dir)
+
+    assert parse_mock.call_count == 0
+    assert loaded_spec == spec
+    assert isinstance(entity, generator.OAPISpec)
+    # Schemas copied from models are named after unpickling as well
+    pet = loaded_spec.paths[1].operations[0].responses[0].content[0].schema
+    assert loaded_spec.schemas.name_of(pet) == "Pet"
+
+
+def test_changed_spec(mocker, tmp_path, spec_path):
+    cache = spec_cache.SpecCache()
+    spec1, _ = cache.load(str(spec_path), tmp_path / "cache")
+
+    changed_path = tmp_path / "changed_spec.yaml"
+    changed_path.write_text(spec_path.read_text().replace("1.0.0", "1.0.1"))
+
+    parse_mock = mocker.spy(spec_cache._named_spec, "parse")
+    spec2, _ = cache.load(str(changed_path), tmp_path / "cache")
+
+    assert parse_mock.call_count == 1
+    assert spec1.info.version != spec2.info.version
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_external_refs(tmp_path, spec_path, lazy):
+    # The spec itself does not change when the documents it refers to do
+    spec_path.write_text(
+        spec_path.read_text().replace(
+            '$ref: "#/components/schemas/Error"', "$ref: error.yaml"
+        )
+    )
+    error_path = tmp_path / "error.yaml"
+    error_path.write_text("type: object\nproperties:\n  code:\n    type: integer\n")
+    cache = spec_cache.SpecCache()
+    cache.load(str(spec_path), tmp_path / "cache", lazy)
+
+    error_path.write_text("type: object\nproperties:\n  text:\n    type: string\n")
+    spec, _ = cache.load(str(spec_path), tmp_path / "cache", lazy)
+
+    assert not list((tmp_path / "cache").glob("*.pickle"))
+    (response,) = [r for r in spec.paths[0].operations[0].responses if r.is_default]
+    assert [p.name for p in response.content[0].schema.properties] == ["text"]
+
+
+def test_parser_version(mocker, tmp_path, spec_path):
+    spec_cache.SpecCache().load(str(spec_path), tmp_path / "cache")
+
+    mocker.patch.object(spec_cache, "_PARSER_VERSION", "0.0.0")
+    parse_mock = mocker.spy(spec_cache._named_spec, "parse")
+    spec_cache.SpecCache().load(str(spec_path), tmp_path / "cache")
+
+    assert parse_mock.call_count == 1
+
+
+def test_lazy_url():
+    with pytest.raises(ValueError, match="local spec files"):
+        spec_cache.SpecCache().load(
+            "http://petstore.swagger.io/v1/openapi.yaml", lazy=True
+        )
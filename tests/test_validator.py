@@ -0,0 +1,85 @@
+import frozendict
+import pytest
+
+import openapi_parser.specification as oapi_spec
+
+import autostub._schemas as schemas
+from autostub._validator import compile_body, compile_parameters
+
+
+@pytest.fixture
+def parameters():
+    return {
+        "limit": schemas.Integer(
+            oapi_spec.Integer(type="integer", minimum=1, maximum=100), "limit"
+        ),
+        "name": schemas.String(oapi_spec.String(type="string"), "name"),
+    }
+
+
+@pytest.fixture
+def pet():
+    return schemas.Object(
+        oapi_spec.Object(
+            type="object",
+            properties=[
+                oapi_spec.Property(name="id", schema=oapi_spec.Integer(type="integer")),
+                oapi_spec.Property(name="name", schema=oapi_spec.String(type="string")),
+            ],
+            required=["id", "name"],
+        )
+    )
+
+
+class TestParameters:
+    @pytest.mark.parametrize(
+        "params,expected",
+        (
+            ({"limit": "10"}, {"limit": 10}),
+            ({"limit": "10", "name": "rex"}, {"limit": 10, "name": "rex"}),
+            ({"limit": "10", "other": "x"}, {"limit": 10, "other": "x"}),
+            ({"limit": "0"}, None),
+            ({"limit": "ten"}, None),
+            ({"name": "rex"}, None),
+        ),
+    )
+    def test_validate(self, parameters, params, expected):
+        validate = compile_parameters(parameters, {"limit"})
+
+        res = validate(params)
+
+        assert res == expected
+        if expected is not None:
+            assert isinstance(res, frozendict.frozendict)
+
+
+class TestBody:
+    @pytest.mark.parametrize(
+        "body,path_params,expected",
+        (
+            ({"id": 1, "name": "rex"}, {}, {"id": 1, "name": "rex"}),
+            ({"name": "rex"}, {"id": "1"}, {"name": "rex"}),
+            (
+                {"id": "1", "name": "rex", "tag": 1},
+                {},
+                {"id": 1, "name": "rex", "tag": 1},
+            ),
+            ({"name": "rex"}, {}, schemas.INVALID),
+            ({"id": "a", "name": "rex"}, {}, schemas.INVALID),
+            ("rex", {}, schemas.INVALID),
+        ),
+    )
+    def test_validate(self, pet, body, path_params, expected):
+        validate = compile_body(pet, pet.required)
+
+        assert validate(body, path_params) == expected
+
+    def test_partial(self, pet):
+        validate = compile_body(pet, set())
+
+        assert validate({"name": "rex"}, {}) == {"name": "rex"}
+
+    def test_not_json_object(self):
+        validate = compile_body(None, set())
+
+        assert validate(b"raw", {}) == b"raw"